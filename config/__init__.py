@@ -32,6 +32,7 @@ def load_env():
         'credentials': os.getenv('GOOGLE_APPLICATION_CREDENTIALS'),
         'dataset': os.getenv('BQ_DATASET'),
         'bucket': os.getenv('GCS_BUCKET'),
+        'storage_backend': os.getenv('STORAGE_BACKEND'),
         'log_level': os.getenv('LOG_LEVEL', 'INFO'),
         'environment': os.getenv('ENVIRONMENT', 'development')
     }
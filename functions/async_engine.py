@@ -0,0 +1,174 @@
+"""
+Moteur d'extraction asynchrone (étape 1)
+Les sources sont orchestrées par une boucle asyncio et les lectures HTTP en flux
+sont faites par aiohttp ; une file bornée par source les découple des écritures
+GCS (bloquantes, faites dans un thread) : le téléchargement continue pendant
+l'écriture d'un morceau
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from config import CONFIG, ENV
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+_FIN_FLUX = object()
+
+
+def obtenir_parametres_moteur() -> Dict:
+    """Retourne les paramètres du moteur d'extraction (section execution.moteur)"""
+    parametres = CONFIG['execution'].get('moteur', {})
+    return {
+        'type': parametres.get('type', 'sync'),
+        'taille_file': max(1, int(parametres.get('taille_file', 8))),
+        'taille_morceau': int(parametres.get('taille_morceau_kb', 1024)) * 1024
+    }
+
+
+def moteur_async_disponible() -> bool:
+    return aiohttp is not None
+
+
+class ReponseFluxAsync:
+    """
+    Réponse HTTP lue en tâche de fond par aiohttp, consommée depuis un thread
+
+    Expose le sous-ensemble de requests.Response utilisé par l'étape 1
+    (status_code, headers, url, raise_for_status, iter_content, close).
+    """
+
+    def __init__(self, boucle: asyncio.AbstractEventLoop, reponse, file: asyncio.Queue, tache: asyncio.Task):
+        self.boucle = boucle
+        self.reponse = reponse
+        self.file = file
+        self.tache = tache
+        self.status_code = reponse.status
+        self.headers = reponse.headers
+        self.url = str(reponse.url)
+        self.reason = reponse.reason
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            self.close()
+            raise requests.exceptions.HTTPError(f"{self.status_code} {self.reason} pour {self.url}")
+
+    def iter_content(self, chunk_size: Optional[int] = None):
+        """Restitue les morceaux dans l'ordre (chunk_size est fixé par taille_morceau_kb)"""
+        while True:
+            morceau = asyncio.run_coroutine_threadsafe(self.file.get(), self.boucle).result()
+            if morceau is _FIN_FLUX:
+                return
+            if isinstance(morceau, BaseException):
+                raise requests.exceptions.ConnectionError(f"Flux interrompu : {morceau}") from morceau
+            yield morceau
+
+    def close(self):
+        if not self.tache.done():
+            self.boucle.call_soon_threadsafe(self.tache.cancel)
+
+
+class ClientHttpAsync:
+    """
+    Client HTTP utilisable depuis les threads de l'étape 1, adossé à une session aiohttp
+
+    get() a la même forme que requests.get(..., stream=True) ; les erreurs aiohttp
+    sont traduites en exceptions requests pour être traitées comme en mode synchrone.
+    """
+
+    def __init__(self, boucle: asyncio.AbstractEventLoop, session, taille_file: int, taille_morceau: int):
+        self.boucle = boucle
+        self.session = session
+        self.taille_file = taille_file
+        self.taille_morceau = taille_morceau
+
+    def get(self, url: str, stream: bool = True, timeout: Optional[int] = None, headers: Optional[Dict] = None) -> ReponseFluxAsync:
+        futur = asyncio.run_coroutine_threadsafe(self._ouvrir(url, timeout, headers or {}), self.boucle)
+        return futur.result()
+
+    async def _ouvrir(self, url: str, timeout: Optional[int], headers: Dict) -> ReponseFluxAsync:
+        delai = aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)
+        try:
+            reponse = await self.session.get(url, headers=headers, timeout=delai, allow_redirects=True)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise requests.exceptions.ConnectionError(f"Connexion impossible à {url} : {e}") from e
+
+        file = asyncio.Queue(maxsize=self.taille_file)
+        tache = asyncio.create_task(self._produire(reponse, file))
+        return ReponseFluxAsync(self.boucle, reponse, file, tache)
+
+    async def _produire(self, reponse, file: asyncio.Queue):
+        """Lit le corps de la réponse et remplit la file (bloque quand la file est pleine)"""
+        try:
+            tampon = bytearray()
+            while True:
+                donnees = await reponse.content.read(self.taille_morceau)
+                if not donnees:
+                    break
+                tampon += donnees
+                if len(tampon) >= self.taille_morceau:
+                    await file.put(bytes(tampon))
+                    tampon = bytearray()
+            if tampon:
+                await file.put(bytes(tampon))
+            await file.put(_FIN_FLUX)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await file.put(e)
+        finally:
+            reponse.release()
+
+
+async def _executer_sources(
+    sources: List[Dict],
+    traiter: Callable[[Dict, ClientHttpAsync], Dict],
+    max_workers: int,
+    parametres: Dict
+) -> Dict[str, Dict]:
+    boucle = asyncio.get_running_loop()
+    limite = asyncio.Semaphore(max_workers)
+    connecteur = aiohttp.TCPConnector(limit=max(max_workers, 1) * 2)
+
+    async with aiohttp.ClientSession(connector=connecteur, auto_decompress=True) as session:
+        client = ClientHttpAsync(boucle, session, parametres['taille_file'], parametres['taille_morceau'])
+
+        async def une_source(source: Dict) -> Dict:
+            async with limite:
+                # Le traitement (ledger, conversion, upload GCS) reste bloquant : il tourne dans un thread
+                return await asyncio.to_thread(traiter, source, client)
+
+        details = await asyncio.gather(*(une_source(s) for s in sources), return_exceptions=True)
+
+    return dict(zip((s['name'] for s in sources), details))
+
+
+def executer_sources_async(
+    sources: List[Dict],
+    traiter: Callable[[Dict, ClientHttpAsync], Dict],
+    max_workers: int,
+    parametres: Optional[Dict] = None
+) -> Dict[str, Dict]:
+    """
+    Traite les sources sur une boucle asyncio et retourne {nom: résultat de traiter}
+
+    traiter(source, client_http) est appelé dans un thread ; ses lectures HTTP en flux
+    passent par client_http (aiohttp). Une exception est retournée comme résultat.
+    """
+    if aiohttp is None:
+        raise ImportError("aiohttp est requis pour le moteur asynchrone (pip install aiohttp)")
+    parametres = parametres or obtenir_parametres_moteur()
+    logger.info(
+        f"Moteur asynchrone : {max_workers} source(s) simultanée(s), file de {parametres['taille_file']} "
+        f"morceau(x) de {parametres['taille_morceau'] / 1024:.0f} KB par flux"
+    )
+    return asyncio.run(_executer_sources(sources, traiter, max_workers, parametres))
@@ -0,0 +1,187 @@
+"""
+Réglage automatique des téléchargements (étape 1)
+Le débit est mesuré pendant le transfert : le nombre de connexions et la taille
+des segments de plages sont ajustés en conséquence, et une plage trop lente est
+relancée sur une autre connexion (hedged request). Les réglages retenus sont
+mémorisés par hôte : {metadata_folder}/reglage_auto/{hôte}.json
+"""
+
+import json
+import logging
+import statistics
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import CONFIG, ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+# Gain de débit minimal pour garder une connexion ajoutée
+GAIN_MIN = 0.10
+
+# Une plage est lente sous cette fraction du débit médian d'une connexion
+FRACTION_LENTE = 0.2
+
+GRANULARITE_SEGMENT = 1024 * 1024
+
+
+def obtenir_parametres_reglage() -> Dict:
+    """Retourne les paramètres du réglage automatique (section execution.reglage_auto)"""
+    parametres = CONFIG['execution'].get('reglage_auto', {})
+    return {
+        'actif': parametres.get('actif', False),
+        'connexions_max': max(1, int(parametres.get('connexions_max', 16))),
+        'taille_segment_min': int(parametres.get('taille_segment_min_mb', 4)) * 1024 * 1024,
+        'taille_segment_max': int(parametres.get('taille_segment_max_mb', 64)) * 1024 * 1024,
+        'intervalle_mesure': float(parametres.get('intervalle_mesure_s', 2)),
+        'duree_segment_cible': float(parametres.get('duree_segment_cible_s', 4)),
+        'debit_plancher': int(parametres.get('debit_plancher_kb_s', 256)) * 1024,
+        'delai_relance': float(parametres.get('delai_relance_s', 3))
+    }
+
+
+def chemin_reglage_hote(hote: str) -> str:
+    """Retourne le chemin GCS des réglages mémorisés pour un hôte"""
+    return f"{CONFIG['storage']['metadata_folder']}/reglage_auto/{hote.replace(':', '_')}.json"
+
+
+def lire_reglage_hote(bucket, hote: str) -> Optional[Dict]:
+    """Lit les réglages retenus lors du dernier téléchargement depuis cet hôte (None si absents)"""
+    blob = bucket.blob(chemin_reglage_hote(hote))
+    try:
+        if not blob.exists():
+            return None
+        return json.loads(blob.download_as_text())
+    except Exception as e:
+        logger.warning(f"Réglages illisibles pour {hote} : {e}")
+        return None
+
+
+def ecrire_reglage_hote(bucket, hote: str, reglage: Dict):
+    """Mémorise les réglages retenus pour un hôte (les clés absentes sont conservées)"""
+    precedent = lire_reglage_hote(bucket, hote) or {}
+    reglage = dict(precedent, **reglage, mis_a_jour=datetime.now().isoformat(timespec='seconds'))
+    try:
+        bucket.blob(chemin_reglage_hote(hote)).upload_from_string(
+            json.dumps(reglage, indent=2), content_type='application/json'
+        )
+        logger.info(f"Réglages mémorisés pour {hote}")
+    except Exception as e:
+        logger.warning(f"Réglages non mémorisés pour {hote} : {e}")
+
+
+def taille_morceau_flux(memoire: Optional[Dict], taille_max: int, duree_cible: float = 0.5) -> int:
+    """
+    Taille des morceaux lus en flux unique : environ duree_cible secondes au débit
+    mémorisé pour l'hôte, entre 256 KB et taille_max
+    """
+    if not memoire or not memoire.get('debit_flux'):
+        return taille_max
+    taille = int(memoire['debit_flux'] * duree_cible)
+    return max(256 * 1024, min(taille_max, taille - taille % (64 * 1024)))
+
+
+class ReglageAuto:
+    """
+    Ajuste les connexions et la taille des segments d'un téléchargement par plages
+
+    Les connexions progressent une à une tant que chaque ajout apporte au moins
+    GAIN_MIN de débit ; un ajout qui n'apporte rien est retiré et la recherche
+    s'arrête. La taille des segments vise duree_segment_cible secondes par segment
+    au débit mesuré d'une connexion.
+    """
+
+    def __init__(self, connexions: int, taille_segment: int, parametres: Dict):
+        self.parametres = parametres
+        self.connexions_max = parametres['connexions_max']
+        self.taille_segment_max = max(parametres['taille_segment_min'], parametres['taille_segment_max'])
+        self.connexions = max(1, min(connexions, self.connexions_max))
+        self.taille_segment = self._borner_segment(taille_segment)
+
+        self.debut = time.perf_counter()
+        self.debut_fenetre = self.debut
+        self.octets_fenetre = 0
+        self.octets_total = 0
+        self.debit_precedent = None
+        self.exploration = True
+        self.debits_connexion = []
+        self.relances = 0
+        self.relances_gagnantes = 0
+
+    def _borner_segment(self, taille: int) -> int:
+        taille = max(self.parametres['taille_segment_min'], min(self.taille_segment_max, int(taille)))
+        return max(GRANULARITE_SEGMENT, taille - taille % GRANULARITE_SEGMENT)
+
+    def enregistrer(self, octets: int, duree: float):
+        """Prend en compte un segment terminé (octets reçus en duree secondes sur une connexion)"""
+        self.octets_fenetre += octets
+        self.octets_total += octets
+        if duree > 0:
+            self.debits_connexion = (self.debits_connexion + [octets / duree])[-32:]
+
+    def debit_connexion(self) -> Optional[float]:
+        """Débit médian d'une connexion sur les derniers segments (octets/s)"""
+        return statistics.median(self.debits_connexion) if self.debits_connexion else None
+
+    def ajuster(self) -> bool:
+        """
+        Réévalue les réglages à la fin de chaque fenêtre de mesure
+
+        Returns:
+            True si les connexions ou la taille des segments ont changé
+        """
+        maintenant = time.perf_counter()
+        duree = maintenant - self.debut_fenetre
+        if duree < self.parametres['intervalle_mesure'] or not self.octets_fenetre:
+            return False
+
+        debit = self.octets_fenetre / duree
+        self.debut_fenetre, self.octets_fenetre = maintenant, 0
+        avant = (self.connexions, self.taille_segment)
+
+        if self.exploration:
+            if self.debit_precedent is None or debit >= self.debit_precedent * (1 + GAIN_MIN):
+                if self.connexions < self.connexions_max:
+                    self.connexions += 1
+                else:
+                    self.exploration = False
+            else:
+                # La dernière connexion ajoutée n'apporte rien : retour en arrière
+                self.connexions = max(1, self.connexions - 1)
+                self.exploration = False
+        self.debit_precedent = debit
+
+        debit_connexion = self.debit_connexion()
+        if debit_connexion:
+            self.taille_segment = self._borner_segment(debit_connexion * self.parametres['duree_segment_cible'])
+
+        if (self.connexions, self.taille_segment) != avant:
+            logger.info(
+                f"Réglage automatique : {debit / 1024**2:.1f} MB/s → {self.connexions} connexion(s), "
+                f"segments de {self.taille_segment / 1024**2:.0f} MB"
+            )
+            return True
+        return False
+
+    def est_lente(self, octets_lus: int, duree: float) -> bool:
+        """Une requête en cours depuis duree secondes est-elle assez lente pour être relancée ?"""
+        if duree < self.parametres['delai_relance']:
+            return False
+        plancher = self.parametres['debit_plancher']
+        debit_connexion = self.debit_connexion()
+        if debit_connexion:
+            plancher = max(plancher, FRACTION_LENTE * debit_connexion)
+        return octets_lus / duree < plancher
+
+    def resultat(self) -> Dict:
+        """Réglages retenus et débit moyen, à mémoriser pour l'hôte"""
+        duree = time.perf_counter() - self.debut
+        return {
+            'connexions': self.connexions,
+            'taille_segment': self.taille_segment,
+            'debit_plages': self.octets_total / duree if duree else None,
+            'relances': self.relances,
+            'relances_gagnantes': self.relances_gagnantes
+        }
@@ -0,0 +1,200 @@
+"""
+Reprise de l'historique (étape 2)
+Charge tous les batchs d'une période avec un seul job par source : les fichiers
+de la période sont exposés par une table externe temporaire, puis une transaction
+les insère dans la table raw (colonnes d'historique tirées du nom de chaque
+fichier) et enregistre chaque fichier dans le ledger des chargements.
+"""
+
+import logging
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from google.cloud import bigquery
+
+from config import CONFIG, ENV
+from functions.batch_catalog import obtenir_catalogue
+from functions.bq_metadata import journaliser_statistiques_metadonnees, obtenir_cache_metadonnees
+from functions.external_tables import (
+    expression_horodatage,
+    expressions_table_externe,
+    mode_chargement,
+    requete_table_externe
+)
+from functions.gcp_clients import get_gcp_client, journaliser_statistiques_clients
+from functions.load_ledger import (
+    creer_ledger_si_necessaire,
+    deja_charge,
+    lire_chargements_batchs,
+    parametres_reprise,
+    requete_reprise,
+    table_ledger
+)
+from functions.schema_registry import champs_bigquery
+from functions.step2_load import (
+    PREFIXE_TABLE_CHARGEMENT,
+    creer_dataset_si_necessaire,
+    creer_table_si_necessaire,
+    obtenir_nom_table
+)
+from functions.storage_backend import obtenir_stockage
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+
+def resoudre_fichiers(debut: str, fin: str) -> Dict[str, List[Dict]]:
+    """
+    Fichiers Parquet des batchs extraits entre debut et fin (AAAA-MM-JJ, inclus), par source
+
+    Seules les sources actives en chargement natif sont retenues. Les empreintes
+    CRC32C sont comparées à celles du stockage avec un listing par mois.
+    """
+    actives = {s['name'] for s in CONFIG['data_sources']['sources'] if s.get('active', True)}
+    candidats = [
+        fichier
+        for timestamp, fichiers in obtenir_catalogue().lister().items()
+        if debut <= timestamp[:10] <= fin
+        for fichier in fichiers
+        if fichier['source'] in actives
+        and mode_chargement(fichier['source']) != 'externe'
+        and fichier['blob_name'].endswith('.parquet')
+    ]
+
+    bucket = obtenir_stockage().conteneur()
+    raw_folder = CONFIG['storage']['raw_folder']
+    empreintes = {}
+    for mois in sorted({f['timestamp'][:7] for f in candidats}):
+        empreintes.update({blob.name: blob.crc32c for blob in bucket.list_blobs(prefix=f"{raw_folder}/{mois}/")})
+
+    par_source: Dict[str, List[Dict]] = {}
+    for fichier in sorted(candidats, key=lambda f: f['timestamp']):
+        if fichier['blob_name'] not in empreintes:
+            logger.error(f"Fichier introuvable dans le stockage : {fichier['blob_name']}")
+            continue
+        if fichier.get('crc32c') and fichier['crc32c'] != empreintes[fichier['blob_name']]:
+            logger.error(f"Empreinte CRC32C différente pour {fichier['blob_name']}, fichier ignoré")
+            continue
+        par_source.setdefault(fichier['source'], []).append(dict(fichier, crc32c=empreintes[fichier['blob_name']]))
+    return par_source
+
+
+def charger_groupe(source_name: str, fichiers: List[Dict]) -> Optional[Dict[str, int]]:
+    """
+    Charge des fichiers d'une source de même schéma en un job
+
+    Returns:
+        {timestamp_batch: lignes chargées}, None en cas d'échec
+    """
+    client = get_gcp_client('bigquery')
+    stockage = obtenir_stockage()
+    table_name = obtenir_nom_table(source_name, 'raw')
+    table_ref = f"{ENV['project_id']}.{ENV['dataset']}.{table_name}"
+    table_externe = f"{ENV['project_id']}.{ENV['dataset']}.{PREFIXE_TABLE_CHARGEMENT}{table_name}_{uuid.uuid4().hex[:8]}"
+    try:
+        client.query(requete_table_externe(table_externe, [stockage.uri(f['blob_name']) for f in fichiers])).result()
+        schema_externe = client.get_table(table_externe).schema
+        version, expressions = expressions_table_externe(source_name, schema_externe)
+        schema = champs_bigquery(version) if version else [f for f in schema_externe if f.name in expressions]
+        colonnes = creer_table_si_necessaire(table_name, schema, source_name)
+
+        transaction = client.query(
+            requete_reprise(table_ref, table_externe, colonnes, expressions, expression_horodatage()),
+            job_config=bigquery.QueryJobConfig(query_parameters=parametres_reprise(
+                source_name, table_name, fichiers, version['version'] if version else None
+            ))
+        )
+        transaction.result()
+        logger.info(
+            f"{source_name} : {len(fichiers)} batch(s) en un job "
+            f"({(transaction.total_bytes_processed or 0) / 1024**2:.1f} MB lus, job {transaction.job_id})"
+        )
+    except Exception as e:
+        logger.error(f"Erreur de reprise de {source_name} : {e}")
+        obtenir_cache_metadonnees().invalider(table_ref)
+        return None
+    finally:
+        if client is not None:
+            try:
+                client.delete_table(table_externe, not_found_ok=True)
+            except Exception as e:
+                logger.warning(f"Table externe {table_externe} non supprimée : {e}")
+
+    job = client.query(
+        f"""
+        SELECT timestamp_batch, lignes FROM `{table_ledger()}`
+        WHERE source = @source AND timestamp_batch IN UNNEST(@timestamps)
+        """,
+        job_config=bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter('source', 'STRING', source_name),
+            bigquery.ArrayQueryParameter('timestamps', 'STRING', [f['timestamp'] for f in fichiers])
+        ])
+    )
+    return {ligne['timestamp_batch']: ligne['lignes'] for ligne in job.result()}
+
+
+def reprendre_historique(debut: str, fin: str, forcer: bool = False) -> bool:
+    """
+    Charge les batchs extraits entre debut et fin (AAAA-MM-JJ, inclus)
+
+    Un job par source, ou par empreinte de schéma quand le schéma des fichiers
+    a changé sur la période. Les fichiers déjà au ledger sont ignorés, sauf avec
+    forcer=True : leurs lignes sont alors remplacées.
+    """
+    logger.info("=" * 80)
+    logger.info(f"ÉTAPE 2 : REPRISE DE L'HISTORIQUE ({debut} → {fin})")
+    logger.info("=" * 80)
+
+    if obtenir_stockage().nom != 'gcs':
+        logger.error("La reprise lit les fichiers via une table externe : backend gcs requis")
+        return False
+
+    creer_dataset_si_necessaire()
+    creer_ledger_si_necessaire()
+
+    par_source = resoudre_fichiers(debut, fin)
+    if not par_source:
+        logger.error(f"Aucun fichier à reprendre entre {debut} et {fin}")
+        return False
+
+    if not forcer:
+        chargements = lire_chargements_batchs(sorted({f['timestamp'] for fs in par_source.values() for f in fs}))
+        for source_name, fichiers in par_source.items():
+            restants = [f for f in fichiers if not deja_charge(chargements.get((source_name, f['timestamp'])), f)]
+            if len(restants) < len(fichiers):
+                logger.info(f"{source_name} : {len(fichiers) - len(restants)} batch(s) déjà chargé(s), ignoré(s)")
+            par_source[source_name] = restants
+
+    resultats = []
+    for source_name, fichiers in par_source.items():
+        if not fichiers:
+            continue
+        groupes: Dict[Optional[str], List[Dict]] = {}
+        for fichier in fichiers:
+            groupes.setdefault(fichier.get('empreinte_schema'), []).append(fichier)
+        if len(groupes) > 1:
+            logger.info(f"{source_name} : {len(groupes)} schémas sur la période, un job par schéma")
+
+        for groupe in groupes.values():
+            debut_job = time.perf_counter()
+            lignes = charger_groupe(source_name, groupe)
+            duree = time.perf_counter() - debut_job
+            resultats.append(lignes is not None)
+            if lignes is None:
+                continue
+            # Un seul job pour tout le groupe : la durée n'existe que par job, pas par batch
+            logger.info(
+                f"{source_name} : {sum(lignes.values())} lignes, {len(groupe)} batch(s) "
+                f"en un job de {duree:.1f}s"
+            )
+            for fichier in groupe:
+                logger.info(f"  {fichier['timestamp']} : {lignes.get(fichier['timestamp'], 0)} lignes")
+
+    # Résumé
+    logger.info("\n" + "=" * 80)
+    logger.info(f"Total : {sum(resultats)}/{len(resultats)} job(s) de reprise réussi(s)")
+    journaliser_statistiques_clients()
+    journaliser_statistiques_metadonnees()
+    logger.info("=" * 80)
+    return all(resultats)
@@ -0,0 +1,198 @@
+"""
+Catalogue des batchs d'extraction (étape 2, orchestrateur, interface)
+Un catalogue par processus garde la liste des batchs et de leurs fichiers :
+- avec l'index des manifests, un seul petit objet est lu, puis rapproché du
+  listing des mois (mois absents de l'index et dernier mois) ;
+- sinon raw_data/ est listé par mois ({raw_folder}/{année}-{mois}/) et seuls les
+  mois nouveaux et le dernier mois connu sont relistés lors d'un rafraîchissement.
+Le catalogue est rafraîchi après storage.catalogue.ttl_s secondes, ou dès
+l'invalidation faite par l'étape 1 à la fin d'un batch.
+"""
+
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from config import CONFIG, ENV
+from functions.manifest import FORMAT_TIMESTAMP, lire_index
+from functions.storage_backend import obtenir_stockage
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+_catalogue = None
+_verrou_catalogue = threading.Lock()
+
+MOTIF_FICHIER = re.compile(r'.*?/(\d{4})-(\d{2})/(.+?)__(\d{4}-\d{2}-\d{2})_(\d{2}-\d{2}-\d{2})\.(parquet|csv)$')
+
+
+def obtenir_parametres_catalogue() -> Dict:
+    """Retourne les paramètres du catalogue (section storage.catalogue)"""
+    parametres = CONFIG['storage'].get('catalogue', {})
+    return {'ttl': float(parametres.get('ttl_s', 300))}
+
+
+def extraire_infos_fichier(blob_name: str) -> Optional[Dict]:
+    """Extrait les informations d'un nom de fichier GCS"""
+    match = MOTIF_FICHIER.match(blob_name)
+    if not match:
+        return None
+    year, month, source, date, time_, ext = match.groups()
+    dt = datetime.strptime(f"{date} {time_.replace('-', ':')}", "%Y-%m-%d %H:%M:%S")
+    return {
+        'source': source,
+        'year': year,
+        'month': month,
+        'date': date,
+        'time': time_,
+        'timestamp': f"{date}_{time_}",
+        'datetime': dt,
+        'blob_name': blob_name
+    }
+
+
+def infos_depuis_manifest(fichier: Dict, timestamp: str) -> Dict:
+    """Décrit un fichier du manifest avec les mêmes clés que extraire_infos_fichier"""
+    date, time_ = timestamp.split('_')
+    return dict(
+        fichier,
+        year=date[:4],
+        month=date[5:7],
+        date=date,
+        time=time_,
+        timestamp=timestamp,
+        datetime=datetime.strptime(timestamp, FORMAT_TIMESTAMP),
+        blob_name=fichier['chemin_gcs']
+    )
+
+
+class CatalogueBatchs:
+    """Batchs connus : {timestamp: [infos des fichiers]}, rafraîchis au plus toutes les ttl secondes"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.verrou = threading.Lock()
+        self.batchs: Dict[str, List[Dict]] = {}
+        self.mois_listes: Set[str] = set()
+        self.expire = 0.0
+        self.source_catalogue = None
+
+    def invalider(self):
+        """Force le rafraîchissement à la prochaine lecture (après un nouveau batch)"""
+        with self.verrou:
+            self.expire = 0.0
+
+    @staticmethod
+    def _mois_du_stockage(bucket) -> List[str]:
+        """Mois présents sous raw_data/ (un seul appel, sans lister les fichiers)"""
+        iterateur = bucket.list_blobs(prefix=f"{CONFIG['storage']['raw_folder']}/", delimiter='/')
+        for _ in iterateur:
+            pass
+        return sorted(p.rstrip('/').rsplit('/', 1)[-1] for p in iterateur.prefixes)
+
+    @staticmethod
+    def _lister_mois(bucket, mois: str) -> Dict[str, List[Dict]]:
+        batchs = {}
+        for blob in bucket.list_blobs(prefix=f"{CONFIG['storage']['raw_folder']}/{mois}/"):
+            infos = extraire_infos_fichier(blob.name)
+            if not infos:
+                logger.warning(f"Fichier ignoré : {blob.name}")
+                continue
+            batchs.setdefault(infos['timestamp'], []).append(infos)
+        return batchs
+
+    def _rafraichir(self):
+        bucket = obtenir_stockage().conteneur()
+        try:
+            index = lire_index(bucket)
+        except Exception as e:
+            logger.warning(f"Index des batchs illisible, catalogue construit par listing : {e}")
+            index = None
+        if index is not None:
+            self.batchs = {
+                batch['timestamp']: [
+                    infos_depuis_manifest(dict(infos, source=nom), batch['timestamp'])
+                    for nom, infos in batch['fichiers'].items()
+                ]
+                for batch in index if batch['fichiers']
+            }
+            self.source_catalogue = 'index'
+            self._rapprocher_index(bucket)
+            return
+
+        if self.source_catalogue != 'listing':
+            self.batchs, self.mois_listes = {}, set()
+        self.source_catalogue = 'listing'
+
+        mois = self._mois_du_stockage(bucket)
+        # Les mois déjà listés sont complets, sauf le dernier qui peut encore recevoir des batchs
+        dernier_liste = max(self.mois_listes) if self.mois_listes else None
+        a_lister = [m for m in mois if m not in self.mois_listes or m == dernier_liste]
+
+        for mois_courant in a_lister:
+            self.batchs = {ts: f for ts, f in self.batchs.items() if not ts.startswith(mois_courant)}
+            self.batchs.update(self._lister_mois(bucket, mois_courant))
+            self.mois_listes.add(mois_courant)
+        logger.info(f"Catalogue des batchs : {len(a_lister)} mois listé(s) sur {len(mois)}")
+
+    def _rapprocher_index(self, bucket):
+        """
+        Complète l'index avec le listing : les mois absents de l'index et le dernier
+        mois sont listés, et leurs batchs non indexés ajoutés au catalogue
+        """
+        mois_index = {ts[:7] for ts in self.batchs}
+        mois = self._mois_du_stockage(bucket)
+        a_lister = [m for m in mois if m not in mois_index or m == mois[-1]]
+        absents = []
+        for mois_courant in a_lister:
+            for ts, fichiers in self._lister_mois(bucket, mois_courant).items():
+                if ts not in self.batchs:
+                    self.batchs[ts] = fichiers
+                    absents.append(ts)
+        if absents:
+            logger.warning(
+                f"{len(absents)} batch(s) absent(s) de l'index ajouté(s) depuis le listing "
+                f"({', '.join(sorted(absents)[:5])}{'...' if len(absents) > 5 else ''}) : "
+                f"python -m functions.manifest reconstruire"
+            )
+
+    def _a_jour(self):
+        if time.monotonic() >= self.expire:
+            self._rafraichir()
+            self.expire = time.monotonic() + self.ttl
+
+    def lister(self, year_month: Optional[str] = None, timestamp: Optional[str] = None) -> Dict[str, List[Dict]]:
+        """Fichiers groupés par timestamp, filtrés par mois (AAAA-MM) ou par timestamp"""
+        with self.verrou:
+            self._a_jour()
+            return {
+                ts: list(fichiers)
+                for ts, fichiers in self.batchs.items()
+                if (not year_month or ts.startswith(year_month)) and (not timestamp or ts == timestamp)
+            }
+
+    def timestamps(self, prefixe: Optional[str] = None) -> List[str]:
+        """Timestamps des batchs, du plus récent au plus ancien (prefixe : date ou mois)"""
+        return sorted(self.lister(year_month=prefixe), reverse=True)
+
+    def dernier(self, prefixe: Optional[str] = None) -> Optional[str]:
+        timestamps = self.timestamps(prefixe)
+        return timestamps[0] if timestamps else None
+
+
+def obtenir_catalogue() -> CatalogueBatchs:
+    """Catalogue des batchs du processus (créé à la première utilisation)"""
+    global _catalogue
+    with _verrou_catalogue:
+        if _catalogue is None:
+            _catalogue = CatalogueBatchs(obtenir_parametres_catalogue()['ttl'])
+        return _catalogue
+
+
+def invalider_catalogue():
+    """À appeler après l'écriture d'un batch : le prochain accès relit l'index ou le dernier mois"""
+    if _catalogue is not None:
+        _catalogue.invalider()
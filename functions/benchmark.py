@@ -0,0 +1,241 @@
+"""
+Mesures de performance de la chaîne d'ingestion
+Compare des réglages sur des données synthétiques proches des sources réelles
+"""
+
+import io
+import logging
+import os
+import random
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow as pa
+from google.auth.credentials import AnonymousCredentials
+from google.cloud import storage
+
+from config import ENV
+from functions.composite_upload import UploadComposite
+from functions.parquet_conversion import EcrivainParquet, decrire_encodage, obtenir_parametres_conversion
+from functions.resumable_upload import SessionUploadReprenable
+from functions.storage_backend import obtenir_parametres_stockage, obtenir_stockage
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+# Colonnes de codes très répétitives du stock des unités légales
+COLONNES_CODES = [
+    'categorieJuridiqueUniteLegale',
+    'trancheEffectifsUniteLegale',
+    'activitePrincipaleUniteLegale',
+    'etatAdministratifUniteLegale',
+    'categorieEntreprise'
+]
+
+# Réglages comparés par défaut : (libellé, surcharge de execution.conversion_parquet)
+REGLAGES_PARQUET: List[Tuple[str, Dict]] = [
+    ("zstd (config)", {}),
+    ("snappy", {'compression': 'snappy', 'niveau_compression': None}),
+    ("zstd niveau 9", {'compression': 'zstd', 'niveau_compression': 9}),
+    ("zstd sans dictionnaire", {'compression': 'zstd', 'dictionnaire': False}),
+    ("zstd dictionnaire codes", {'compression': 'zstd', 'dictionnaire': COLONNES_CODES}),
+    ("zstd row group 100k", {'compression': 'zstd', 'lignes_row_group': 100000}),
+    ("zstd page 64 KB", {'compression': 'zstd', 'taille_page_kb': 64}),
+    ("non compressé", {'compression': 'none', 'niveau_compression': None})
+]
+
+
+def generer_extrait_synthetique(lignes: int, graine: int = 42) -> pa.Table:
+    """Génère un extrait ressemblant au stock des unités légales (codes répétitifs, siren unique)"""
+    aleatoire = random.Random(graine)
+
+    categories = ['5710', '5499', '1000', '6540', '5599', '9220', '5498', '6220', '5720', '7490']
+    tranches = ['NN', '00', '01', '02', '03', '11', '12', '21', '22', '31', '32', '41', '42', '51', '52', '53']
+    activites = [f"{a:02d}.{b:02d}{c}" for a in range(1, 100, 3) for b in range(0, 100, 9) for c in 'AZ']
+    syllabes = ['ma', 'ri', 'bo', 'la', 'ne', 'tor', 'ga', 'vil', 'son', 'dur', 'pe', 'chi']
+
+    return pa.table({
+        'siren': [f"{i:09d}" for i in aleatoire.sample(range(300000000, 999999999), lignes)],
+        'nomUniteLegale': [
+            ''.join(aleatoire.choice(syllabes) for _ in range(aleatoire.randint(2, 4))).upper()
+            for _ in range(lignes)
+        ],
+        'categorieJuridiqueUniteLegale': aleatoire.choices(categories, weights=range(len(categories), 0, -1), k=lignes),
+        'trancheEffectifsUniteLegale': aleatoire.choices(tranches, weights=[40, 30] + [2] * 14, k=lignes),
+        'activitePrincipaleUniteLegale': aleatoire.choices(activites, k=lignes),
+        'etatAdministratifUniteLegale': aleatoire.choices(['A', 'C'], weights=[8, 2], k=lignes),
+        'categorieEntreprise': aleatoire.choices(['PME', 'ETI', 'GE', None], weights=[60, 2, 1, 37], k=lignes),
+        'dateCreationUniteLegale': [
+            f"{aleatoire.randint(1950, 2024)}-{aleatoire.randint(1, 12):02d}-{aleatoire.randint(1, 28):02d}"
+            for _ in range(lignes)
+        ],
+        'chiffre_d_affaires': [
+            round(aleatoire.lognormvariate(12, 2), 2) if aleatoire.random() < 0.3 else None
+            for _ in range(lignes)
+        ]
+    })
+
+
+def mesurer_encodage(table: pa.Table, parametres: Dict, taille_lot: int = 65536) -> Dict:
+    """
+    Encode la table en Parquet (en mémoire) avec les paramètres donnés
+
+    La table est fournie par lots de taille_lot lignes, comme les blocs
+    lus par le convertisseur CSV.
+    """
+    sortie = io.BytesIO()
+    debut = time.perf_counter()
+    with EcrivainParquet(sortie, table.schema, parametres) as ecrivain:
+        for lot in table.to_batches(max_chunksize=taille_lot):
+            ecrivain.ecrire(lot)
+    duree = time.perf_counter() - debut
+
+    octets = sortie.tell()
+    return {
+        'octets': octets,
+        'duree': duree,
+        'debit_mb_s': table.nbytes / 1024**2 / duree if duree else 0.0,
+        'ratio': table.nbytes / octets if octets else 0.0
+    }
+
+
+def benchmark_encodage_parquet(lignes: int = 500000, reglages: Optional[List[Tuple[str, Dict]]] = None) -> List[Dict]:
+    """
+    Compare les réglages d'encodage Parquet sur un extrait synthétique
+
+    Chaque réglage surcharge execution.conversion_parquet, comme une clé
+    "conversion" de source.
+
+    Returns:
+        Liste de résultats (libellé, octets écrits, durée, débit d'encodage, ratio)
+    """
+    reglages = reglages or REGLAGES_PARQUET
+    table = generer_extrait_synthetique(lignes)
+    logger.info(f"Extrait synthétique : {lignes} lignes, {table.nbytes / 1024**2:.1f} MB en mémoire")
+
+    resultats = []
+    for libelle, surcharge in reglages:
+        parametres = obtenir_parametres_conversion({'conversion': surcharge})
+        mesure = mesurer_encodage(table, parametres)
+        mesure.update(libelle=libelle, encodage=decrire_encodage(parametres))
+        resultats.append(mesure)
+        logger.info(
+            f"{libelle} : {mesure['octets'] / 1024**2:.2f} MB écrits, "
+            f"{mesure['debit_mb_s']:.0f} MB/s, ratio {mesure['ratio']:.1f}x"
+        )
+
+    return resultats
+
+
+def obtenir_bucket_benchmark():
+    """
+    Bucket utilisé pour les mesures d'upload
+
+    Avec le backend local (STORAGE_BACKEND=local), le dossier du backend est utilisé.
+    Si STORAGE_EMULATOR_HOST est défini (ex. fake-gcs-server en local), le client
+    vise l'émulateur sans authentification et le bucket est créé au besoin ;
+    sinon le bucket réel du pipeline est utilisé.
+    """
+    if obtenir_parametres_stockage()['backend'] == 'local':
+        return obtenir_stockage().verifier_conteneur()
+
+    if os.environ.get('STORAGE_EMULATOR_HOST'):
+        client = storage.Client(project=ENV['project_id'], credentials=AnonymousCredentials())
+        bucket = client.bucket(ENV['bucket'])
+        if not bucket.exists():
+            client.create_bucket(ENV['bucket'])
+        logger.info(f"Émulateur GCS : {os.environ['STORAGE_EMULATOR_HOST']}")
+        return bucket
+
+    logger.warning("STORAGE_EMULATOR_HOST non défini : mesure sur le bucket GCS réel")
+    return obtenir_stockage().conteneur()
+
+
+def mesurer_upload(writer, taille: int, bloc: bytes) -> float:
+    """Écrit taille octets dans writer par blocs (comme le streaming de l'étape 1) et retourne la durée"""
+    debut = time.perf_counter()
+    ecrits = 0
+    while ecrits < taille:
+        morceau = bloc[:taille - ecrits]
+        writer.write(morceau)
+        ecrits += len(morceau)
+    writer.close()
+    writer.verifier_integrite()
+    return time.perf_counter() - debut
+
+
+def benchmark_upload_composite(
+    taille_mb: int = 256,
+    connexions: Tuple[int, ...] = (2, 4, 8),
+    taille_composant_mb: int = 32,
+    bucket=None
+) -> List[Dict]:
+    """
+    Compare l'upload en flux unique (session reprenable) et l'upload composite parallèle
+
+    Les objets de test sont écrits sous benchmark/ puis supprimés.
+
+    Returns:
+        Liste de résultats (libellé, octets, durée, débit)
+    """
+    bucket = bucket or obtenir_bucket_benchmark()
+    taille = taille_mb * 1024 * 1024
+    bloc = os.urandom(4 * 1024 * 1024)
+    timeout = 300
+
+    if obtenir_parametres_stockage()['backend'] == 'local':
+        creer_flux = lambda blob: obtenir_stockage().creer_ecriture(blob, 32 * 1024 * 1024, timeout)
+    else:
+        creer_flux = lambda blob: SessionUploadReprenable(blob, chunk_size=32 * 1024 * 1024, timeout=timeout)
+    modes = [("flux unique", creer_flux)]
+    modes += [
+        (f"composite {n} connexions", lambda blob, n=n: UploadComposite(blob, taille_composant_mb * 1024 * 1024, n, timeout))
+        for n in connexions
+    ]
+
+    resultats = []
+    for libelle, creer_writer in modes:
+        blob = bucket.blob(f"benchmark/upload_{libelle.replace(' ', '_')}.bin")
+        duree = mesurer_upload(creer_writer(blob), taille, bloc)
+        blob.delete()
+        resultats.append({'libelle': libelle, 'octets': taille, 'duree': duree, 'debit_mb_s': taille_mb / duree})
+        logger.info(f"{libelle} : {taille_mb} MB en {duree:.2f}s ({taille_mb / duree:.0f} MB/s)")
+
+    return resultats
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == 'parquet':
+        lignes = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+        resultats = benchmark_encodage_parquet(lignes)
+
+        print("\n" + "=" * 80)
+        print(f"{'Réglage':<28}{'Écrit (MB)':>12}{'Débit (MB/s)':>14}{'Ratio':>8}{'Durée (s)':>11}")
+        print("-" * 80)
+        for r in resultats:
+            print(
+                f"{r['libelle']:<28}{r['octets'] / 1024**2:>12.2f}{r['debit_mb_s']:>14.0f}"
+                f"{r['ratio']:>7.1f}x{r['duree']:>11.2f}"
+            )
+        print("=" * 80)
+
+    elif len(sys.argv) > 1 and sys.argv[1] == 'upload':
+        taille_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 256
+        resultats = benchmark_upload_composite(taille_mb)
+
+        print("\n" + "=" * 80)
+        print(f"{'Mode':<28}{'Taille (MB)':>12}{'Durée (s)':>11}{'Débit (MB/s)':>14}")
+        print("-" * 80)
+        for r in resultats:
+            print(f"{r['libelle']:<28}{r['octets'] / 1024**2:>12.0f}{r['duree']:>11.2f}{r['debit_mb_s']:>14.0f}")
+        print("=" * 80)
+
+    else:
+        print("\nUsage:")
+        print("  python -m functions.benchmark parquet            # Réglages d'encodage Parquet (500 000 lignes)")
+        print("  python -m functions.benchmark parquet LIGNES     # Idem sur LIGNES lignes")
+        print("  python -m functions.benchmark upload             # Flux unique vs upload composite (256 MB)")
+        print("  python -m functions.benchmark upload TAILLE_MB   # Idem sur TAILLE_MB MB")
+        print("\n  Avec STORAGE_EMULATOR_HOST=http://localhost:4443, les uploads visent un émulateur GCS local")
+        print("  Avec STORAGE_BACKEND=local, ils visent le dossier du backend local (storage.dossier_local)")
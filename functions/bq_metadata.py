@@ -0,0 +1,116 @@
+"""
+Cache des métadonnées BigQuery du processus (étape 2)
+Le dataset, les tables (schéma, partitionnement) et le schéma des fichiers chargés
+sont lus une fois puis servis depuis le cache pendant toute la vie du processus.
+Une entrée n'est relue que lorsqu'un chargement signale un changement : empreinte
+de schéma du fichier différente, colonnes ajoutées, échec de chargement ou migration.
+"""
+
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
+
+from config import ENV
+from functions.gcp_clients import get_gcp_client
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+_cache = None
+_verrou_cache = threading.Lock()
+
+
+class CacheMetadonnees:
+    """Datasets existants, tables {référence: Table} et schémas de fichiers par source"""
+
+    def __init__(self):
+        self.verrou = threading.Lock()
+        self.datasets: Set[str] = set()
+        self.tables: Dict[str, bigquery.Table] = {}
+        self.schemas_fichiers: Dict[str, Tuple[str, List[bigquery.SchemaField]]] = {}
+        self.statistiques = {'lectures': 0, 'servies': 0}
+
+    def _compter(self, servie: bool):
+        with self.verrou:
+            self.statistiques['servies' if servie else 'lectures'] += 1
+
+    def dataset_connu(self, dataset_ref: str) -> bool:
+        with self.verrou:
+            connu = dataset_ref in self.datasets
+        if connu:
+            self._compter(True)
+        return connu
+
+    def memoriser_dataset(self, dataset_ref: str):
+        with self.verrou:
+            self.datasets.add(dataset_ref)
+
+    def table(self, table_ref: str) -> Optional[bigquery.Table]:
+        """Table en cache, sinon lue dans BigQuery (None si elle n'existe pas, non mémorisé)"""
+        with self.verrou:
+            table = self.tables.get(table_ref)
+        if table is not None:
+            self._compter(True)
+            return table
+        self._compter(False)
+        try:
+            table = get_gcp_client('bigquery').get_table(table_ref)
+        except NotFound:
+            return None
+        self.memoriser_table(table)
+        return table
+
+    def memoriser_table(self, table: bigquery.Table):
+        """À appeler avec la table retournée par create_table / update_table"""
+        with self.verrou:
+            self.tables[f"{table.project}.{table.dataset_id}.{table.table_id}"] = table
+
+    def schema_fichier(self, source_name: str, empreinte: Optional[str]) -> Optional[List[bigquery.SchemaField]]:
+        """Schéma BigQuery du dernier fichier de la source, si son empreinte de schéma est la même"""
+        if not empreinte:
+            return None
+        with self.verrou:
+            connu = self.schemas_fichiers.get(source_name)
+        if connu and connu[0] == empreinte:
+            self._compter(True)
+            return connu[1]
+        return None
+
+    def memoriser_schema_fichier(self, source_name: str, empreinte: Optional[str], schema: List[bigquery.SchemaField]):
+        self._compter(False)
+        if empreinte:
+            with self.verrou:
+                self.schemas_fichiers[source_name] = (empreinte, list(schema))
+
+    def invalider(self, table_ref: Optional[str] = None):
+        """Oublie une table (relue au prochain accès), ou tout le cache sans référence"""
+        with self.verrou:
+            if table_ref is None:
+                self.datasets.clear()
+                self.tables.clear()
+                self.schemas_fichiers.clear()
+            else:
+                self.tables.pop(table_ref, None)
+
+
+def obtenir_cache_metadonnees() -> CacheMetadonnees:
+    """Cache des métadonnées du processus (créé à la première utilisation)"""
+    global _cache
+    with _verrou_cache:
+        if _cache is None:
+            _cache = CacheMetadonnees()
+        return _cache
+
+
+def journaliser_statistiques_metadonnees():
+    if _cache is None:
+        return
+    with _cache.verrou:
+        stats = dict(_cache.statistiques)
+    logger.info(
+        f"Métadonnées BigQuery : {stats['servies']} servie(s) par le cache, "
+        f"{stats['lectures']} lecture(s) de l'API"
+    )
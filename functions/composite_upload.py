@@ -0,0 +1,203 @@
+"""
+Upload composite parallèle vers GCS (parallel composite upload)
+Le flux est découpé en composants envoyés simultanément comme objets temporaires,
+puis assemblés par GCS compose dans l'objet final
+"""
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from config import CONFIG, ENV
+from functions.resumable_upload import EmpreintesUpload
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+# Nombre maximal d'objets sources d'un appel compose
+MAX_SOURCES_COMPOSE = 32
+
+
+def obtenir_parametres_composite(source: Optional[Dict] = None) -> Dict:
+    """Retourne les paramètres de l'upload composite (section execution.upload_composite, surchargeable par source)"""
+    parametres = dict(CONFIG['execution'].get('upload_composite', {}))
+    if source:
+        parametres.update(source.get('upload_composite', {}))
+    return {
+        'actif': parametres.get('actif', False),
+        'connexions': max(1, int(parametres.get('connexions', 4))),
+        'taille_composant': int(parametres.get('taille_composant_mb', 32)) * 1024 * 1024,
+        'taille_min': int(parametres.get('taille_min_mb', 256)) * 1024 * 1024
+    }
+
+
+class UploadComposite(EmpreintesUpload):
+    """
+    Writer vers un objet GCS par composants uploadés en parallèle puis assemblés (compose)
+
+    Même interface que SessionUploadReprenable : l'offset confirmé correspond aux
+    composants envoyés sans trou depuis le début, ce qui permet de reprendre la source
+    à cet octet. Au plus connexions + 1 composants sont en mémoire.
+    L'objet composé n'a pas de MD5 côté GCS : le contrôle d'intégrité porte sur le CRC32C.
+    """
+
+    def __init__(self, blob, taille_composant: int, connexions: int, timeout: int, content_type: Optional[str] = None):
+        self.blob = blob
+        self.bucket = blob.bucket
+        self.prefixe = f"{blob.name}.composants"
+        self.taille_composant = taille_composant
+        self.connexions = connexions
+        self.timeout = timeout
+        self.content_type = content_type
+        self.executor = ThreadPoolExecutor(max_workers=connexions, thread_name_prefix="composite")
+        self.temporaires = set()
+        self._reinitialiser()
+
+    def _reinitialiser(self):
+        """Remet l'état à zéro (les objets temporaires déjà créés restent à supprimer)"""
+        self.tampon = bytearray()
+        self.composants: List[tuple] = []
+        self.en_vol = deque()
+        self.confirmes = 0
+        self.offset = 0
+        self.rompu = False
+        self.termine = False
+        self.objet = None
+        self._reinitialiser_empreintes()
+        # État des empreintes à chaque frontière de composant, pour reprendre à l'offset confirmé
+        self.etats = [self._copier_empreintes()]
+
+    def _copier_empreintes(self) -> tuple:
+        return self.sha256.copy(), self.md5.copy(), self.crc32c.copy()
+
+    @property
+    def taille(self) -> int:
+        return self.offset
+
+    def write(self, donnees: bytes) -> int:
+        self.tampon += donnees
+        while len(self.tampon) >= self.taille_composant:
+            self._soumettre(bytes(self.tampon[:self.taille_composant]))
+            del self.tampon[:self.taille_composant]
+        return len(donnees)
+
+    def _soumettre(self, morceau: bytes):
+        """Met un composant en file d'upload ; bloque si trop de composants sont en vol"""
+        nom = f"{self.prefixe}/{len(self.composants):05d}"
+        self._hacher(morceau)
+        self.etats.append(self._copier_empreintes())
+        self.composants.append((nom, len(morceau)))
+        self.temporaires.add(nom)
+        self.en_vol.append(self.executor.submit(self._envoyer_composant, nom, morceau))
+
+        while len(self.en_vol) > self.connexions:
+            self._attendre_plus_ancien()
+
+    def _envoyer_composant(self, nom: str, morceau: bytes):
+        self.bucket.blob(nom).upload_from_string(
+            morceau,
+            content_type='application/octet-stream',
+            timeout=self.timeout,
+            checksum='crc32c'
+        )
+
+    def _attendre_plus_ancien(self):
+        """Attend le plus ancien composant en vol et avance l'offset confirmé"""
+        future = self.en_vol.popleft()
+        try:
+            future.result()
+        except Exception as e:
+            self.rompu = True
+            raise IOError(f"Upload du composant {self.confirmes} échoué : {e}") from e
+        if not self.rompu:
+            self.offset += self.composants[self.confirmes][1]
+            self.confirmes += 1
+
+    def close(self):
+        """Envoie le dernier composant, attend les uploads puis assemble l'objet final"""
+        if self.tampon or not self.composants:
+            self._soumettre(bytes(self.tampon))
+            self.tampon = bytearray()
+        while self.en_vol:
+            self._attendre_plus_ancien()
+
+        logger.info(f"Assemblage de {len(self.composants)} composant(s) par compose")
+        self._composer([nom for nom, _ in self.composants])
+        self.termine = True
+        self.objet = {'crc32c': self.blob.crc32c, 'md5Hash': None}
+        self._nettoyer()
+
+    def _composer(self, noms: List[str]):
+        """Assemble les composants, par niveaux de 32 objets au plus"""
+        niveau = 0
+        while len(noms) > MAX_SOURCES_COMPOSE:
+            groupes = [noms[i:i + MAX_SOURCES_COMPOSE] for i in range(0, len(noms), MAX_SOURCES_COMPOSE)]
+            intermediaires = [f"{self.prefixe}/niveau{niveau}-{i:05d}" for i in range(len(groupes))]
+            self.temporaires.update(intermediaires)
+            list(self.executor.map(
+                lambda cible, groupe: self.bucket.blob(cible).compose(
+                    [self.bucket.blob(nom) for nom in groupe], timeout=self.timeout
+                ),
+                intermediaires,
+                groupes
+            ))
+            noms = intermediaires
+            niveau += 1
+
+        if self.content_type:
+            self.blob.content_type = self.content_type
+        self.blob.compose([self.bucket.blob(nom) for nom in noms], timeout=self.timeout)
+
+    def _vider_en_vol(self):
+        """Attend la fin des uploads en cours sans propager leurs erreurs"""
+        while self.en_vol:
+            try:
+                self._attendre_plus_ancien()
+            except IOError:
+                pass
+
+    def reprendre(self) -> int:
+        """
+        Resynchronise l'état après une erreur : seuls les composants envoyés
+        sans trou depuis le début sont conservés
+
+        Returns:
+            Octet à partir duquel la source doit être relue
+        """
+        self._vider_en_vol()
+        self.composants = self.composants[:self.confirmes]
+        self.etats = self.etats[:self.confirmes + 1]
+        self.sha256, self.md5, self.crc32c = (e.copy() for e in self.etats[-1])
+        self.tampon = bytearray()
+        self.rompu = False
+        return self.offset
+
+    def recommencer(self):
+        """Abandonne les composants envoyés et repart de zéro (source non reprenable)"""
+        self._vider_en_vol()
+        self._reinitialiser()
+
+    def _nettoyer(self):
+        """Supprime les objets temporaires et libère les threads d'upload"""
+        def supprimer(nom: str):
+            try:
+                self.bucket.blob(nom).delete(timeout=self.timeout)
+            except Exception:
+                pass
+
+        try:
+            list(self.executor.map(supprimer, sorted(self.temporaires)))
+            self.temporaires.clear()
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def annuler(self):
+        """Abandonne l'upload et supprime les composants déjà envoyés"""
+        if self.termine:
+            return
+        try:
+            self._vider_en_vol()
+            self._nettoyer()
+        except Exception as e:
+            logger.warning(f"Nettoyage des composants impossible : {e}")
@@ -0,0 +1,278 @@
+"""
+Décompression en streaming des archives zip / gzip (étape 1)
+Lit l'archive au fil du flux HTTP, sans fichier temporaire ni accès aléatoire :
+les membres zip sont parcourus via leurs en-têtes locaux
+"""
+
+import fnmatch
+import logging
+import struct
+import zlib
+from typing import Dict, Iterator, Optional, Tuple
+
+from config import CONFIG, ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+SIGNATURE_ZIP_LOCAL = b"PK\x03\x04"
+SIGNATURE_ZIP_CENTRAL = b"PK\x01\x02"
+SIGNATURE_ZIP_FIN = b"PK\x05\x06"
+SIGNATURE_ZIP_DESCRIPTEUR = b"PK\x07\x08"
+SIGNATURE_GZIP = b"\x1f\x8b"
+
+TAILLE_LECTURE = 1024 * 1024
+TAILLE_SORTIE = 4 * 1024 * 1024
+
+
+def obtenir_parametres_decompression(source: Optional[Dict] = None) -> Dict:
+    """Retourne les paramètres de décompression (section execution.decompression, surchargeable par source)"""
+    parametres = dict(CONFIG['execution'].get('decompression', {}))
+    if source:
+        parametres.update(source.get('decompression', {}))
+    return {
+        'actif': parametres.get('actif', False),
+        'membres': parametres.get('membres', '*')
+    }
+
+
+def detecter_compression(entete: bytes = b"", url: str = '', content_type: str = '', content_disposition: str = '') -> Optional[str]:
+    """
+    Détermine si le flux est une archive : 'zip', 'gzip' ou None
+
+    Les octets magiques sont prioritaires ; à défaut (entête vide), on utilise
+    l'URL et les en-têtes HTTP.
+    """
+    if entete:
+        if entete.startswith(SIGNATURE_ZIP_LOCAL):
+            return 'zip'
+        if entete.startswith(SIGNATURE_GZIP):
+            return 'gzip'
+        return None
+
+    indices = ' '.join([url, content_type or '', content_disposition or '']).lower()
+    if 'zip' in indices and 'gzip' not in indices:
+        return 'zip'
+    if 'gzip' in indices or '.gz' in indices:
+        return 'gzip'
+    return None
+
+
+class FluxTamponne:
+    """Flux en lecture avec possibilité de remettre des octets en tête (unread)"""
+
+    def __init__(self, flux):
+        self.flux = flux
+        self.tampon = b""
+
+    def read(self, taille: int = TAILLE_LECTURE) -> bytes:
+        if self.tampon:
+            donnees, self.tampon = self.tampon[:taille], self.tampon[taille:]
+            return donnees
+        return self.flux.read(taille)
+
+    def read_exact(self, taille: int) -> bytes:
+        morceaux = []
+        restant = taille
+        while restant > 0:
+            morceau = self.read(restant)
+            if not morceau:
+                raise EOFError(f"Archive tronquée ({taille - restant}/{taille} octets lus)")
+            morceaux.append(morceau)
+            restant -= len(morceau)
+        return b"".join(morceaux)
+
+    def unread(self, donnees: bytes):
+        if donnees:
+            self.tampon = donnees + self.tampon
+
+
+class _LecteurDecompresse:
+    """Base des lecteurs de membre : restitue les octets décompressés par read(n)"""
+
+    def __init__(self):
+        self.reste = b""
+        self.fini = False
+        self.closed = False
+
+    def readable(self) -> bool:
+        return True
+
+    def _produire(self) -> bytes:
+        raise NotImplementedError
+
+    def read(self, taille: int = -1) -> bytes:
+        morceaux = [self.reste] if self.reste else []
+        disponible = len(self.reste)
+        self.reste = b""
+
+        while (taille < 0 or disponible < taille) and not self.fini:
+            donnees = self._produire()
+            morceaux.append(donnees)
+            disponible += len(donnees)
+
+        donnees = b"".join(morceaux)
+        if 0 <= taille < len(donnees):
+            donnees, self.reste = donnees[:taille], donnees[taille:]
+        return donnees
+
+    def vider(self):
+        """Consomme la fin du membre sans la conserver"""
+        self.reste = b""
+        while not self.fini:
+            self._produire()
+
+    def close(self):
+        self.closed = True
+
+
+class LecteurGzip(_LecteurDecompresse):
+    """Décompresse un flux gzip (y compris plusieurs membres gzip concaténés)"""
+
+    def __init__(self, flux):
+        super().__init__()
+        self.source = FluxTamponne(flux)
+        self.decompresseur = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+
+    def _produire(self) -> bytes:
+        entree = self.decompresseur.unconsumed_tail
+        if not entree:
+            entree = self.source.read(TAILLE_LECTURE)
+            if not entree:
+                if not self.decompresseur.eof:
+                    raise EOFError("Flux gzip tronqué")
+                self.fini = True
+                return self.decompresseur.flush()
+
+        donnees = self.decompresseur.decompress(entree, TAILLE_SORTIE)
+        if self.decompresseur.eof:
+            # Membre gzip suivant éventuel
+            self.source.unread(self.decompresseur.unused_data)
+            self.decompresseur = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+            suite = self.source.read(TAILLE_LECTURE)
+            if suite:
+                self.source.unread(suite)
+            else:
+                self.fini = True
+        return donnees
+
+
+class LecteurMembreZip(_LecteurDecompresse):
+    """Lit un membre zip (stored ou deflate) à partir de son en-tête local"""
+
+    def __init__(self, source: FluxTamponne, methode: int, taille_compressee: Optional[int], descripteur: bool, zip64: bool):
+        super().__init__()
+        self.source = source
+        self.methode = methode
+        self.restant = taille_compressee
+        self.descripteur = descripteur
+        self.zip64 = zip64
+        self.decompresseur = zlib.decompressobj(-zlib.MAX_WBITS) if methode == 8 else None
+
+        if methode == 0 and taille_compressee is None:
+            raise ValueError("Membre zip non compressé de taille inconnue : lecture en flux impossible")
+        if methode not in (0, 8):
+            raise ValueError(f"Méthode de compression zip non supportée : {methode}")
+
+    def _produire(self) -> bytes:
+        if self.methode == 0:
+            donnees = self.source.read(min(TAILLE_LECTURE, self.restant)) if self.restant else b""
+            if self.restant and not donnees:
+                raise EOFError("Membre zip tronqué")
+            self.restant -= len(donnees)
+            if self.restant == 0:
+                self._terminer()
+            return donnees
+
+        entree = self.decompresseur.unconsumed_tail
+        if not entree:
+            entree = self.source.read(TAILLE_LECTURE)
+            if not entree:
+                raise EOFError("Membre zip tronqué")
+
+        donnees = self.decompresseur.decompress(entree, TAILLE_SORTIE)
+        if self.decompresseur.eof:
+            self.source.unread(self.decompresseur.unused_data)
+            self._terminer()
+        return donnees
+
+    def _terminer(self):
+        self.fini = True
+        if self.descripteur:
+            # Descripteur de données : signature optionnelle, crc, tailles (4 ou 8 octets)
+            taille_tailles = 16 if self.zip64 else 8
+            debut = self.source.read_exact(4)
+            if debut == SIGNATURE_ZIP_DESCRIPTEUR:
+                self.source.read_exact(4 + taille_tailles)
+            else:
+                self.source.read_exact(taille_tailles)
+
+
+def _lire_extra_zip64(extra: bytes) -> Optional[Tuple[int, int]]:
+    """Extrait (taille décompressée, taille compressée) du champ extra zip64 s'il existe"""
+    position = 0
+    while position + 4 <= len(extra):
+        identifiant, taille = struct.unpack_from("<HH", extra, position)
+        if identifiant == 0x0001 and taille >= 16:
+            return struct.unpack_from("<QQ", extra, position + 4)
+        position += 4 + taille
+    return None
+
+
+def iterer_membres_zip(flux) -> Iterator[Tuple[str, LecteurMembreZip]]:
+    """
+    Parcourt une archive zip en flux et retourne (nom, lecteur) pour chaque membre
+
+    Chaque lecteur doit être lu (ou abandonné) avant de passer au membre suivant :
+    le reste du membre est alors consommé automatiquement.
+    """
+    source = FluxTamponne(flux)
+
+    while True:
+        signature = source.read_exact(4)
+        if signature in (SIGNATURE_ZIP_CENTRAL, SIGNATURE_ZIP_FIN):
+            return
+        if signature != SIGNATURE_ZIP_LOCAL:
+            raise ValueError("En-tête zip local invalide")
+
+        (_, drapeaux, methode, _, _, _, taille_compressee, _,
+         longueur_nom, longueur_extra) = struct.unpack("<HHHHHIIIHH", source.read_exact(26))
+        nom = source.read_exact(longueur_nom).decode('utf-8', errors='replace')
+        extra = source.read_exact(longueur_extra)
+
+        tailles_zip64 = _lire_extra_zip64(extra)
+        zip64 = tailles_zip64 is not None
+        if zip64 and taille_compressee == 0xFFFFFFFF:
+            taille_compressee = tailles_zip64[1]
+
+        descripteur = bool(drapeaux & 0x08)
+        lecteur = LecteurMembreZip(
+            source,
+            methode,
+            None if descripteur else taille_compressee,
+            descripteur,
+            zip64
+        )
+
+        yield nom, lecteur
+        lecteur.vider()
+
+
+def ouvrir_membres(flux, compression: Optional[str], motif: str = '*') -> Iterator[Tuple[Optional[str], object]]:
+    """
+    Retourne les membres à ingérer d'un flux éventuellement compressé
+
+    zip : membres (hors dossiers) dont le nom correspond au motif ;
+    gzip : un seul membre décompressé ; None : le flux tel quel.
+    """
+    if compression == 'zip':
+        for nom, lecteur in iterer_membres_zip(flux):
+            if nom.endswith('/') or not fnmatch.fnmatch(nom.rsplit('/', 1)[-1], motif):
+                logger.info(f"Membre ignoré : {nom}")
+                continue
+            logger.info(f"Décompression du membre : {nom}")
+            yield nom, lecteur
+    elif compression == 'gzip':
+        yield None, LecteurGzip(flux)
+    else:
+        yield None, flux
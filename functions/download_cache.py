@@ -0,0 +1,281 @@
+"""
+Cache local des téléchargements (étape 1)
+Les fichiers sources bruts sont conservés sur disque, adressés par leur contenu
+(SHA-256) : {dossier}/objets/{sha[:2]}/{sha}. Un index SQLite associe chaque clé
+(URL + validateur HTTP + taille) à un objet et garde la date du dernier accès
+pour l'éviction LRU au-delà de la taille maximale. Un fichier en cache est relu
+par mmap directement vers l'upload GCS, sans nouveau téléchargement.
+"""
+
+import hashlib
+import logging
+import mmap
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+from config import CONFIG, ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+_cache = None
+_verrou_cache = threading.Lock()
+
+
+def obtenir_parametres_cache() -> Dict:
+    """Retourne les paramètres du cache local (section execution.cache_local)"""
+    parametres = CONFIG['execution'].get('cache_local', {})
+    return {
+        'actif': parametres.get('actif', False),
+        'dossier': parametres.get('dossier', '.cache/telechargements'),
+        'taille_max': int(float(parametres.get('taille_max_gb', 20)) * 1024**3)
+    }
+
+
+def cle_cache(url: str, etag: Optional[str], last_modified: Optional[str], taille: int) -> Optional[str]:
+    """
+    Clé d'un fichier source : URL, validateur HTTP et taille
+
+    Sans ETag ni Last-Modified, le contenu ne peut pas être revalidé : pas de clé.
+    """
+    validateur = etag or last_modified
+    if not validateur:
+        return None
+    return f"{url}|{validateur}|{taille}"
+
+
+def relire_mmap(chemin: str, destination, depart: int = 0, taille_morceau: int = 16 * 1024 * 1024,
+                progression: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Écrit le fichier à partir de depart dans destination, par morceaux lus via mmap
+
+    Returns:
+        Position atteinte (taille du fichier)
+    """
+    with open(chemin, 'rb') as fichier:
+        if os.fstat(fichier.fileno()).st_size == 0:
+            return 0
+        with mmap.mmap(fichier.fileno(), 0, access=mmap.ACCESS_READ) as carte:
+            vue = memoryview(carte)
+            try:
+                for debut in range(depart, len(carte), taille_morceau):
+                    with vue[debut:debut + taille_morceau] as morceau:
+                        destination.write(morceau)
+                    if progression:
+                        progression(min(debut + taille_morceau, len(carte)))
+            finally:
+                vue.release()
+            return len(carte)
+
+
+class _Duplication:
+    """Writer qui transmet chaque morceau à la destination puis à la copie en cache"""
+
+    def __init__(self, destination, copie):
+        self.destination = destination
+        self.copie = copie
+
+    def write(self, donnees) -> int:
+        self.destination.write(donnees)
+        self.copie.write(donnees)
+        return len(donnees)
+
+
+class EcritureCache:
+    """
+    Copie en cours d'un fichier source vers le cache
+
+    La copie suit les reprises du transfert (positionner) ; elle n'entre dans
+    le cache qu'une fois validée, sinon le fichier temporaire est supprimé.
+    """
+
+    def __init__(self, cache: 'CacheTelechargements', cle: str, taille_attendue: int):
+        self.cache = cache
+        self.cle = cle
+        self.taille_attendue = taille_attendue
+        self.chemin = cache.dossier / 'tmp' / f"{uuid.uuid4().hex}.part"
+        self.chemin.parent.mkdir(parents=True, exist_ok=True)
+        self.fichier = open(self.chemin, 'wb')
+
+    def positionner(self, depart: int):
+        """Repart de l'octet depart (reprise ou nouveau transfert)"""
+        self.fichier.seek(depart)
+        self.fichier.truncate()
+
+    def dupliquer(self, destination) -> _Duplication:
+        return _Duplication(destination, self.fichier)
+
+    def write(self, donnees) -> int:
+        return self.fichier.write(donnees)
+
+    def valider(self):
+        """Ajoute la copie au cache si elle est complète"""
+        if self.fichier is None:
+            return
+        taille = self.fichier.tell()
+        self.fichier.close()
+        self.fichier = None
+        if self.taille_attendue and taille != self.taille_attendue:
+            logger.warning(f"Copie en cache incomplète ({taille}/{self.taille_attendue} octets), ignorée")
+            self.chemin.unlink(missing_ok=True)
+            return
+        self.cache.ajouter(self.cle, self.chemin)
+
+    def abandonner(self):
+        if self.fichier is not None:
+            self.fichier.close()
+            self.fichier = None
+        self.chemin.unlink(missing_ok=True)
+
+
+class CacheTelechargements:
+    """Cache disque adressé par contenu, avec éviction LRU à taille_max octets"""
+
+    def __init__(self, dossier: str, taille_max: int):
+        self.dossier = Path(dossier)
+        self.taille_max = taille_max
+        self.verrou = threading.Lock()
+        (self.dossier / 'objets').mkdir(parents=True, exist_ok=True)
+        with self._connexion() as connexion:
+            connexion.executescript("""
+                CREATE TABLE IF NOT EXISTS objets (
+                    sha256 TEXT PRIMARY KEY,
+                    taille INTEGER NOT NULL,
+                    dernier_acces REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS cles (
+                    cle TEXT PRIMARY KEY,
+                    sha256 TEXT NOT NULL REFERENCES objets(sha256)
+                );
+            """)
+
+    @contextmanager
+    def _connexion(self):
+        """Connexion à l'index, validée en fin de bloc puis fermée"""
+        connexion = sqlite3.connect(self.dossier / 'index.sqlite', timeout=30)
+        try:
+            with connexion:
+                yield connexion
+        finally:
+            connexion.close()
+
+    def chemin_objet(self, sha256: str) -> Path:
+        return self.dossier / 'objets' / sha256[:2] / sha256
+
+    def chercher(self, cle: str) -> Optional[str]:
+        """Chemin du fichier en cache pour cette clé (None si absent), marqué comme récemment utilisé"""
+        with self.verrou, self._connexion() as connexion:
+            ligne = connexion.execute("SELECT sha256 FROM cles WHERE cle = ?", (cle,)).fetchone()
+            if ligne is None:
+                return None
+            chemin = self.chemin_objet(ligne[0])
+            if not chemin.exists():
+                connexion.execute("DELETE FROM cles WHERE sha256 = ?", (ligne[0],))
+                connexion.execute("DELETE FROM objets WHERE sha256 = ?", (ligne[0],))
+                return None
+            connexion.execute("UPDATE objets SET dernier_acces = ? WHERE sha256 = ?", (time.time(), ligne[0]))
+        return str(chemin)
+
+    def nouvelle_ecriture(self, cle: str, taille_attendue: int) -> Optional[EcritureCache]:
+        """Prépare la copie d'un fichier source (None s'il dépasse la taille du cache)"""
+        if taille_attendue > self.taille_max:
+            logger.info(f"Fichier plus grand que le cache local ({taille_attendue / 1024**3:.1f} GB), non conservé")
+            return None
+        return EcritureCache(self, cle, taille_attendue)
+
+    def ajouter(self, cle: str, chemin_temporaire: Path):
+        """Range un fichier complet sous son empreinte (dédupliqué) puis applique l'éviction"""
+        sha = hashlib.sha256()
+        with open(chemin_temporaire, 'rb') as fichier:
+            while True:
+                morceau = fichier.read(8 * 1024 * 1024)
+                if not morceau:
+                    break
+                sha.update(morceau)
+        sha256 = sha.hexdigest()
+        taille = chemin_temporaire.stat().st_size
+
+        with self.verrou:
+            destination = self.chemin_objet(sha256)
+            if destination.exists():
+                chemin_temporaire.unlink()
+            else:
+                destination.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(chemin_temporaire, destination)
+            with self._connexion() as connexion:
+                connexion.execute(
+                    "INSERT OR REPLACE INTO objets (sha256, taille, dernier_acces) VALUES (?, ?, ?)",
+                    (sha256, taille, time.time())
+                )
+                connexion.execute("INSERT OR REPLACE INTO cles (cle, sha256) VALUES (?, ?)", (cle, sha256))
+            logger.info(f"Fichier ajouté au cache local ({taille / 1024**2:.1f} MB, {sha256[:12]})")
+            self._evincer(garder=sha256)
+
+    def _evincer(self, garder: Optional[str] = None):
+        """Supprime les objets les moins récemment utilisés au-delà de taille_max"""
+        with self._connexion() as connexion:
+            total = connexion.execute("SELECT COALESCE(SUM(taille), 0) FROM objets").fetchone()[0]
+            if total <= self.taille_max:
+                return
+            for sha256, taille in connexion.execute(
+                "SELECT sha256, taille FROM objets ORDER BY dernier_acces"
+            ).fetchall():
+                if total <= self.taille_max:
+                    break
+                if sha256 == garder:
+                    continue
+                self.chemin_objet(sha256).unlink(missing_ok=True)
+                connexion.execute("DELETE FROM cles WHERE sha256 = ?", (sha256,))
+                connexion.execute("DELETE FROM objets WHERE sha256 = ?", (sha256,))
+                total -= taille
+                logger.info(f"Cache local : {sha256[:12]} évincé ({taille / 1024**2:.1f} MB)")
+
+    def vider(self):
+        with self.verrou, self._connexion() as connexion:
+            for (sha256,) in connexion.execute("SELECT sha256 FROM objets").fetchall():
+                self.chemin_objet(sha256).unlink(missing_ok=True)
+            connexion.execute("DELETE FROM cles")
+            connexion.execute("DELETE FROM objets")
+
+    def statistiques(self) -> Dict:
+        with self._connexion() as connexion:
+            objets, taille = connexion.execute("SELECT COUNT(*), COALESCE(SUM(taille), 0) FROM objets").fetchone()
+            cles = connexion.execute("SELECT COUNT(*) FROM cles").fetchone()[0]
+        return {'objets': objets, 'cles': cles, 'taille': taille, 'taille_max': self.taille_max}
+
+
+def obtenir_cache() -> Optional[CacheTelechargements]:
+    """Cache local du processus (None s'il est désactivé)"""
+    global _cache
+    parametres = obtenir_parametres_cache()
+    if not parametres['actif']:
+        return None
+    with _verrou_cache:
+        if _cache is None:
+            _cache = CacheTelechargements(parametres['dossier'], parametres['taille_max'])
+        return _cache
+
+
+if __name__ == "__main__":
+    import sys
+
+    parametres = obtenir_parametres_cache()
+    cache = CacheTelechargements(parametres['dossier'], parametres['taille_max'])
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'vider':
+        cache.vider()
+        print(f"\nCache local vidé ({parametres['dossier']})")
+    else:
+        stats = cache.statistiques()
+        print(f"\nCache local : {parametres['dossier']} ({'actif' if parametres['actif'] else 'inactif'})")
+        print(f"  {stats['objets']} fichier(s), {stats['cles']} clé(s)")
+        print(f"  {stats['taille'] / 1024**3:.2f} GB / {stats['taille_max'] / 1024**3:.2f} GB")
+        print("\nUsage:")
+        print("  python -m functions.download_cache          # Statistiques du cache")
+        print("  python -m functions.download_cache vider    # Supprime tous les fichiers en cache")
@@ -0,0 +1,164 @@
+"""
+Tables raw externes (étape 2, mode "externe")
+Pour une source en mode externe, aucun fichier n'est copié dans BigQuery :
+- une table externe {table_raw}_ext lit directement les Parquet des derniers batchs
+  du stockage (bigquery.raw_tables.externe.batchs) ;
+- une vue {table_raw} y ajoute les colonnes d'historique, tirées du nom du fichier
+  (_FILE_NAME), et les types du registre des schémas.
+L'étape 3 et l'interface lisent la vue comme une table raw chargée.
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+from config import CONFIG, ENV
+from functions.batch_catalog import obtenir_catalogue
+from functions.bq_metadata import obtenir_cache_metadonnees
+from functions.gcp_clients import get_gcp_client
+from functions.schema_registry import (
+    expressions_normalisation,
+    obtenir_parametres_schemas,
+    types_attendus,
+    types_schema_bigquery,
+    version_schema
+)
+from functions.storage_backend import obtenir_stockage
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+SUFFIXE_TABLE_EXTERNE = '_ext'
+
+# Horodatage du batch dans le nom de fichier : {source}__{AAAA-MM-JJ}_{HH-MM-SS}.parquet
+MOTIF_HORODATAGE_SQL = r"__(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.parquet$"
+
+
+def obtenir_parametres_externes() -> Dict:
+    """Retourne les paramètres des tables externes (section bigquery.raw_tables)"""
+    raw_tables = CONFIG['bigquery']['raw_tables']
+    return {
+        'chargement': raw_tables.get('chargement', 'natif'),
+        'batchs': int(raw_tables.get('externe', {}).get('batchs', 2))
+    }
+
+
+def mode_chargement(source_name: str) -> str:
+    """"natif" ou "externe" : clé "chargement" de la source, sinon bigquery.raw_tables.chargement"""
+    for source in CONFIG['data_sources']['sources']:
+        if source['name'] == source_name and source.get('chargement'):
+            return source['chargement']
+    return obtenir_parametres_externes()['chargement']
+
+
+def fichiers_exposes(source_name: str, nombre_batchs: Optional[int] = None) -> List[Dict]:
+    """Fichiers Parquet de la source dans ses nombre_batchs derniers batchs, du plus récent au plus ancien"""
+    nombre_batchs = nombre_batchs or obtenir_parametres_externes()['batchs']
+    catalogue = obtenir_catalogue()
+    fichiers = []
+    for timestamp in catalogue.timestamps():
+        fichier = next(
+            (f for f in catalogue.lister(timestamp=timestamp).get(timestamp, [])
+             if f['source'] == source_name and f['blob_name'].endswith('.parquet')),
+            None
+        )
+        if fichier:
+            fichiers.append(fichier)
+        if len(fichiers) >= nombre_batchs:
+            break
+    return fichiers
+
+
+def requete_table_externe(table_externe_ref: str, uris: List[str]) -> str:
+    liste_uris = ',\n        '.join(f"'{uri}'" for uri in uris)
+    return f"""
+    CREATE OR REPLACE EXTERNAL TABLE `{table_externe_ref}`
+    OPTIONS (
+      format = 'PARQUET',
+      uris = [
+        {liste_uris}
+      ]
+    )
+    """
+
+
+def expression_horodatage() -> str:
+    """Horodatage du batch d'une ligne, d'après le nom de son fichier (_FILE_NAME d'une table externe)"""
+    return f"PARSE_TIMESTAMP('%Y-%m-%d_%H-%M-%S', REGEXP_EXTRACT(_FILE_NAME, r'{MOTIF_HORODATAGE_SQL}'))"
+
+
+def expressions_table_externe(source_name: str, schema: List[bigquery.SchemaField]) -> Tuple[Optional[Dict], Dict[str, str]]:
+    """Version du registre retenue et expression de chaque colonne raw à partir du schéma d'une table externe"""
+    observe = types_schema_bigquery(schema)
+    for colonne in (CONFIG['historique']['colonne_timestamp'], CONFIG['historique']['colonne_date']):
+        observe.pop(colonne, None)
+    version = version_schema(source_name) if obtenir_parametres_schemas()['actif'] else None
+    if version is None:
+        return None, {nom: f"`{nom}`" for nom in observe}
+    return version, expressions_normalisation(types_attendus(version), observe)
+
+
+def requete_vue_raw(vue_ref: str, table_externe_ref: str, expressions: Dict[str, str]) -> str:
+    """Vue raw : colonnes (normalisées) de la table externe et colonnes d'historique du batch"""
+    timestamp_col = CONFIG['historique']['colonne_timestamp']
+    date_col = CONFIG['historique']['colonne_date']
+    horodatage = expression_horodatage()
+    selection = ',\n      '.join(f"{expression} AS `{nom}`" for nom, expression in expressions.items())
+    return f"""
+    CREATE OR REPLACE VIEW `{vue_ref}` AS
+    SELECT
+      {selection},
+      {horodatage} AS {timestamp_col},
+      DATE({horodatage}) AS {date_col}
+    FROM `{table_externe_ref}`
+    """
+
+
+def definir_table_externe(source_name: str, table_name: str) -> bool:
+    """
+    (Re)définit la table externe et la vue raw d'une source sur ses derniers batchs
+
+    Seules des métadonnées sont écrites (aucune donnée copiée). Une table native
+    portant déjà le nom de la vue n'est jamais remplacée.
+    """
+    stockage = obtenir_stockage()
+    if stockage.nom != 'gcs':
+        logger.error(f"{source_name} : les tables externes lisent Cloud Storage (backend {stockage.nom} non supporté)")
+        return False
+
+    fichiers = fichiers_exposes(source_name)
+    if not fichiers:
+        logger.error(f"{source_name} : aucun fichier Parquet à exposer")
+        return False
+
+    client = get_gcp_client('bigquery')
+    cache = obtenir_cache_metadonnees()
+    vue_ref = f"{ENV['project_id']}.{ENV['dataset']}.{table_name}"
+    table_externe_ref = f"{vue_ref}{SUFFIXE_TABLE_EXTERNE}"
+
+    existante = cache.table(vue_ref)
+    if existante is not None and existante.table_type != 'VIEW':
+        logger.error(
+            f"{table_name} est une table {existante.table_type} : la supprimer (ou repasser la source "
+            f"en chargement natif) avant de l'exposer en table externe"
+        )
+        return False
+
+    try:
+        client.query(requete_table_externe(table_externe_ref, [stockage.uri(f['blob_name']) for f in fichiers])).result()
+        table_externe = client.get_table(table_externe_ref)
+        cache.memoriser_table(table_externe)
+        _, expressions = expressions_table_externe(source_name, table_externe.schema)
+        client.query(requete_vue_raw(vue_ref, table_externe_ref, expressions)).result()
+        cache.invalider(vue_ref)
+    except Exception as e:
+        logger.error(f"Erreur de définition de la table externe {table_name} : {e}")
+        cache.invalider(table_externe_ref)
+        return False
+
+    logger.info(
+        f"{source_name} exposé sans chargement : {table_name} sur {len(fichiers)} batch(s) "
+        f"({fichiers[-1]['timestamp']} → {fichiers[0]['timestamp']})"
+    )
+    return True
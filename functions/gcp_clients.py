@@ -0,0 +1,140 @@
+"""
+Clients GCP partagés par tout le processus (étapes 1 à 3, interface)
+Un seul client par service (storage, bigquery), construit à la première demande :
+les identifiants sont chargés une fois (le jeton OAuth est mis en cache et
+rafraîchi par google-auth) et chaque client garde un pool de connexions HTTP
+dimensionné pour la concurrence du pipeline
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict
+
+import requests
+import streamlit as st
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import bigquery, storage
+
+from config import CONFIG, ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+# Portée couvrant Cloud Storage et BigQuery : un même jeton sert aux deux clients
+PORTEE_CLOUD_PLATFORM = 'https://www.googleapis.com/auth/cloud-platform'
+
+CHEMIN_IDENTIFIANTS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'gcp-credentials.json'
+)
+
+_clients: Dict[str, object] = {}
+_identifiants = None
+_verrou_clients = threading.Lock()
+_statistiques: Dict[str, Dict] = {}
+
+
+def obtenir_parametres_clients() -> Dict:
+    """
+    Retourne les paramètres des clients GCP (section execution.clients_gcp)
+
+    Sans taille_pool, le pool couvre les écritures simultanées de l'étape 1 :
+    max_workers sources × connexions de l'upload composite, plus une marge
+    (ledger, manifest) ; le client BigQuery n'a besoin que d'une connexion par source.
+    """
+    execution = CONFIG['execution']
+    parametres = execution.get('clients_gcp', {})
+    max_workers = execution.get('parallelisme', {}).get('max_workers', 4)
+    connexions = execution.get('upload_composite', {}).get('connexions', 4)
+    return {
+        'taille_pool': {
+            'storage': int(parametres.get('taille_pool') or max_workers * max(1, connexions) + 2),
+            'bigquery': int(parametres.get('taille_pool_bigquery') or max_workers + 2)
+        }
+    }
+
+
+def _charger_identifiants():
+    """Identifiants du fichier local, sinon des secrets Streamlit Cloud"""
+    from google.oauth2 import service_account
+
+    if os.path.exists(CHEMIN_IDENTIFIANTS):
+        # ENVIRONNEMENT LOCAL
+        os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = CHEMIN_IDENTIFIANTS
+        return service_account.Credentials.from_service_account_file(
+            CHEMIN_IDENTIFIANTS, scopes=[PORTEE_CLOUD_PLATFORM]
+        )
+    # ENVIRONNEMENT STREAMLIT CLOUD (pas de fichier local)
+    return service_account.Credentials.from_service_account_info(
+        st.secrets["gcp"], scopes=[PORTEE_CLOUD_PLATFORM]
+    )
+
+
+def _session_http(identifiants, taille_pool: int) -> AuthorizedSession:
+    """Session HTTP authentifiée dont le pool garde taille_pool connexions par hôte"""
+    session = AuthorizedSession(identifiants)
+    adaptateur = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=taille_pool)
+    session.mount('https://', adaptateur)
+    session.mount('http://', adaptateur)
+    return session
+
+
+def _construire_client(client_type: str, identifiants, taille_pool: int):
+    projet = ENV['project_id'] or CONFIG['gcp'].get('project_id')
+    session = _session_http(identifiants, taille_pool)
+    if client_type == 'storage':
+        return storage.Client(project=projet, credentials=identifiants, _http=session)
+    return bigquery.Client(project=projet, credentials=identifiants, _http=session)
+
+
+def get_gcp_client(client_type='storage'):
+    """
+    Client GCP partagé du processus - détecte automatiquement l'environnement
+
+    Le client est construit à la première demande puis réutilisé (les clients
+    google-cloud sont utilisables depuis plusieurs threads). Retourne None si
+    aucun identifiant n'est disponible ; une nouvelle tentative sera faite à
+    la demande suivante.
+    """
+    global _identifiants
+    if client_type not in ('storage', 'bigquery'):
+        raise ValueError(f"Type de client inconnu : {client_type} (storage ou bigquery)")
+    with _verrou_clients:
+        stats = _statistiques.setdefault(client_type, {'demandes': 0, 'constructions': 0, 'duree_construction': 0.0})
+        stats['demandes'] += 1
+        client = _clients.get(client_type)
+        if client is not None:
+            return client
+
+        debut = time.perf_counter()
+        try:
+            if _identifiants is None:
+                _identifiants = _charger_identifiants()
+            taille_pool = obtenir_parametres_clients()['taille_pool'].get(client_type, 10)
+            client = _construire_client(client_type, _identifiants, taille_pool)
+        except Exception as e:
+            logger.warning(f"Client GCP {client_type} indisponible : {e}")
+            return None
+
+        duree = time.perf_counter() - debut
+        stats['constructions'] += 1
+        stats['duree_construction'] += duree
+        _clients[client_type] = client
+        logger.info(f"Client GCP {client_type} créé en {duree:.2f}s (pool de {taille_pool} connexions)")
+        return client
+
+
+def statistiques_clients() -> Dict[str, Dict]:
+    """Demandes, constructions et durée cumulée de construction, par type de client"""
+    with _verrou_clients:
+        return {client_type: dict(stats) for client_type, stats in _statistiques.items()}
+
+
+def journaliser_statistiques_clients():
+    for client_type, stats in statistiques_clients().items():
+        logger.info(
+            f"Client GCP {client_type} : {stats['constructions']} construction(s) "
+            f"({stats['duree_construction']:.2f}s) pour {stats['demandes']} demande(s)"
+        )
+
@@ -0,0 +1,91 @@
+"""
+Registre (ledger) des derniers téléchargements réussis par source
+Stocké dans GCS : {metadata_folder}/ledger/{source}.json
+Permet les requêtes conditionnelles (ETag / Last-Modified) et la comparaison d'empreintes.
+L'entrée garde aussi l'empreinte des paramètres de traitement (conversion, projection,
+décompression) : les changer relance le téléchargement même si la source n'a pas bougé.
+"""
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import CONFIG, ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+
+def chemin_ledger(source_name: str) -> str:
+    """Retourne le chemin GCS de l'entrée du ledger pour une source"""
+    return f"{CONFIG['storage']['metadata_folder']}/ledger/{source_name}.json"
+
+
+def lire_entree_ledger(bucket, source_name: str) -> Optional[Dict]:
+    """Lit la dernière entrée du ledger d'une source (None si absente ou illisible)"""
+    blob = bucket.blob(chemin_ledger(source_name))
+    try:
+        if not blob.exists():
+            return None
+        return json.loads(blob.download_as_text())
+    except Exception as e:
+        logger.warning(f"Ledger illisible pour {source_name} : {e}")
+        return None
+
+
+def ecrire_entree_ledger(bucket, source_name: str, entree: Dict):
+    """Enregistre l'entrée du ledger après un téléchargement réussi"""
+    entree = dict(entree, mis_a_jour=datetime.now().isoformat(timespec='seconds'))
+    blob = bucket.blob(chemin_ledger(source_name))
+    blob.upload_from_string(json.dumps(entree, indent=2), content_type='application/json')
+    logger.info(f"Ledger mis à jour : {source_name}")
+
+
+def empreinte_traitement(*parametres: Dict) -> str:
+    """Empreinte des paramètres effectifs de traitement de la source (conversion, décompression...)"""
+    contenu = json.dumps(parametres, sort_keys=True, default=str)
+    return hashlib.sha256(contenu.encode('utf-8')).hexdigest()[:16]
+
+
+def traitement_identique(entree: Optional[Dict], empreinte: Optional[str]) -> bool:
+    """Le dernier téléchargement a-t-il été traité avec les mêmes paramètres ?"""
+    return bool(entree) and entree.get('empreinte_traitement') == empreinte
+
+
+def entetes_conditionnels(entree: Optional[Dict], url: str, empreinte: Optional[str] = None) -> Dict[str, str]:
+    """Construit les en-têtes If-None-Match / If-Modified-Since à partir du ledger"""
+    if not entree or entree.get('url') != url or not traitement_identique(entree, empreinte):
+        return {}
+    entetes = {}
+    if entree.get('etag'):
+        entetes['If-None-Match'] = entree['etag']
+    if entree.get('last_modified'):
+        entetes['If-Modified-Since'] = entree['last_modified']
+    return entetes
+
+
+def validateurs_identiques(
+    entree: Optional[Dict],
+    url: str,
+    etag: Optional[str],
+    last_modified: Optional[str],
+    taille: int,
+    empreinte: Optional[str] = None
+) -> bool:
+    """
+    Compare les validateurs HTTP annoncés par le serveur avec ceux du ledger
+
+    taille est le Content-Length de la source, comparé à taille_source : taille est
+    celle de l'objet écrit (Parquet converti, projeté ou décompressé). empreinte
+    (empreinte_traitement) doit aussi être celle du dernier téléchargement.
+    """
+    if not entree or entree.get('url') != url or not traitement_identique(entree, empreinte):
+        return False
+    if etag and entree.get('etag'):
+        return etag == entree['etag']
+    if last_modified and entree.get('last_modified'):
+        return last_modified == entree['last_modified'] and taille == entree.get('taille_source')
+    return False
+
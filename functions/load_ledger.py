@@ -0,0 +1,211 @@
+"""
+Registre (ledger) des chargements BigQuery de l'étape 2
+Table {dataset}.{bigquery.ledger_chargements} : une ligne par (source, batch) chargé,
+avec l'empreinte du fichier, le nombre de lignes et le job. Un fichier déjà
+enregistré n'est pas rechargé ; l'entrée est écrite dans la même transaction
+que les lignes de la table raw.
+"""
+
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from google.cloud import bigquery
+
+from config import CONFIG, ENV
+from functions.bq_metadata import obtenir_cache_metadonnees
+from functions.gcp_clients import get_gcp_client
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+SCHEMA_LEDGER = [
+    bigquery.SchemaField('source', 'STRING', mode='REQUIRED'),
+    bigquery.SchemaField('timestamp_batch', 'STRING', mode='REQUIRED'),
+    bigquery.SchemaField('table_raw', 'STRING'),
+    bigquery.SchemaField('chemin', 'STRING'),
+    bigquery.SchemaField('crc32c', 'STRING'),
+    bigquery.SchemaField('lignes', 'INT64'),
+    bigquery.SchemaField('job_id', 'STRING'),
+    bigquery.SchemaField('version_schema', 'INT64'),
+    bigquery.SchemaField('charge_le', 'TIMESTAMP')
+]
+
+
+def table_ledger() -> str:
+    """Référence complète de la table du ledger"""
+    nom = CONFIG['bigquery'].get('ledger_chargements', '_chargements')
+    return f"{ENV['project_id']}.{ENV['dataset']}.{nom}"
+
+
+def creer_ledger_si_necessaire():
+    """Crée la table du ledger si elle n'existe pas, ou lui ajoute les colonnes apparues depuis"""
+    client = get_gcp_client('bigquery')
+    cache = obtenir_cache_metadonnees()
+    table = cache.table(table_ledger())
+    if table is None:
+        table = bigquery.Table(table_ledger(), schema=SCHEMA_LEDGER)
+        table.clustering_fields = ['source']
+        table = client.create_table(table, exists_ok=True)
+        cache.memoriser_table(table)
+    existants = {f.name for f in table.schema}
+    manquants = [f for f in SCHEMA_LEDGER if f.name not in existants]
+    if manquants:
+        table.schema = list(table.schema) + manquants
+        cache.memoriser_table(client.update_table(table, ['schema']))
+
+
+def lire_chargements(timestamp_batch: str) -> Dict[str, Dict]:
+    """Entrées du ledger pour un batch : {source: entrée}"""
+    client = get_gcp_client('bigquery')
+    job = client.query(
+        f"SELECT * FROM `{table_ledger()}` WHERE timestamp_batch = @timestamp_batch",
+        job_config=bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ScalarQueryParameter('timestamp_batch', 'STRING', timestamp_batch)
+        ])
+    )
+    return {ligne['source']: dict(ligne.items()) for ligne in job.result()}
+
+
+def lire_chargements_batchs(timestamps: List[str]) -> Dict[Tuple[str, str], Dict]:
+    """Entrées du ledger pour plusieurs batchs : {(source, timestamp_batch): entrée}"""
+    client = get_gcp_client('bigquery')
+    job = client.query(
+        f"SELECT * FROM `{table_ledger()}` WHERE timestamp_batch IN UNNEST(@timestamps)",
+        job_config=bigquery.QueryJobConfig(query_parameters=[
+            bigquery.ArrayQueryParameter('timestamps', 'STRING', timestamps)
+        ])
+    )
+    return {(ligne['source'], ligne['timestamp_batch']): dict(ligne.items()) for ligne in job.result()}
+
+
+def deja_charge(entree: Optional[Dict], source_info: Dict) -> bool:
+    """Le fichier décrit par source_info est-il celui enregistré dans le ledger ?"""
+    if not entree:
+        return False
+    return entree.get('chemin') == source_info['blob_name'] and entree.get('crc32c') == source_info.get('crc32c')
+
+
+def requete_remplacement(
+    table_ref: str,
+    table_chargement: str,
+    colonnes: List[str],
+    extraction_datetime: datetime,
+    expressions: Optional[Dict[str, str]] = None
+) -> str:
+    """
+    Transaction qui remplace les lignes d'un (source, batch) dans la table raw
+    et enregistre le chargement dans le ledger
+
+    Les lignes d'une tentative précédente du même batch sont supprimées dans
+    la partition du jour d'extraction seulement ; le ledger et la table raw
+    changent ensemble ou pas du tout. expressions donne, par colonne, l'expression
+    lue dans la table de chargement (normalisation des types). Paramètres
+    attendus : @source, @timestamp_batch, @table_raw, @chemin, @crc32c, @version_schema.
+    """
+    timestamp_col = CONFIG['historique']['colonne_timestamp']
+    date_col = CONFIG['historique']['colonne_date']
+    valeur_timestamp = f"TIMESTAMP('{extraction_datetime.strftime('%Y-%m-%d %H:%M:%S')}')"
+    valeur_date = f"DATE('{extraction_datetime.strftime('%Y-%m-%d')}')"
+    liste_colonnes = ', '.join(f"`{c}`" for c in colonnes)
+    expressions = expressions or {}
+    selection = ', '.join(expressions.get(c, f"`{c}`") for c in colonnes)
+    return f"""
+    BEGIN TRANSACTION;
+
+    DELETE FROM `{table_ref}`
+    WHERE {date_col} = {valeur_date} AND {timestamp_col} = {valeur_timestamp};
+
+    INSERT INTO `{table_ref}` ({liste_colonnes}, {timestamp_col}, {date_col})
+    SELECT {selection}, {valeur_timestamp}, {valeur_date}
+    FROM `{table_chargement}`;
+
+    DELETE FROM `{table_ledger()}`
+    WHERE source = @source AND timestamp_batch = @timestamp_batch;
+
+    INSERT INTO `{table_ledger()}` (source, timestamp_batch, table_raw, chemin, crc32c, lignes, job_id, version_schema, charge_le)
+    SELECT @source, @timestamp_batch, @table_raw, @chemin, @crc32c,
+           (SELECT COUNT(*) FROM `{table_chargement}`), @@script.job_id, @version_schema, CURRENT_TIMESTAMP();
+
+    COMMIT TRANSACTION;
+    """
+
+
+def parametres_remplacement(source_info: Dict, table_raw: str, version_schema: Optional[int] = None) -> List[bigquery.ScalarQueryParameter]:
+    return [
+        bigquery.ScalarQueryParameter('source', 'STRING', source_info['source']),
+        bigquery.ScalarQueryParameter('timestamp_batch', 'STRING', source_info['timestamp']),
+        bigquery.ScalarQueryParameter('table_raw', 'STRING', table_raw),
+        bigquery.ScalarQueryParameter('chemin', 'STRING', source_info['blob_name']),
+        bigquery.ScalarQueryParameter('crc32c', 'STRING', source_info.get('crc32c')),
+        bigquery.ScalarQueryParameter('version_schema', 'INT64', version_schema)
+    ]
+
+
+def requete_reprise(
+    table_ref: str,
+    table_externe: str,
+    colonnes: List[str],
+    expressions: Dict[str, str],
+    horodatage: str
+) -> str:
+    """
+    Transaction qui charge plusieurs batchs d'une source depuis une table externe
+    et enregistre chaque fichier dans le ledger
+
+    horodatage est l'expression SQL de l'horodatage du batch de chaque ligne (nom
+    du fichier). Les lignes des batchs repris sont d'abord supprimées, dans leurs
+    seules partitions. Paramètres attendus : @source, @table_raw, @version_schema,
+    @dates, @horodatages et @fichiers (timestamp_batch, horodatage, chemin, crc32c).
+    """
+    timestamp_col = CONFIG['historique']['colonne_timestamp']
+    date_col = CONFIG['historique']['colonne_date']
+    liste_colonnes = ', '.join(f"`{c}`" for c in colonnes)
+    selection = ', '.join(expressions.get(c, f"`{c}`") for c in colonnes)
+    return f"""
+    BEGIN TRANSACTION;
+
+    DELETE FROM `{table_ref}`
+    WHERE {date_col} IN UNNEST(@dates) AND {timestamp_col} IN UNNEST(@horodatages);
+
+    INSERT INTO `{table_ref}` ({liste_colonnes}, {timestamp_col}, {date_col})
+    SELECT {selection}, {horodatage}, DATE({horodatage})
+    FROM `{table_externe}`;
+
+    DELETE FROM `{table_ledger()}`
+    WHERE source = @source AND timestamp_batch IN (SELECT f.timestamp_batch FROM UNNEST(@fichiers) AS f);
+
+    INSERT INTO `{table_ledger()}` (source, timestamp_batch, table_raw, chemin, crc32c, lignes, job_id, version_schema, charge_le)
+    SELECT @source, f.timestamp_batch, @table_raw, f.chemin, f.crc32c, IFNULL(c.lignes, 0),
+           @@script.job_id, @version_schema, CURRENT_TIMESTAMP()
+    FROM UNNEST(@fichiers) AS f
+    LEFT JOIN (
+      SELECT {timestamp_col} AS horodatage, COUNT(*) AS lignes
+      FROM `{table_ref}`
+      WHERE {date_col} IN UNNEST(@dates) AND {timestamp_col} IN UNNEST(@horodatages)
+      GROUP BY horodatage
+    ) AS c ON c.horodatage = f.horodatage;
+
+    COMMIT TRANSACTION;
+    """
+
+
+def parametres_reprise(source_name: str, table_raw: str, fichiers: List[Dict], version_schema: Optional[int] = None) -> List:
+    """Paramètres de requete_reprise pour des fichiers décrits par le catalogue des batchs"""
+    return [
+        bigquery.ScalarQueryParameter('source', 'STRING', source_name),
+        bigquery.ScalarQueryParameter('table_raw', 'STRING', table_raw),
+        bigquery.ScalarQueryParameter('version_schema', 'INT64', version_schema),
+        bigquery.ArrayQueryParameter('dates', 'DATE', sorted({f['datetime'].date() for f in fichiers})),
+        bigquery.ArrayQueryParameter('horodatages', 'TIMESTAMP', [f['datetime'].replace(tzinfo=timezone.utc) for f in fichiers]),
+        bigquery.ArrayQueryParameter('fichiers', 'STRUCT', [
+            bigquery.StructQueryParameter(
+                None,
+                bigquery.ScalarQueryParameter('timestamp_batch', 'STRING', f['timestamp']),
+                bigquery.ScalarQueryParameter('horodatage', 'TIMESTAMP', f['datetime'].replace(tzinfo=timezone.utc)),
+                bigquery.ScalarQueryParameter('chemin', 'STRING', f['blob_name']),
+                bigquery.ScalarQueryParameter('crc32c', 'STRING', f.get('crc32c'))
+            )
+            for f in fichiers
+        ])
+    ]
@@ -0,0 +1,242 @@
+"""
+Manifest des batchs d'extraction
+Chaque batch (timestamp commun de l'étape 1) est décrit par un objet JSON :
+{metadata_folder}/manifests/{année}-{mois}/{timestamp}.json
+Un index ({metadata_folder}/manifests/index.json) résume tous les batchs :
+l'étape 2 et l'interface le lisent au lieu de lister raw_data/ (le catalogue
+des batchs le rapproche du listing des mois pour retrouver un batch absent)
+"""
+
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import pyarrow.parquet as pq
+from google.api_core.exceptions import PreconditionFailed
+
+from config import CONFIG, ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+VERSION_MANIFEST = 1
+
+FORMAT_TIMESTAMP = '%Y-%m-%d_%H-%M-%S'
+
+# Réécritures de l'index tentées quand une autre exécution le modifie en même temps
+TENTATIVES_INDEX = 5
+
+
+def timestamp_batch(execution_datetime: datetime) -> str:
+    """Timestamp d'un batch tel qu'il apparaît dans les noms de fichiers (2025-12-03_14-30-15)"""
+    return execution_datetime.strftime(FORMAT_TIMESTAMP)
+
+
+def dossier_manifests() -> str:
+    return f"{CONFIG['storage']['metadata_folder']}/manifests"
+
+
+def chemin_manifest(timestamp: str) -> str:
+    """Retourne le chemin GCS du manifest d'un batch"""
+    return f"{dossier_manifests()}/{timestamp[:7]}/{timestamp}.json"
+
+
+def chemin_index() -> str:
+    return f"{dossier_manifests()}/index.json"
+
+
+def empreinte_schema(schema) -> str:
+    """Empreinte courte d'un schéma Arrow (noms et types des colonnes, sans métadonnées)"""
+    description = ';'.join(f"{champ.name}:{champ.type}" for champ in schema)
+    return hashlib.sha256(description.encode()).hexdigest()[:16]
+
+
+def lire_metadonnees_parquet(blob) -> Dict:
+    """
+    Lit le pied de page d'un Parquet stocké dans GCS (nombre de lignes, schéma)
+
+    Seules les dernières pages de l'objet sont téléchargées.
+    """
+    try:
+        with blob.open('rb') as fichier:
+            metadonnees = pq.ParquetFile(fichier).metadata
+            schema = metadonnees.schema.to_arrow_schema()
+        return {
+            'lignes': metadonnees.num_rows,
+            'colonnes': len(schema),
+            'empreinte_schema': empreinte_schema(schema)
+        }
+    except Exception as e:
+        logger.warning(f"Métadonnées Parquet illisibles pour {blob.name} : {e}")
+        return {}
+
+
+def construire_manifest(execution_datetime: datetime, sources: Dict[str, Dict]) -> Dict:
+    """
+    Construit le manifest d'un batch
+
+    Args:
+        sources: {nom: {statut, chemin_gcs, octets, sha256, md5, crc32c, lignes, empreinte_schema, ...}}
+    """
+    return {
+        'version': VERSION_MANIFEST,
+        'timestamp': timestamp_batch(execution_datetime),
+        'datetime': execution_datetime.isoformat(timespec='seconds'),
+        'cree_le': datetime.now().isoformat(timespec='seconds'),
+        'sources': sources
+    }
+
+
+def fichiers_du_manifest(manifest: Dict) -> List[Dict]:
+    """Sources du batch ayant produit un fichier (les sources inchangées ou en échec n'en ont pas)"""
+    return [
+        dict(infos, source=nom)
+        for nom, infos in manifest['sources'].items()
+        if infos.get('chemin_gcs') and infos.get('statut', 'succes') == 'succes'
+    ]
+
+
+def resumer_manifest(manifest: Dict) -> Dict:
+    """Entrée d'index d'un batch : chemins, tailles et lignes des fichiers produits"""
+    return {
+        'timestamp': manifest['timestamp'],
+        'datetime': manifest['datetime'],
+        'manifest': chemin_manifest(manifest['timestamp']),
+        'fichiers': {
+            fichier['source']: {
+                'chemin_gcs': fichier['chemin_gcs'],
+                'octets': fichier.get('octets'),
+                'lignes': fichier.get('lignes'),
+                'crc32c': fichier.get('crc32c'),
+                'empreinte_schema': fichier.get('empreinte_schema')
+            }
+            for fichier in fichiers_du_manifest(manifest)
+        }
+    }
+
+
+def lire_index_generation(bucket) -> Tuple[Optional[List[Dict]], int]:
+    """
+    Lit l'index des batchs et sa génération (0 si l'index n'existe pas)
+
+    Une erreur de lecture est levée : un index illisible ne doit jamais être
+    confondu avec un index absent, puis réécrit sans l'historique.
+    """
+    blob = bucket.get_blob(chemin_index())
+    if blob is None:
+        return None, 0
+    batchs = json.loads(blob.download_as_text()).get('batchs', [])
+    return sorted(batchs, key=lambda b: b['timestamp'], reverse=True), blob.generation
+
+
+def lire_index(bucket) -> Optional[List[Dict]]:
+    """Lit l'index des batchs, du plus récent au plus ancien (None si absent, erreur levée si illisible)"""
+    return lire_index_generation(bucket)[0]
+
+
+def lire_manifest(bucket, timestamp: str) -> Optional[Dict]:
+    """Lit le manifest d'un batch (None si absent ou illisible)"""
+    blob = bucket.blob(chemin_manifest(timestamp))
+    try:
+        if not blob.exists():
+            return None
+        return json.loads(blob.download_as_text())
+    except Exception as e:
+        logger.warning(f"Manifest illisible pour le batch {timestamp} : {e}")
+        return None
+
+
+def ecrire_manifest(bucket, manifest: Dict):
+    """
+    Enregistre le manifest d'un batch puis son résumé dans l'index
+
+    L'index est réécrit sous condition de génération (if_generation_match) :
+    si une autre exécution l'a modifié entre la lecture et l'écriture, il est
+    relu et la mise à jour recommencée, sans perdre le batch de l'autre exécution.
+    """
+    blob = bucket.blob(chemin_manifest(manifest['timestamp']))
+    blob.upload_from_string(json.dumps(manifest, indent=2), content_type='application/json')
+
+    for tentative in range(1, TENTATIVES_INDEX + 1):
+        batchs, generation = lire_index_generation(bucket)
+        batchs = [b for b in (batchs or []) if b['timestamp'] != manifest['timestamp']]
+        batchs.append(resumer_manifest(manifest))
+        batchs.sort(key=lambda b: b['timestamp'])
+        try:
+            bucket.blob(chemin_index()).upload_from_string(
+                json.dumps({'version': VERSION_MANIFEST, 'batchs': batchs}, indent=2),
+                content_type='application/json',
+                if_generation_match=generation
+            )
+            break
+        except PreconditionFailed:
+            if tentative == TENTATIVES_INDEX:
+                raise
+            logger.info(f"Index des batchs modifié par une autre exécution, nouvelle tentative ({tentative}/{TENTATIVES_INDEX})")
+            time.sleep(random.uniform(0.1, 0.5) * tentative)
+    logger.info(f"Manifest du batch {manifest['timestamp']} enregistré ({len(manifest['sources'])} source(s))")
+
+
+def reconstruire_manifests(bucket) -> int:
+    """
+    Crée les manifests des batchs antérieurs à leur introduction, à partir
+    des noms de fichiers de raw_data/ (liste le bucket une seule fois)
+
+    Returns:
+        Nombre de manifests créés
+    """
+    motif = re.compile(r'.*?/(.+?)__(\d{4}-\d{2}-\d{2}_\d{2}-\d{2}-\d{2})\.(parquet|csv)$')
+    existants = {b['timestamp'] for b in (lire_index(bucket) or [])}
+    batchs = {}
+
+    for blob in bucket.list_blobs(prefix=f"{CONFIG['storage']['raw_folder']}/"):
+        match = motif.match(blob.name)
+        if not match or match.group(2) in existants:
+            continue
+        source, timestamp, extension = match.groups()
+        infos = {
+            'statut': 'succes',
+            'chemin_gcs': blob.name,
+            'octets': blob.size,
+            'md5': blob.md5_hash,
+            'crc32c': blob.crc32c,
+            'format': extension
+        }
+        if extension == 'parquet':
+            infos.update(lire_metadonnees_parquet(blob))
+        batchs.setdefault(timestamp, {})[source] = infos
+
+    for timestamp, sources in sorted(batchs.items()):
+        ecrire_manifest(bucket, construire_manifest(datetime.strptime(timestamp, FORMAT_TIMESTAMP), sources))
+
+    return len(batchs)
+
+
+if __name__ == "__main__":
+    import sys
+    from functions.storage_backend import obtenir_stockage
+
+    bucket = obtenir_stockage().conteneur()
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'reconstruire':
+        nombre = reconstruire_manifests(bucket)
+        print(f"\n{nombre} manifest(s) créé(s) à partir de {CONFIG['storage']['raw_folder']}/")
+
+    elif len(sys.argv) > 1 and sys.argv[1] == 'show':
+        manifest = lire_manifest(bucket, sys.argv[2]) if len(sys.argv) > 2 else None
+        print(json.dumps(manifest, indent=2) if manifest else "Manifest introuvable")
+
+    else:
+        batchs = lire_index(bucket) or []
+        print(f"\n{len(batchs)} batch(s) dans l'index :\n")
+        for batch in batchs:
+            print(f"  {batch['timestamp']}: {', '.join(batch['fichiers']) or 'aucun fichier'}")
+        print("\nUsage:")
+        print("  python -m functions.manifest                         # Liste les batchs de l'index")
+        print("  python -m functions.manifest show <TIMESTAMP>        # Affiche le manifest d'un batch")
+        print("  python -m functions.manifest reconstruire            # Crée les manifests des anciens batchs")
@@ -0,0 +1,207 @@
+"""
+Budget mémoire des transferts (étape 1)
+Un pool de tampons réutilisables, partagé par tout le processus, borne la mémoire
+des transferts simultanés : chaque transfert réserve ses tampons avant de démarrer
+et attend (contre-pression) tant que le budget est épuisé
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import CONFIG, ENV
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+_pool = None
+_verrou_pool = threading.Lock()
+
+
+def obtenir_parametres_memoire() -> Dict:
+    """Retourne les paramètres du budget mémoire (section execution.memoire)"""
+    parametres = CONFIG['execution'].get('memoire', {})
+    return {
+        'budget': int(parametres.get('budget_mb', 512)) * 1024 * 1024,
+        'taille_tampon': int(parametres.get('taille_tampon_mb', 16)) * 1024 * 1024
+    }
+
+
+class Reservation:
+    """
+    Part du budget accordée à un transfert, en nombre de tampons
+
+    Les tampons ne sont matérialisés que par prendre() (tampons réels réutilisés) ;
+    le reste de la réservation couvre la mémoire allouée ailleurs (réponses HTTP,
+    blocs pyarrow...). liberer() rend le tout au pool.
+    """
+
+    def __init__(self, pool: 'PoolTampons', nombre: int, souhaite: int):
+        self.pool = pool
+        self.nombre = nombre
+        self.souhaite = souhaite
+        self.pris: List[bytearray] = []
+
+    @property
+    def facteur(self) -> float:
+        """Part du besoin exprimé réellement accordée (1.0 = tout)"""
+        return self.nombre / self.souhaite if self.souhaite else 1.0
+
+    def prendre(self, nombre: int = 1) -> List[bytearray]:
+        """Matérialise des tampons de la réservation (dans la limite de celle-ci)"""
+        nombre = max(0, min(nombre, self.nombre - len(self.pris)))
+        tampons = self.pool._sortir(nombre)
+        self.pris.extend(tampons)
+        return tampons
+
+    def liberer(self):
+        if self.nombre:
+            self.pool.liberer(self.nombre, self.pris)
+        self.nombre, self.pris = 0, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.liberer()
+
+
+class PoolTampons:
+    """
+    Budget en octets découpé en tampons de taille fixe, avec réutilisation des tampons
+
+    reserver() accorde entre minimum et souhaite tampons selon la place disponible
+    et bloque tant que le minimum n'est pas disponible. Les tampons matérialisés
+    sont recyclés d'un transfert à l'autre ; les tampons libres ne sont conservés que
+    dans la limite du budget non réservé.
+    """
+
+    def __init__(self, budget: int, taille_tampon: int):
+        self.taille_tampon = taille_tampon
+        self.capacite = max(2, budget // taille_tampon)
+        self.libres: List[bytearray] = []
+        self.alloues = 0
+        self.en_cours = 0
+        self.pic = 0
+        self.attente = 0.0
+        self.condition = threading.Condition()
+
+    def tampons_pour(self, octets: int) -> int:
+        """Nombre de tampons couvrant octets"""
+        return max(1, math.ceil(octets / self.taille_tampon))
+
+    def reserver(self, souhaite: int, minimum: int = 1) -> Reservation:
+        if minimum > self.capacite:
+            logger.warning(
+                f"Budget mémoire ({self.capacite} tampon(s)) inférieur au minimum d'un transfert "
+                f"({minimum} tampon(s)) : augmenter execution.memoire.budget_mb"
+            )
+        minimum = min(max(1, minimum), self.capacite)
+        souhaite = min(max(minimum, souhaite), self.capacite)
+
+        debut = time.perf_counter()
+        with self.condition:
+            if self.capacite - self.en_cours < minimum:
+                logger.info(f"Budget mémoire épuisé, attente de {minimum} tampon(s)...")
+            while self.capacite - self.en_cours < minimum:
+                self.condition.wait()
+            nombre = min(souhaite, self.capacite - self.en_cours)
+            self.en_cours += nombre
+            self.pic = max(self.pic, self.en_cours)
+            self.attente += time.perf_counter() - debut
+            # Tampons libres au-delà du budget restant : rendus au ramasse-miettes
+            del self.libres[self.capacite - self.en_cours:]
+
+        return Reservation(self, nombre, souhaite)
+
+    def _sortir(self, nombre: int) -> List[bytearray]:
+        with self.condition:
+            recycles = [self.libres.pop() for _ in range(min(nombre, len(self.libres)))]
+            self.alloues += nombre - len(recycles)
+        # Allocation hors verrou : les nouveaux tampons rejoindront ensuite le pool
+        return recycles + [bytearray(self.taille_tampon) for _ in range(nombre - len(recycles))]
+
+    def liberer(self, nombre: int, tampons: List[bytearray]):
+        with self.condition:
+            self.en_cours -= nombre
+            self.libres.extend(tampons)
+            del self.libres[self.capacite - self.en_cours:]
+            self.condition.notify_all()
+
+    def statistiques(self) -> Dict:
+        mb = self.taille_tampon / 1024**2
+        with self.condition:
+            return {
+                'budget_mb': self.capacite * mb,
+                'taille_tampon_mb': mb,
+                'pic_mb': self.pic * mb,
+                'alloue_mb': self.alloues * mb,
+                'attente_s': self.attente
+            }
+
+
+def obtenir_pool() -> PoolTampons:
+    """Pool de tampons du processus (créé à la première utilisation)"""
+    global _pool
+    with _verrou_pool:
+        if _pool is None:
+            parametres = obtenir_parametres_memoire()
+            _pool = PoolTampons(parametres['budget'], parametres['taille_tampon'])
+            logger.info(
+                f"Budget mémoire des transferts : {_pool.capacite} tampon(s) de "
+                f"{parametres['taille_tampon'] / 1024**2:.0f} MB"
+            )
+        return _pool
+
+
+def rss_courant_mb() -> Optional[float]:
+    """Mémoire résidente actuelle du processus (None si indisponible, hors Linux)"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def pic_rss_processus_mb() -> Optional[float]:
+    """Pic de mémoire résidente depuis le démarrage du processus"""
+    if resource is None:
+        return None
+    # ru_maxrss est en Ko sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class SuiviRss:
+    """Échantillonne la mémoire résidente pendant un run pour en donner le pic"""
+
+    def __init__(self, intervalle: float = 0.2):
+        self.intervalle = intervalle
+        self.pic = rss_courant_mb()
+        self._arret = threading.Event()
+        self._thread = threading.Thread(target=self._echantillonner, name="suivi-rss", daemon=True)
+
+    def _echantillonner(self):
+        while not self._arret.wait(self.intervalle):
+            rss = rss_courant_mb()
+            if rss is not None:
+                self.pic = max(self.pic or 0.0, rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._arret.set()
+        self._thread.join()
+        rss = rss_courant_mb()
+        if rss is not None:
+            self.pic = max(self.pic or 0.0, rss)
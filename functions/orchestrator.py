@@ -7,9 +7,10 @@ import logging
 from typing import Optional
 from datetime import datetime
 
-from functions.step1_download import download_data
+from functions.step1_download import download_data, sources_modifiees
 from functions.step2_load import charger_batch_vers_bigquery
 from functions.step3_transform import transform_data, obtenir_timestamps_disponibles
+from functions.batch_catalog import obtenir_catalogue
 
 from config import ENV
 
@@ -50,6 +51,10 @@ def run_pipeline(
             else:
                 logger.error("Étape 1 : Échec du téléchargement")
                 return False
+            
+            if not sources_modifiees(resultats):
+                logger.info("Aucune source modifiée depuis le dernier batch : étapes 2 et 3 ignorées")
+                return True
                 
         except Exception as e:
             logger.error(f"Étape 1 : Erreur - {e}")
@@ -230,6 +235,13 @@ if __name__ == "__main__":
             # python -m functions.orchestrator list
             success = run_step3_only(list_only=True)
         
+        elif cmd == "batchs":
+            # python -m functions.orchestrator batchs
+            batchs = obtenir_catalogue().lister()
+            for ts in sorted(batchs, reverse=True):
+                print(f"  {ts}: {', '.join(sorted(f['source'] for f in batchs[ts]))}")
+            success = bool(batchs)
+        
         else:
             print("Usage:")
             print("  python -m functions.orchestrator               # Pipeline complet")
@@ -238,6 +250,7 @@ if __name__ == "__main__":
             print("  python -m functions.orchestrator step3         # Transformation seule (timestamp récent)")
             print("  python -m functions.orchestrator step3 <ts>    # Transformation avec timestamp spécifique")
             print("  python -m functions.orchestrator list          # Liste les timestamps disponibles")
+            print("  python -m functions.orchestrator batchs        # Liste les batchs extraits (catalogue GCS)")
             sys.exit(1)
     
     sys.exit(0 if success else 1)
\ No newline at end of file
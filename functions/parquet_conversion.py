@@ -0,0 +1,553 @@
+"""
+Conversion CSV → Parquet en streaming pendant l'ingestion (étape 1)
+Le CSV est lu par blocs (mémoire bornée, parsing multi-thread pyarrow)
+et chaque bloc est écrit comme row group Parquet directement dans le writer GCS
+Les archives zip / gzip sont décompressées au fil de l'eau avant conversion
+"""
+
+import io
+import itertools
+import logging
+import queue
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+from config import CONFIG, ENV
+from functions.decompression import detecter_compression, ouvrir_membres
+from functions.schema_registry import types_arrow_declares
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+
+class TypesCsvIncompatibles(ValueError):
+    """Une valeur du CSV ne respecte pas le type déclaré de sa colonne"""
+
+
+def obtenir_colonnes_projection(source: Optional[Dict] = None) -> Optional[List[str]]:
+    """
+    Retourne les colonnes à conserver à l'ingestion pour une source (None = toutes)
+
+    La projection s'active par source (clé "projection") ou globalement
+    (columns.projection) ; elle garde columns.keep, l'identifiant et les colonnes d'historique.
+    """
+    actif = CONFIG['columns'].get('projection', False)
+    if source and 'projection' in source:
+        actif = source['projection']
+    if not actif:
+        return None
+
+    colonnes = [CONFIG['columns']['id']] + list(CONFIG['columns']['keep'])
+    colonnes += [CONFIG['historique']['colonne_timestamp'], CONFIG['historique']['colonne_date']]
+    return list(dict.fromkeys(colonnes))
+
+
+def obtenir_parametres_conversion(source: Optional[Dict] = None) -> Dict:
+    """Retourne les paramètres de conversion (section execution.conversion_parquet, surchargeable par source)"""
+    parametres = dict(CONFIG['execution'].get('conversion_parquet', {}))
+    if source:
+        parametres.update(source.get('conversion', {}))
+    return {
+        'actif': parametres.get('actif', False),
+        'taille_bloc': int(parametres.get('taille_bloc_mb', 16)) * 1024 * 1024,
+        'compression': parametres.get('compression', 'zstd'),
+        'niveau_compression': parametres.get('niveau_compression'),
+        'lignes_row_group': int(parametres.get('lignes_row_group', 0) or 0),
+        'taille_page': int(parametres.get('taille_page_kb', 1024)) * 1024,
+        'dictionnaire': parametres.get('dictionnaire', True),
+        'delimiteur': parametres.get('delimiteur'),
+        'colonnes_texte': list(parametres.get('colonnes_texte', [])),
+        # Types du registre des schémas ; les colonnes non déclarées restent en texte
+        'types_declares': types_arrow_declares(source['name']) if source and source.get('name') else {},
+        'tout_texte': False,
+        'colonnes': obtenir_colonnes_projection(source)
+    }
+
+
+def options_ecriture_parquet(parametres: Dict) -> Dict:
+    """
+    Traduit les paramètres d'encodage en options de pq.ParquetWriter
+
+    dictionnaire : true / false, ou liste des colonnes à encoder par dictionnaire
+    (colonnes de codes très répétitifs).
+    """
+    dictionnaire = parametres.get('dictionnaire', True)
+    return {
+        'compression': parametres.get('compression', 'zstd'),
+        'compression_level': parametres.get('niveau_compression'),
+        'data_page_size': parametres.get('taille_page', 1024 * 1024),
+        'use_dictionary': list(dictionnaire) if isinstance(dictionnaire, (list, tuple)) else bool(dictionnaire)
+    }
+
+
+def decrire_encodage(parametres: Dict) -> str:
+    """Résumé lisible des paramètres d'encodage (pour les logs)"""
+    dictionnaire = parametres.get('dictionnaire', True)
+    if isinstance(dictionnaire, (list, tuple)):
+        dictionnaire = f"{len(dictionnaire)} colonne(s)"
+    niveau = parametres.get('niveau_compression')
+    row_group = parametres.get('lignes_row_group') or 'bloc lu'
+    return (
+        f"compression {parametres.get('compression', 'zstd')}{f' ({niveau})' if niveau else ''}, "
+        f"row group {row_group}, page {parametres.get('taille_page', 1024 * 1024) // 1024} KB, "
+        f"dictionnaire {dictionnaire}"
+    )
+
+
+class EcrivainParquet:
+    """
+    ParquetWriter qui regroupe les lots en row groups de lignes_row_group lignes
+
+    Sans lignes_row_group, chaque lot écrit devient un row group (comportement pyarrow).
+    La mémoire retenue est bornée à un row group.
+    """
+
+    def __init__(self, sortie, schema: pa.Schema, parametres: Dict):
+        self.ecrivain = pq.ParquetWriter(sortie, schema, **options_ecriture_parquet(parametres))
+        self.lignes_row_group = parametres.get('lignes_row_group') or 0
+        self.en_attente = []
+        self.lignes_en_attente = 0
+
+    @property
+    def schema(self) -> pa.Schema:
+        return self.ecrivain.schema
+
+    def ecrire(self, lot):
+        """Écrit un RecordBatch ou une Table"""
+        if not self.lignes_row_group:
+            self.ecrivain.write(lot)
+            return
+        self.en_attente.append(lot)
+        self.lignes_en_attente += lot.num_rows
+        if self.lignes_en_attente >= self.lignes_row_group:
+            self._vider(complet=False)
+
+    def _vider(self, complet: bool):
+        table = pa.concat_tables(
+            pa.Table.from_batches([lot]) if isinstance(lot, pa.RecordBatch) else lot
+            for lot in self.en_attente
+        )
+        # Les lignes au-delà du dernier row group complet restent en attente
+        reste = table.num_rows if complet else table.num_rows - table.num_rows % self.lignes_row_group
+        if reste:
+            self.ecrivain.write_table(table.slice(0, reste), row_group_size=self.lignes_row_group)
+        self.en_attente = [table.slice(reste)] if reste < table.num_rows else []
+        self.lignes_en_attente = table.num_rows - reste
+
+    def close(self):
+        try:
+            if self.en_attente:
+                self._vider(complet=True)
+        finally:
+            self.ecrivain.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def filtrer_colonnes(disponibles: List[str], colonnes: Optional[List[str]]) -> List[str]:
+    """Colonnes projetées présentes dans la source, dans l'ordre de la source"""
+    if colonnes is None:
+        return list(disponibles)
+    conservees = [nom for nom in disponibles if nom in colonnes]
+    if not conservees:
+        raise ValueError("Aucune colonne de columns.keep n'est présente dans la source")
+    return conservees
+
+
+def detecter_format(source: Optional[Dict], url: str, content_type: str = '', content_disposition: str = '') -> str:
+    """
+    Détermine le format d'une source : 'parquet', 'csv' ou 'inconnu'
+
+    La clé "format" de la source est prioritaire ; sinon on s'appuie sur
+    l'URL, le Content-Type et le nom de fichier du Content-Disposition.
+    """
+    if source and source.get('format', 'auto') != 'auto':
+        return source['format']
+
+    indices = ' '.join([url, content_type or '', content_disposition or '']).lower()
+    if 'parquet' in indices:
+        return 'parquet'
+    if 'csv' in indices or 'text/plain' in indices:
+        return 'csv'
+    return 'inconnu'
+
+
+def detecter_format_contenu(echantillon: bytes) -> str:
+    """Devine le format à partir des premiers octets : Parquet (PAR1) ou texte délimité"""
+    if echantillon.startswith(b"PAR1"):
+        return 'parquet'
+    entete = echantillon.split(b"\n", 1)[0]
+    try:
+        entete.decode('utf-8')
+    except UnicodeDecodeError:
+        return 'inconnu'
+    if any(separateur in entete for separateur in (b",", b";", b"\t", b"|")):
+        return 'csv'
+    return 'inconnu'
+
+
+class TubeOctets:
+    """
+    Tube borné entre un producteur (push : write) et un consommateur (pull : read)
+
+    Permet de brancher le téléchargement (qui pousse des chunks) sur un lecteur
+    pyarrow (qui tire des octets) sans jamais dépasser capacite chunks en mémoire.
+    """
+
+    def __init__(self, capacite: int = 4):
+        self.file = queue.Queue(maxsize=capacite)
+        self.reste = b""
+        self.fin = False
+        self.erreur = None
+        self.abandonne = False
+        self.closed = False
+
+    # Côté producteur
+    def write(self, donnees: bytes) -> int:
+        if donnees:
+            self._deposer(bytes(donnees))
+        return len(donnees)
+
+    def fermer(self, erreur: Optional[BaseException] = None):
+        self.erreur = erreur
+        self._deposer(None)
+
+    def _deposer(self, element):
+        while True:
+            if self.abandonne:
+                raise IOError("Lecture du flux abandonnée par le consommateur")
+            try:
+                self.file.put(element, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def abandonner(self):
+        """Débloque le producteur quand le consommateur s'arrête en cours de route"""
+        self.abandonne = True
+        while not self.file.empty():
+            self.file.get_nowait()
+
+    # Côté consommateur
+    def readable(self) -> bool:
+        return True
+
+    def read(self, taille: int = -1) -> bytes:
+        morceaux = [self.reste] if self.reste else []
+        disponible = len(self.reste)
+        self.reste = b""
+
+        while (taille < 0 or disponible < taille) and not self.fin:
+            chunk = self.file.get()
+            if chunk is None:
+                self.fin = True
+                if self.erreur:
+                    raise IOError(f"Flux source interrompu : {self.erreur}")
+                break
+            morceaux.append(chunk)
+            disponible += len(chunk)
+
+        donnees = b"".join(morceaux)
+        if 0 <= taille < len(donnees):
+            donnees, self.reste = donnees[:taille], donnees[taille:]
+        return donnees
+
+    def close(self):
+        self.closed = True
+
+
+class FluxPrefixe:
+    """Flux en lecture qui restitue d'abord un préfixe déjà lu, puis le flux sous-jacent"""
+
+    def __init__(self, prefixe: bytes, flux):
+        self.prefixe = io.BytesIO(prefixe)
+        self.flux = flux
+        self.closed = False
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, taille: int = -1) -> bytes:
+        donnees = self.prefixe.read(taille)
+        if taille < 0:
+            return donnees + self.flux.read()
+        if len(donnees) < taille:
+            donnees += self.flux.read(taille - len(donnees))
+        return donnees
+
+    def close(self):
+        self.closed = True
+
+
+class SortiePyarrow:
+    """Adapte un writer (session GCS, tube...) à l'interface fichier attendue par pyarrow"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.closed = False
+        self.position = 0
+
+    def write(self, donnees) -> int:
+        donnees = bytes(donnees)
+        self.writer.write(donnees)
+        self.position += len(donnees)
+        return len(donnees)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # Le writer sous-jacent est finalisé par l'appelant (session d'upload)
+        self.closed = True
+
+
+def detecter_delimiteur(echantillon: bytes) -> str:
+    """Devine le délimiteur CSV à partir de la ligne d'en-tête"""
+    entete = echantillon.split(b"\n", 1)[0]
+    candidats = [b",", b";", b"\t", b"|"]
+    return max(candidats, key=entete.count).decode()
+
+
+def types_colonnes(echantillon: bytes, delimiteur: str, parametres: Dict) -> Dict[str, pa.DataType]:
+    """
+    Type de chaque colonne de l'en-tête : celui du registre des schémas s'il est
+    déclaré, sinon texte
+
+    Aucun type n'est deviné sur un échantillon : une valeur inattendue plus loin
+    dans le fichier (décimal, "NA", code à zéros initiaux) ne doit ni faire échouer
+    la conversion ni perdre d'information. Les colonnes de colonnes_texte, ou
+    toutes avec tout_texte, restent en texte même si le registre les déclare.
+    """
+    entete = echantillon.split(b"\n", 1)[0] + b"\n"
+    noms = pacsv.read_csv(io.BytesIO(entete), parse_options=pacsv.ParseOptions(delimiter=delimiteur)).column_names
+    declares = {} if parametres.get('tout_texte') else parametres.get('types_declares', {})
+    return {
+        nom: pa.string() if nom in parametres['colonnes_texte'] else declares.get(nom, pa.string())
+        for nom in noms
+    }
+
+
+def lire_echantillon(flux, taille: int) -> bytes:
+    """Lit jusqu'à taille octets (moins uniquement en fin de flux)"""
+    morceaux = []
+    lus = 0
+    while lus < taille:
+        morceau = flux.read(taille - lus)
+        if not morceau:
+            break
+        morceaux.append(morceau)
+        lus += len(morceau)
+    return b"".join(morceaux)
+
+
+def ouvrir_lecteur_csv(flux, parametres: Dict, types: Optional[Dict[str, pa.DataType]] = None):
+    """
+    Ouvre un lecteur CSV en streaming sur flux
+
+    Les types viennent du registre des schémas (types_colonnes), sauf s'ils
+    sont fournis (membres suivants d'une archive).
+
+    Returns:
+        (lecteur pyarrow, types des colonnes, délimiteur)
+    """
+    taille_bloc = parametres['taille_bloc']
+    echantillon = lire_echantillon(flux, taille_bloc)
+    if not echantillon:
+        raise ValueError("Flux CSV vide")
+
+    delimiteur = parametres['delimiteur'] or detecter_delimiteur(echantillon)
+    if types is None:
+        types = types_colonnes(echantillon, delimiteur, parametres)
+        conservees = filtrer_colonnes(list(types), parametres.get('colonnes'))
+        types = {nom: types[nom] for nom in conservees}
+
+    lecteur = pacsv.open_csv(
+        FluxPrefixe(echantillon, flux),
+        read_options=pacsv.ReadOptions(block_size=taille_bloc, use_threads=True),
+        parse_options=pacsv.ParseOptions(delimiter=delimiteur),
+        convert_options=pacsv.ConvertOptions(
+            column_types=types,
+            include_columns=list(types),
+            strings_can_be_null=True
+        )
+    )
+    return lecteur, types, delimiteur
+
+
+def convertir_csv_en_parquet(membres: Iterable, writer, parametres: Dict) -> Dict:
+    """
+    Convertit un ou plusieurs flux CSV de même schéma en un seul Parquet écrit dans writer
+
+    Returns:
+        dict avec le nombre de lignes et de colonnes écrites
+    """
+    lignes = 0
+    types = None
+    ecrivain = None
+    sortie = pa.PythonFile(SortiePyarrow(writer), mode='w')
+
+    try:
+        for flux in membres:
+            lecteur, types_membre, delimiteur = ouvrir_lecteur_csv(flux, parametres, types)
+
+            if ecrivain is None:
+                types = types_membre
+                if parametres.get('colonnes') is not None:
+                    logger.info(f"Projection : {len(types)} colonne(s) conservée(s)")
+                logger.info(
+                    f"Conversion CSV → Parquet : {len(types)} colonnes, délimiteur '{delimiteur}', "
+                    f"blocs de {parametres['taille_bloc'] / 1024**2:.0f} MB, {decrire_encodage(parametres)}"
+                )
+                ecrivain = EcrivainParquet(sortie, lecteur.schema, parametres)
+            elif not lecteur.schema.equals(ecrivain.schema):
+                raise ValueError("Les membres CSV de l'archive n'ont pas le même schéma")
+
+            try:
+                for batch in lecteur:
+                    ecrivain.ecrire(batch)
+                    lignes += batch.num_rows
+            except pa.ArrowInvalid as e:
+                if any(not pa.types.is_string(t) for t in types.values()):
+                    raise TypesCsvIncompatibles(f"Valeur incompatible avec le type déclaré après {lignes} lignes : {e}") from e
+                raise
+    finally:
+        if ecrivain is not None:
+            ecrivain.close()
+
+    if ecrivain is None:
+        raise ValueError("Aucun membre CSV à convertir")
+
+    logger.info(f"Conversion terminée : {lignes} lignes")
+    return {'lignes': lignes, 'colonnes': len(types), 'format': 'parquet'}
+
+
+def projeter_parquet(fichier, writer, parametres: Dict) -> Dict:
+    """
+    Réécrit un Parquet (fichier positionnable, ex. FichierHttpDistant) en ne gardant
+    que les colonnes projetées, row group par row group
+
+    Seules les colonnes utiles sont lues : avec un fichier distant, les autres
+    ne sont jamais téléchargées.
+    """
+    parquet = pq.ParquetFile(pa.PythonFile(fichier, mode='r'))
+    conservees = filtrer_colonnes(parquet.schema_arrow.names, parametres.get('colonnes'))
+
+    logger.info(
+        f"Projection Parquet : {len(conservees)}/{len(parquet.schema_arrow.names)} colonne(s), "
+        f"{parquet.num_row_groups} row group(s)"
+    )
+
+    lignes = 0
+    sortie = pa.PythonFile(SortiePyarrow(writer), mode='w')
+    schema = pa.schema([parquet.schema_arrow.field(nom) for nom in conservees])
+    with EcrivainParquet(sortie, schema, parametres) as ecrivain:
+        for index in range(parquet.num_row_groups):
+            table = parquet.read_row_group(index, columns=conservees)
+            ecrivain.ecrire(table)
+            lignes += table.num_rows
+
+    logger.info(f"Projection terminée : {lignes} lignes")
+    return {'lignes': lignes, 'colonnes': len(conservees), 'format': 'parquet'}
+
+
+def copier_flux(flux, writer, taille_morceau: int = 8 * 1024 * 1024) -> int:
+    """Recopie un flux tel quel dans writer, par morceaux"""
+    total = 0
+    while True:
+        morceau = flux.read(taille_morceau)
+        if not morceau:
+            return total
+        writer.write(morceau)
+        total += len(morceau)
+
+
+def traiter_flux_source(
+    produire: Callable[[TubeOctets], object],
+    writer,
+    conversion: Dict,
+    decompression: Dict,
+    format_source: str
+) -> Dict:
+    """
+    Branche un producteur d'octets (téléchargement) sur la chaîne d'ingestion :
+    décompression zip/gzip éventuelle puis conversion CSV → Parquet
+
+    Le producteur tourne dans un thread et pousse les octets dans un tube borné
+    que la chaîne consomme ; une erreur d'un côté interrompt l'autre. Une erreur
+    du producteur est remontée telle quelle plutôt que l'IOError qu'elle provoque
+    côté lecture.
+    """
+    tube = TubeOctets()
+
+    def producteur():
+        try:
+            produire(tube)
+            tube.fermer()
+        except BaseException as e:
+            if not tube.abandonne:
+                tube.fermer(e)
+
+    thread = threading.Thread(target=producteur, name="ingestion-source", daemon=True)
+    thread.start()
+
+    try:
+        entete = lire_echantillon(tube, 4)
+        flux = FluxPrefixe(entete, tube)
+        compression = detecter_compression(entete) if decompression['actif'] else None
+        if compression:
+            logger.info(f"Archive {compression} détectée, décompression en streaming")
+
+        def identifier(nom: Optional[str], lecteur):
+            """Format d'un membre : nom de fichier, sinon format de la source, sinon contenu"""
+            format_membre = detecter_format(None, nom) if nom else format_source
+            if format_membre == 'inconnu':
+                echantillon = lire_echantillon(lecteur, 4096)
+                lecteur = FluxPrefixe(echantillon, lecteur)
+                format_membre = detecter_format_contenu(echantillon)
+            return format_membre, lecteur
+
+        membres = (
+            (nom,) + identifier(nom, lecteur)
+            for nom, lecteur in ouvrir_membres(flux, compression, decompression['membres'])
+        )
+
+        premier = next(membres, None)
+        if premier is None:
+            raise ValueError("Aucun membre de l'archive ne correspond au motif configuré")
+
+        if conversion['actif'] and (premier[1] == 'csv' or compression == 'zip'):
+            def membres_csv():
+                for nom, format_membre, lecteur in itertools.chain([premier], membres):
+                    if format_membre == 'csv':
+                        yield lecteur
+                    else:
+                        logger.warning(f"Membre non CSV ignoré : {nom}")
+
+            stats = convertir_csv_en_parquet(membres_csv(), writer, conversion)
+        else:
+            nom, format_membre, lecteur = premier
+            octets = copier_flux(lecteur, writer)
+            if next(membres, None) is not None:
+                raise ValueError("Archive à plusieurs membres : seule la conversion Parquet peut les regrouper")
+            stats = {'octets': octets, 'format': format_membre}
+
+        stats['compression'] = compression
+        return stats
+    except Exception as e:
+        if tube.erreur is not None and tube.erreur is not e:
+            raise tube.erreur from e
+        raise
+    finally:
+        tube.abandonner()
+        thread.join()
@@ -0,0 +1,522 @@
+"""
+Téléchargement multi-connexions par plages HTTP (Range)
+Récupère N plages d'octets en parallèle et les réassemble dans l'ordre
+vers un writer (blob GCS ouvert en écriture)
+"""
+
+import requests
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from collections import deque
+import logging
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import CONFIG, ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+_sessions = threading.local()
+
+# Lecture d'un segment par morceaux de cette taille (permet de suivre et d'abandonner la lecture)
+TAILLE_LECTURE = 1024 * 1024
+
+
+def obtenir_parametres_plages(source: Optional[Dict] = None) -> Dict:
+    """Retourne les paramètres du moteur par plages (section execution.plages, surchargeable par source)"""
+    parametres = dict(CONFIG['execution'].get('plages', {}))
+    if source:
+        parametres.update(source.get('plages', {}))
+    return {
+        'actif': parametres.get('actif', False),
+        'connexions': max(1, int(parametres.get('connexions', 4))),
+        'taille_segment': int(parametres.get('taille_segment_mb', 16)) * 1024 * 1024,
+        'taille_min': int(parametres.get('taille_min_mb', 64)) * 1024 * 1024
+    }
+
+
+def _session() -> requests.Session:
+    """Retourne une session HTTP propre au thread courant (keep-alive par connexion)"""
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    return _sessions.session
+
+
+def detecter_support_range(url: str, timeout: int) -> Optional[Dict]:
+    """
+    Vérifie si le serveur accepte les requêtes par plages
+
+    Returns:
+        dict avec l'URL finale (après redirections) et la taille totale,
+        ou None si les plages ne sont pas supportées
+    """
+    try:
+        response = requests.head(url, allow_redirects=True, timeout=timeout)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        logger.info(f"HEAD impossible ({e}), téléchargement en flux unique")
+        return None
+
+    accept_ranges = response.headers.get('accept-ranges', '').lower()
+    taille = int(response.headers.get('content-length', 0) or 0)
+
+    if 'bytes' not in accept_ranges or taille <= 0:
+        return None
+
+    # Un contenu ré-encodé à la volée (gzip de transport) ne peut pas être découpé
+    if response.headers.get('content-encoding', 'identity').lower() not in ('identity', ''):
+        return None
+
+    return {
+        'url': response.url,
+        'taille': taille,
+        'etag': response.headers.get('etag'),
+        'last_modified': response.headers.get('last-modified'),
+        'content_type': response.headers.get('content-type', ''),
+        'content_disposition': response.headers.get('content-disposition', '')
+    }
+
+
+def validateur_plages(infos: Dict) -> Optional[str]:
+    """
+    Validateur à envoyer en If-Range avec chaque plage : ETag fort, sinon Last-Modified
+
+    Un ETag faible (W/...) n'est pas accepté par If-Range (RFC 9110).
+    """
+    etag = infos.get('etag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return infos.get('last_modified')
+
+
+def decouper_en_segments(taille_totale: int, taille_segment: int, depart: int = 0) -> List[Tuple[int, int]]:
+    """Découpe [depart, taille_totale) en plages inclusives (debut, fin) de taille_segment octets"""
+    return [
+        (debut, min(debut + taille_segment, taille_totale) - 1)
+        for debut in range(depart, taille_totale, taille_segment)
+    ]
+
+
+class RequeteAbandonnee(Exception):
+    """Lecture d'une plage interrompue parce qu'une relance l'a devancée"""
+
+
+class FichierModifie(Exception):
+    """
+    Le fichier distant a changé depuis le HEAD (réponse 200 à un If-Range, ETag différent)
+
+    Les plages déjà reçues appartiennent à l'ancienne version : le transfert doit
+    repartir du début. Volontairement hors RequestException pour ne pas être
+    retentée plage par plage.
+    """
+
+
+class SuiviSegment:
+    """Progression d'une requête de plage, partagée avec le thread qui la lit"""
+
+    def __init__(self):
+        self.lus = 0
+        self.debut = None
+        self.fin = None
+        self.abandon = threading.Event()
+
+    @property
+    def duree(self) -> float:
+        """Durée de la tentative en cours ou terminée (0 tant que la requête n'est pas partie)"""
+        if self.debut is None:
+            return 0.0
+        return (self.fin or time.perf_counter()) - self.debut
+
+
+class _LimiteConnexions:
+    """Nombre de requêtes de plages simultanées, réglable pendant le téléchargement"""
+
+    def __init__(self, reglage):
+        self.reglage = reglage
+        self.actives = 0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while self.actives >= self.reglage.connexions:
+                self.condition.wait(0.5)
+            self.actives += 1
+
+    def __exit__(self, *exc):
+        with self.condition:
+            self.actives -= 1
+            self.condition.notify_all()
+
+
+def _lire_dans_tampon(
+    response: requests.Response,
+    tampon: bytearray,
+    attendu: int,
+    suivi: Optional[SuiviSegment] = None
+) -> memoryview:
+    """Lit le corps de la réponse directement dans un tampon réutilisable (sans allocation)"""
+    vue = memoryview(tampon)[:attendu]
+    lus = 0
+    while lus < attendu:
+        if suivi is not None and suivi.abandon.is_set():
+            raise RequeteAbandonnee()
+        n = response.raw.readinto(vue[lus:lus + TAILLE_LECTURE])
+        if not n:
+            break
+        lus += n
+        if suivi is not None:
+            suivi.lus = lus
+    if lus != attendu or response.raw.read(1):
+        raise requests.exceptions.RequestException(f"Plage incomplète : {lus}/{attendu} octets")
+    if suivi is not None:
+        suivi.fin = time.perf_counter()
+    return vue
+
+
+def telecharger_segment(
+    url: str,
+    debut: int,
+    fin: int,
+    timeout: int,
+    tentatives: int = 1,
+    tampon: Optional[bytearray] = None,
+    suivi: Optional[SuiviSegment] = None,
+    validateur: Optional[str] = None
+):
+    """
+    Télécharge la plage [debut, fin] et vérifie que le serveur a bien respecté la plage
+
+    Avec un tampon (pool mémoire), le segment y est lu et une vue sur le tampon
+    est retournée ; sinon, les octets de la réponse. suivi expose la progression
+    de la lecture (réglage automatique) et permet de l'abandonner.
+    Avec un validateur (validateur_plages), la plage est demandée en If-Range :
+    si le fichier a changé, FichierModifie est levée au lieu de mélanger deux versions.
+    """
+    attendu = fin - debut + 1
+    derniere_erreur = None
+    if suivi is not None and tampon is None:
+        tampon = bytearray(attendu)
+
+    headers = {'Range': f"bytes={debut}-{fin}"}
+    if validateur:
+        headers['If-Range'] = validateur
+
+    for tentative in range(1, tentatives + 1):
+        try:
+            if suivi is not None:
+                suivi.lus, suivi.debut, suivi.fin = 0, time.perf_counter(), None
+            response = _session().get(
+                url,
+                headers=headers,
+                timeout=timeout,
+                stream=tampon is not None
+            )
+            try:
+                response.raise_for_status()
+
+                etag = response.headers.get('etag')
+                if validateur and response.status_code == 200:
+                    raise FichierModifie(f"Plage {debut}-{fin} : fichier modifié à la source (If-Range non satisfait)")
+                if validateur and validateur.startswith('"') and etag and etag != validateur:
+                    raise FichierModifie(f"Plage {debut}-{fin} : ETag modifié à la source ({validateur} → {etag})")
+                if response.status_code != 206:
+                    raise requests.exceptions.RequestException(
+                        f"Plage ignorée par le serveur (HTTP {response.status_code})"
+                    )
+                if tampon is not None:
+                    return _lire_dans_tampon(response, tampon, attendu, suivi)
+                if len(response.content) != attendu:
+                    raise requests.exceptions.RequestException(
+                        f"Plage incomplète : {len(response.content)}/{attendu} octets"
+                    )
+                return response.content
+            finally:
+                response.close()
+
+        except requests.exceptions.RequestException as e:
+            derniere_erreur = e
+            logger.warning(f"Plage {debut}-{fin} : tentative {tentative}/{tentatives} échouée ({e})")
+
+    raise derniere_erreur
+
+
+class _Segment:
+    """Segment en vol : requête principale et éventuelle relance (hedged request)"""
+
+    def __init__(self, debut: int, fin: int, tampon: Optional[bytearray], future, suivi: Optional[SuiviSegment]):
+        self.debut = debut
+        self.fin = fin
+        self.tampon = tampon
+        self.future = future
+        self.suivi = suivi
+        self.relance = None
+
+    @property
+    def futures(self) -> List:
+        return [self.future] + ([self.relance[0]] if self.relance else [])
+
+
+def _attendre_segment(segment: _Segment, delai: Optional[float]):
+    """
+    Attend le premier résultat valide du segment (requête principale ou relance)
+
+    Returns:
+        (données, True si la relance a gagné), ou None si rien n'est arrivé dans le délai
+    """
+    while True:
+        en_attente = [f for f in segment.futures if not f.done()]
+        reussies = [f for f in segment.futures if f.done() and f.exception() is None]
+        if reussies:
+            return reussies[0].result(), reussies[0] is not segment.future
+        if not en_attente:
+            # Toutes les requêtes ont échoué : on remonte l'erreur de la requête principale
+            segment.future.result()
+        termines, _ = wait(en_attente, timeout=delai, return_when=FIRST_COMPLETED)
+        if not termines:
+            return None
+
+
+def telecharger_par_plages(
+    url: str,
+    taille_totale: int,
+    writer,
+    connexions: int,
+    taille_segment: int,
+    timeout: int,
+    progression: Optional[Callable[[int], None]] = None,
+    depart: int = 0,
+    tampons: Optional[List[bytearray]] = None,
+    reglage=None,
+    validateur: Optional[str] = None
+) -> int:
+    """
+    Télécharge un fichier par plages en parallèle et l'écrit dans l'ordre dans writer
+
+    Au plus 2 × connexions segments sont en vol ou en attente d'écriture,
+    la mémoire reste donc bornée quelle que soit la taille du fichier.
+    Avec des tampons (pool mémoire), chaque segment est lu dans un tampon réutilisé :
+    la fenêtre est alors le nombre de tampons et un segment ne dépasse pas un tampon.
+    Avec un réglage automatique (ReglageAuto), les connexions et la taille des segments
+    suivent le débit mesuré, et le segment qui bloque l'écriture est relancé sur une
+    autre connexion s'il est trop lent (un tampon est alors gardé pour la relance).
+    depart permet de reprendre un transfert à partir d'un octet déjà confirmé.
+    validateur (ETag ou Last-Modified du HEAD) est envoyé en If-Range avec chaque
+    plage : FichierModifie signale que le fichier doit être repris depuis le début.
+
+    Returns:
+        Position atteinte dans le fichier (taille_totale en cas de succès)
+    """
+    libres = deque(tampons or [])
+    reserve_relance = deque()
+    if libres:
+        taille_tampon = min(len(t) for t in libres)
+        taille_segment = min(taille_segment, taille_tampon)
+        if reglage is not None and len(libres) >= 3:
+            reserve_relance.append(libres.pop())
+        fenetre = len(libres)
+        connexions = max(1, min(connexions, fenetre))
+    else:
+        fenetre = 2 * connexions
+    if reglage is not None:
+        if libres:
+            reglage.connexions_max = min(reglage.connexions_max, fenetre)
+            reglage.taille_segment_max = min(reglage.taille_segment_max, taille_tampon)
+        reglage.connexions = min(reglage.connexions, reglage.connexions_max)
+        reglage.taille_segment = min(reglage.taille_segment, reglage.taille_segment_max)
+        connexions, taille_segment = reglage.connexions, reglage.taille_segment
+    tentatives = CONFIG['execution'].get('retry_attempts', 1)
+    octets_ecrits = depart
+    position = depart
+
+    logger.info(
+        f"Téléchargement par plages : {math.ceil((taille_totale - depart) / taille_segment)} segment(s) de "
+        f"{taille_segment / 1024**2:.0f} MB sur {connexions} connexion(s)"
+        + (" (réglage automatique)" if reglage is not None else "")
+    )
+
+    limite = _LimiteConnexions(reglage) if reglage is not None else None
+
+    def telecharger(debut: int, fin: int, tampon: Optional[bytearray], suivi: Optional[SuiviSegment]):
+        if limite is None:
+            return telecharger_segment(url, debut, fin, timeout, tentatives, tampon, validateur=validateur)
+        with limite:
+            if suivi.abandon.is_set():
+                raise RequeteAbandonnee()
+            return telecharger_segment(url, debut, fin, timeout, tentatives, tampon, suivi, validateur)
+
+    max_workers = reglage.connexions_max if reglage is not None else connexions
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="range") as executor, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="range-relance") as executor_relances:
+        en_vol = deque()
+        perdantes = []
+
+        def soumettre_suivants():
+            nonlocal position
+            while position < taille_totale and len(en_vol) < (2 * reglage.connexions if reglage and not tampons else fenetre):
+                if tampons and not libres:
+                    return
+                taille = reglage.taille_segment if reglage is not None else taille_segment
+                debut, fin = position, min(position + taille, taille_totale) - 1
+                tampon = libres.popleft() if libres else None
+                suivi = SuiviSegment() if reglage is not None else None
+                en_vol.append(_Segment(debut, fin, tampon, executor.submit(telecharger, debut, fin, tampon, suivi), suivi))
+                position = fin + 1
+
+        def recycler_perdantes():
+            """Rend les tampons des requêtes devancées une fois leur lecture arrêtée"""
+            for perdante in [p for p in perdantes if p[0].done()]:
+                perdantes.remove(perdante)
+                if perdante[1] is not None:
+                    reserve_relance.append(perdante[1])
+
+        def relancer_si_lent(segment: _Segment):
+            if segment.relance or segment.future.done() or any(not p[0].done() for p in perdantes):
+                return
+            if not reglage.est_lente(segment.suivi.lus, segment.suivi.duree):
+                return
+            if tampons and not reserve_relance:
+                return
+            tampon = reserve_relance.popleft() if reserve_relance else None
+            suivi = SuiviSegment()
+            future = executor_relances.submit(
+                telecharger_segment, url, segment.debut, segment.fin, timeout, tentatives, tampon, suivi, validateur
+            )
+            segment.relance = (future, tampon, suivi)
+            reglage.relances += 1
+            logger.info(
+                f"Plage {segment.debut}-{segment.fin} lente "
+                f"({segment.suivi.lus / 1024 / max(segment.suivi.duree, 1e-3):.0f} KB/s), relancée sur une autre connexion"
+            )
+
+        soumettre_suivants()
+
+        try:
+            while en_vol:
+                # Écriture strictement dans l'ordre : on attend le plus ancien segment
+                segment = en_vol[0]
+                if reglage is None:
+                    resultat = _attendre_segment(segment, None)
+                else:
+                    resultat = _attendre_segment(segment, min(1.0, reglage.parametres['intervalle_mesure']))
+                    recycler_perdantes()
+                    reglage.ajuster()
+                    if resultat is None:
+                        relancer_si_lent(segment)
+                        soumettre_suivants()
+                        continue
+                en_vol.popleft()
+
+                donnees, relance_gagnante = resultat
+                tampon, suivi = segment.tampon, segment.suivi
+                if segment.relance:
+                    # La requête devancée s'arrête d'elle-même ; son tampon sert aux relances suivantes
+                    perdante = (segment.future, segment.tampon, segment.suivi) if relance_gagnante else segment.relance
+                    if relance_gagnante:
+                        _, tampon, suivi = segment.relance
+                        reglage.relances_gagnantes += 1
+                    perdante[2].abandon.set()
+                    perdantes.append(perdante)
+                if reglage is not None:
+                    reglage.enregistrer(len(donnees), suivi.duree)
+
+                if tampon is None:
+                    soumettre_suivants()
+                writer.write(donnees)
+                octets_ecrits += len(donnees)
+                if tampon is not None:
+                    # Le tampon n'est réutilisé qu'une fois son contenu écrit
+                    libres.append(tampon)
+                    soumettre_suivants()
+                if progression:
+                    progression(octets_ecrits)
+        except Exception:
+            for segment in en_vol:
+                for future in segment.futures:
+                    future.cancel()
+                for suivi in (segment.suivi, segment.relance[2] if segment.relance else None):
+                    if suivi is not None:
+                        suivi.abandon.set()
+            raise
+        finally:
+            for perdante in perdantes:
+                perdante[2].abandon.set()
+
+    if octets_ecrits != taille_totale:
+        raise IOError(f"Téléchargement incomplet : {octets_ecrits}/{taille_totale} octets")
+
+    return octets_ecrits
+
+
+class FichierHttpDistant:
+    """
+    Fichier distant en lecture seule, accessible par positionnement (seek) via des requêtes Range
+
+    Permet à pyarrow de lire un Parquet distant (pied de page puis colonnes utiles)
+    sans le télécharger entièrement. Les petites lectures sont regroupées en blocs
+    d'au moins taille_lecture octets. Chaque lecture est conditionnée par validateur
+    (If-Range) pour ne pas assembler des blocs de deux versions du fichier.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        taille: int,
+        timeout: int,
+        taille_lecture: int = 1024 * 1024,
+        validateur: Optional[str] = None
+    ):
+        self.url = url
+        self.validateur = validateur
+        self.taille = taille
+        self.timeout = timeout
+        self.taille_lecture = taille_lecture
+        self.position = 0
+        self.cache_debut = 0
+        self.cache = b""
+        self.octets_telecharges = 0
+        self.closed = False
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, position: int, origine: int = 0) -> int:
+        if origine == 1:
+            position += self.position
+        elif origine == 2:
+            position += self.taille
+        self.position = max(0, min(position, self.taille))
+        return self.position
+
+    def read(self, taille: int = -1) -> bytes:
+        if taille < 0:
+            taille = self.taille - self.position
+        taille = min(taille, self.taille - self.position)
+        if taille <= 0:
+            return b""
+
+        fin_cache = self.cache_debut + len(self.cache)
+        if not (self.cache_debut <= self.position and self.position + taille <= fin_cache):
+            fin = min(self.position + max(taille, self.taille_lecture), self.taille) - 1
+            self.cache = telecharger_segment(
+                self.url, self.position, fin, self.timeout, CONFIG['execution'].get('retry_attempts', 1),
+                validateur=self.validateur
+            )
+            self.cache_debut = self.position
+            self.octets_telecharges += len(self.cache)
+
+        debut = self.position - self.cache_debut
+        donnees = self.cache[debut:debut + taille]
+        self.position += len(donnees)
+        return donnees
+
+    def close(self):
+        self.closed = True
+        self.cache = b""
@@ -0,0 +1,233 @@
+"""
+Upload GCS reprenable (resumable upload) piloté explicitement
+Conserve l'URI de session : après une erreur, on interroge GCS pour connaître
+le dernier octet confirmé et l'écriture reprend à partir de là
+"""
+
+import base64
+import hashlib
+import logging
+import re
+from typing import Dict, Optional
+
+import google_crc32c
+
+from config import ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+# Les morceaux intermédiaires d'un upload reprenable doivent être multiples de 256 KiB
+GRANULARITE = 256 * 1024
+
+
+class EmpreintesUpload:
+    """
+    Empreintes (SHA-256, MD5, CRC32C) d'un writer vers GCS et contrôle d'intégrité
+
+    Les sous-classes appellent _hacher sur les octets dans l'ordre du flux (l'état
+    doit correspondre à l'offset confirmé après une reprise) et renseignent blob,
+    timeout et objet (ressource GCS finale si connue).
+    """
+
+    def _reinitialiser_empreintes(self):
+        self.sha256 = hashlib.sha256()
+        self.md5 = hashlib.md5()
+        self.crc32c = google_crc32c.Checksum()
+
+    def _hacher(self, donnees: bytes):
+        self.sha256.update(donnees)
+        self.md5.update(donnees)
+        self.crc32c.update(donnees)
+
+    def hexdigest(self) -> str:
+        return self.sha256.hexdigest()
+
+    def empreintes(self) -> Dict[str, str]:
+        """Empreintes des octets confirmés ; md5 et crc32c au format GCS (base64)"""
+        return {
+            'sha256': self.sha256.hexdigest(),
+            'md5': base64.b64encode(self.md5.digest()).decode(),
+            'crc32c': base64.b64encode(self.crc32c.digest()).decode()
+        }
+
+    def verifier_integrite(self) -> Dict[str, str]:
+        """
+        Compare les empreintes calculées pendant le streaming avec celles de l'objet GCS
+
+        Les empreintes GCS viennent de la réponse de finalisation, sinon des
+        métadonnées de l'objet (aucun octet n'est relu). Un objet composé n'a pas de MD5 :
+        seul le CRC32C est alors comparé.
+
+        Raises:
+            IOError si une empreinte diffère
+        """
+        if self.objet is None:
+            self.blob.reload(timeout=self.timeout)
+            self.objet = {'crc32c': self.blob.crc32c, 'md5Hash': self.blob.md5_hash}
+
+        calculees = self.empreintes()
+        for cle, cle_gcs in (('crc32c', 'crc32c'), ('md5', 'md5Hash')):
+            annoncee = self.objet.get(cle_gcs)
+            if annoncee and annoncee != calculees[cle]:
+                raise IOError(
+                    f"Empreinte {cle} différente pour {self.blob.name} : "
+                    f"GCS {annoncee}, streaming {calculees[cle]}"
+                )
+        return calculees
+
+
+class SessionUploadReprenable(EmpreintesUpload):
+    """
+    Writer vers un objet GCS via une session d'upload reprenable
+
+    Seuls les octets confirmés par GCS sont comptés (offset) et hachés (SHA-256,
+    MD5, CRC32C), ce qui permet de reprendre le téléchargement source exactement
+    à l'offset confirmé et de vérifier l'objet final sans le relire.
+    Les octets sont accumulés dans un tampon de taille fixe (fourni par le pool
+    de tampons de l'étape 1, sinon alloué) : un morceau est envoyé quand il est plein.
+    """
+
+    def __init__(
+        self,
+        blob,
+        chunk_size: int,
+        timeout: int,
+        content_type: Optional[str] = None,
+        tampon: Optional[bytearray] = None
+    ):
+        self.blob = blob
+        self.transport = blob.client._http
+        if tampon is not None:
+            chunk_size = len(tampon)
+        self.chunk_size = max(GRANULARITE, chunk_size - chunk_size % GRANULARITE)
+        self.tampon = tampon if tampon is not None and len(tampon) >= self.chunk_size else bytearray(self.chunk_size)
+        self.rempli = 0
+        self.timeout = timeout
+        self.content_type = content_type
+        self.session_uri = None
+        self.offset = 0
+        self.termine = False
+        self.objet = None
+        self._reinitialiser_empreintes()
+        self._ouvrir_session()
+
+    def _ouvrir_session(self):
+        """Crée une nouvelle session d'upload (remet l'état à zéro)"""
+        self.session_uri = self.blob.create_resumable_upload_session(
+            content_type=self.content_type,
+            timeout=self.timeout
+        )
+        self.rempli = 0
+        self.offset = 0
+        self.termine = False
+        self.objet = None
+        self._reinitialiser_empreintes()
+
+    @property
+    def taille(self) -> int:
+        return self.offset
+
+    def write(self, donnees: bytes) -> int:
+        vue = memoryview(donnees).cast('B')
+        while vue:
+            place = min(len(vue), self.chunk_size - self.rempli)
+            self.tampon[self.rempli:self.rempli + place] = vue[:place]
+            self.rempli += place
+            vue = vue[place:]
+            if self.rempli == self.chunk_size:
+                self._envoyer(final=False)
+        return len(donnees)
+
+    def close(self):
+        """Envoie le reste du tampon et finalise l'objet"""
+        while not self.termine:
+            self._envoyer(final=True)
+
+    def _envoyer(self, final: bool):
+        """Envoie le contenu du tampon (le dernier morceau fixe la taille totale)"""
+        taille = self.rempli
+        morceau = bytes(self.tampon[:taille])
+
+        if taille == 0:
+            content_range = f"bytes */{self.offset}"
+        else:
+            total = str(self.offset + taille) if final else "*"
+            content_range = f"bytes {self.offset}-{self.offset + taille - 1}/{total}"
+
+        response = self.transport.put(
+            self.session_uri,
+            data=morceau,
+            headers={'Content-Range': content_range},
+            timeout=self.timeout
+        )
+        self._appliquer_reponse(response, morceau)
+
+    def _appliquer_reponse(self, response, morceau: bytes):
+        """Met à jour l'offset confirmé à partir de la réponse GCS"""
+        if response.status_code in (200, 201):
+            confirmes = self.offset + len(morceau)
+            self.termine = True
+            try:
+                self.objet = response.json()
+            except ValueError:
+                self.objet = None
+        elif response.status_code == 308:
+            confirmes = self._lire_range(response)
+        else:
+            raise IOError(f"Upload GCS refusé (HTTP {response.status_code}) : {response.text[:200]}")
+
+        nouveaux = max(0, confirmes - self.offset)
+        self._hacher(morceau[:nouveaux])
+        # Octets non persistés par GCS : ramenés en tête du tampon pour le prochain envoi
+        self.tampon[:self.rempli - nouveaux] = self.tampon[nouveaux:self.rempli]
+        self.rempli -= nouveaux
+        self.offset += nouveaux
+
+    @staticmethod
+    def _lire_range(response) -> int:
+        """Extrait le nombre d'octets persistés de l'en-tête Range d'une réponse 308"""
+        match = re.match(r'bytes=0-(\d+)', response.headers.get('Range', ''))
+        return int(match.group(1)) + 1 if match else 0
+
+    def octets_confirmes(self) -> int:
+        """Interroge GCS sur le nombre d'octets déjà persistés pour la session"""
+        response = self.transport.put(
+            self.session_uri,
+            data=b"",
+            headers={'Content-Range': "bytes */*"},
+            timeout=self.timeout
+        )
+        if response.status_code in (200, 201):
+            self.termine = True
+            return self.offset + self.rempli
+        if response.status_code == 308:
+            return self._lire_range(response)
+        raise IOError(f"Statut de la session GCS indisponible (HTTP {response.status_code})")
+
+    def reprendre(self) -> int:
+        """
+        Resynchronise l'état local avec GCS après une erreur
+
+        Le tampon non confirmé est abandonné : la source doit être relue
+        à partir de l'offset retourné.
+        """
+        confirmes = self.octets_confirmes()
+        nouveaux = max(0, confirmes - self.offset)
+        self._hacher(bytes(self.tampon[:nouveaux]))
+        self.offset += nouveaux
+        self.rempli = 0
+        return self.offset
+
+    def recommencer(self):
+        """Abandonne la session courante et en ouvre une nouvelle (source non reprenable)"""
+        self.annuler()
+        self._ouvrir_session()
+
+    def annuler(self):
+        """Annule la session d'upload côté GCS"""
+        if self.session_uri and not self.termine:
+            try:
+                self.transport.delete(self.session_uri, timeout=self.timeout)
+            except Exception as e:
+                logger.warning(f"Annulation de la session d'upload impossible : {e}")
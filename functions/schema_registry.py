@@ -0,0 +1,251 @@
+"""
+Registre des schémas des tables raw (étape 2)
+Chaque source a un fichier config/schemas/{source}.yaml listant ses versions de
+schéma (colonnes et types BigQuery). Le chargement utilise la version retenue :
+les types du fichier sont normalisés (CAST) à l'ajout dans la table raw et les
+écarts entre le fichier et le registre sont signalés, jamais absorbés.
+"""
+
+import json
+import logging
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import yaml
+from google.cloud import bigquery
+
+from config import CONFIG, ENV
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+DOSSIER_SCHEMAS = Path(__file__).resolve().parent.parent / 'config' / 'schemas'
+
+# Noms historiques (API REST) → noms SQL standard
+ALIAS_TYPES = {'INTEGER': 'INT64', 'FLOAT': 'FLOAT64', 'BOOLEAN': 'BOOL'}
+
+
+def obtenir_parametres_schemas() -> Dict:
+    """Retourne les paramètres du registre (section bigquery.schemas)"""
+    parametres = CONFIG['bigquery'].get('schemas', {})
+    return {
+        'actif': parametres.get('actif', True),
+        # "signaler" : chargement avec le schéma du registre, écarts journalisés et enregistrés
+        # "bloquer"  : un écart de colonnes annule le chargement du fichier
+        'evolution': parametres.get('evolution', 'signaler')
+    }
+
+
+def normaliser_type(type_bq: str) -> str:
+    type_bq = type_bq.upper()
+    return ALIAS_TYPES.get(type_bq, type_bq)
+
+
+@lru_cache(maxsize=None)
+def charger_registre(source_name: str) -> Optional[Dict]:
+    """Lit config/schemas/{source}.yaml (None si la source n'a pas de registre)"""
+    chemin = DOSSIER_SCHEMAS / f"{source_name}.yaml"
+    if not chemin.exists():
+        return None
+    with open(chemin, 'r', encoding='utf-8') as f:
+        registre = yaml.safe_load(f)
+    registre['versions'] = sorted(registre.get('versions', []), key=lambda v: v['version'])
+    return registre
+
+
+def version_schema(source_name: str, version: Optional[int] = None) -> Optional[Dict]:
+    """
+    Version de schéma à utiliser pour une source
+
+    Sans version demandée : celle fixée par la clé "schema_version" de la source,
+    sinon la plus récente. None si la source n'a pas de registre.
+    """
+    registre = charger_registre(source_name)
+    if not registre or not registre['versions']:
+        return None
+    if version is None:
+        for source in CONFIG['data_sources']['sources']:
+            if source['name'] == source_name:
+                version = source.get('schema_version')
+    if version is None:
+        return registre['versions'][-1]
+    for candidate in registre['versions']:
+        if candidate['version'] == int(version):
+            return candidate
+    raise ValueError(f"Version de schéma {version} absente du registre de {source_name}")
+
+
+def types_attendus(version: Dict) -> Dict[str, str]:
+    """{colonne: type BigQuery} d'une version du registre, dans l'ordre du registre"""
+    return {colonne['nom']: normaliser_type(colonne['type']) for colonne in version['colonnes']}
+
+
+def champs_bigquery(version: Dict) -> List[bigquery.SchemaField]:
+    return [bigquery.SchemaField(nom, type_bq) for nom, type_bq in types_attendus(version).items()]
+
+
+def types_schema_bigquery(schema: List[bigquery.SchemaField]) -> Dict[str, str]:
+    return {champ.name: normaliser_type(champ.field_type) for champ in schema}
+
+
+def type_arrow_vers_bigquery(type_arrow: pa.DataType) -> str:
+    """Type BigQuery obtenu au chargement d'une colonne Parquet de ce type"""
+    if pa.types.is_integer(type_arrow):
+        return 'INT64'
+    if pa.types.is_floating(type_arrow):
+        return 'FLOAT64'
+    if pa.types.is_boolean(type_arrow):
+        return 'BOOL'
+    if pa.types.is_date(type_arrow):
+        return 'DATE'
+    if pa.types.is_timestamp(type_arrow):
+        return 'TIMESTAMP'
+    if pa.types.is_decimal(type_arrow):
+        return 'NUMERIC' if type_arrow.precision <= 38 else 'BIGNUMERIC'
+    if pa.types.is_binary(type_arrow) or pa.types.is_large_binary(type_arrow):
+        return 'BYTES'
+    if pa.types.is_dictionary(type_arrow):
+        return type_arrow_vers_bigquery(type_arrow.value_type)
+    return 'STRING'
+
+
+def type_bigquery_vers_arrow(type_bq: str) -> pa.DataType:
+    """
+    Type Arrow à produire pour une colonne BigQuery (conversion CSV de l'étape 1)
+
+    Les décimaux exacts restent en texte : ils sont convertis par CAST au chargement.
+    """
+    return {
+        'INT64': pa.int64(),
+        'FLOAT64': pa.float64(),
+        'BOOL': pa.bool_(),
+        'DATE': pa.date32(),
+        'TIMESTAMP': pa.timestamp('us'),
+        'BYTES': pa.binary()
+    }.get(normaliser_type(type_bq), pa.string())
+
+
+def types_arrow_declares(source_name: str) -> Dict[str, pa.DataType]:
+    """{colonne: type Arrow} de la version du registre retenue ({} sans registre)"""
+    version = version_schema(source_name) if obtenir_parametres_schemas()['actif'] else None
+    if version is None:
+        return {}
+    return {nom: type_bigquery_vers_arrow(type_bq) for nom, type_bq in types_attendus(version).items()}
+
+
+def types_schema_arrow(schema: pa.Schema) -> Dict[str, str]:
+    return {champ.name: type_arrow_vers_bigquery(champ.type) for champ in schema}
+
+
+def comparer_schemas(attendu: Dict[str, str], observe: Dict[str, str]) -> Dict[str, List]:
+    """
+    Écarts entre le registre (attendu) et le fichier chargé (observé)
+
+    Returns:
+        {'nouvelles': colonnes du fichier absentes du registre,
+         'manquantes': colonnes du registre absentes du fichier,
+         'types': [{'colonne', 'attendu', 'observe'}] (normalisés par CAST au chargement)}
+    """
+    return {
+        'nouvelles': [nom for nom in observe if nom not in attendu],
+        'manquantes': [nom for nom in attendu if nom not in observe],
+        'types': [
+            {'colonne': nom, 'attendu': type_bq, 'observe': observe[nom]}
+            for nom, type_bq in attendu.items()
+            if nom in observe and observe[nom] != type_bq
+        ]
+    }
+
+
+def a_des_ecarts(ecarts: Dict[str, List], colonnes_seulement: bool = False) -> bool:
+    cles = ('nouvelles', 'manquantes') if colonnes_seulement else ('nouvelles', 'manquantes', 'types')
+    return any(ecarts[cle] for cle in cles)
+
+
+def decrire_ecarts(ecarts: Dict[str, List]) -> str:
+    parties = []
+    if ecarts['nouvelles']:
+        parties.append(f"nouvelles colonnes ignorées : {', '.join(ecarts['nouvelles'])}")
+    if ecarts['manquantes']:
+        parties.append(f"colonnes absentes (NULL) : {', '.join(ecarts['manquantes'])}")
+    if ecarts['types']:
+        parties.append("types normalisés : " + ', '.join(
+            f"{e['colonne']} {e['observe']} → {e['attendu']}" for e in ecarts['types']
+        ))
+    return ' ; '.join(parties) or 'aucun écart'
+
+
+def expressions_normalisation(attendu: Dict[str, str], observe: Dict[str, str]) -> Dict[str, str]:
+    """Expression SQL de chaque colonne du registre à partir du fichier chargé"""
+    expressions = {}
+    for nom, type_bq in attendu.items():
+        if nom not in observe:
+            expressions[nom] = f"CAST(NULL AS {type_bq})"
+        elif observe[nom] != type_bq:
+            expressions[nom] = f"CAST(`{nom}` AS {type_bq})"
+        else:
+            expressions[nom] = f"`{nom}`"
+    return expressions
+
+
+def chemin_rapport_ecarts(source_name: str, timestamp: str) -> str:
+    return f"{CONFIG['storage']['metadata_folder']}/schemas/ecarts/{timestamp}/{source_name}.json"
+
+
+def enregistrer_ecarts(bucket, source_name: str, timestamp: str, version: int, ecarts: Dict[str, List]):
+    """Conserve le rapport d'écarts d'un fichier à côté des manifests"""
+    rapport = {'source': source_name, 'timestamp': timestamp, 'version_schema': version, 'ecarts': ecarts}
+    try:
+        bucket.blob(chemin_rapport_ecarts(source_name, timestamp)).upload_from_string(
+            json.dumps(rapport, indent=2), content_type='application/json'
+        )
+    except Exception as e:
+        logger.warning(f"Rapport d'écarts de schéma non enregistré pour {source_name} : {e}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    import pyarrow.parquet as pq
+
+    from functions.batch_catalog import obtenir_catalogue
+    from functions.storage_backend import obtenir_stockage
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'diff':
+        source_name = sys.argv[2]
+        version = version_schema(source_name)
+        if version is None:
+            print(f"\nAucun registre de schéma pour {source_name}")
+            sys.exit(1)
+        catalogue = obtenir_catalogue()
+        timestamp = sys.argv[3] if len(sys.argv) > 3 else next(
+            (ts for ts in catalogue.timestamps()
+             if any(f['source'] == source_name for f in catalogue.lister(timestamp=ts)[ts])),
+            None
+        )
+        fichier = next((f for f in catalogue.lister(timestamp=timestamp).get(timestamp, []) if f['source'] == source_name), None)
+        if fichier is None:
+            print(f"\nAucun fichier de {source_name} pour le batch {timestamp}")
+            sys.exit(1)
+        with obtenir_stockage().conteneur().blob(fichier['blob_name']).open('rb') as f:
+            observe = types_schema_arrow(pq.ParquetFile(f).schema_arrow)
+        ecarts = comparer_schemas(types_attendus(version), observe)
+        print(f"\n{source_name} : batch {timestamp} / registre v{version['version']}")
+        print(f"  {decrire_ecarts(ecarts)}")
+        sys.exit(1 if a_des_ecarts(ecarts, colonnes_seulement=True) else 0)
+
+    else:
+        for source in CONFIG['data_sources']['sources']:
+            registre = charger_registre(source['name'])
+            if not registre:
+                print(f"\n{source['name']} : aucun registre (schéma du fichier chargé)")
+                continue
+            retenue = version_schema(source['name'])
+            print(f"\n{source['name']} : {len(registre['versions'])} version(s), v{retenue['version']} utilisée")
+            for version in registre['versions']:
+                print(f"  v{version['version']} ({version.get('date', '?')}) : {len(version['colonnes'])} colonnes - {version.get('description', '')}")
+        print("\nUsage:")
+        print("  python -m functions.schema_registry                          # Versions du registre par source")
+        print("  python -m functions.schema_registry diff <SOURCE> [TIMESTAMP] # Compare un fichier au registre")
@@ -4,82 +4,95 @@ Version streaming direct : URL → GCS (sans fichier temporaire)
 Adapté pour Streamlit Cloud
 """
 
+import pyarrow as pa
 import requests
-from google.cloud import storage, bigquery
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
+from enum import Enum
+from urllib.parse import urlparse
 import logging
-from typing import Dict, Optional
-import os
-import streamlit as st
+import threading
+import time
+from typing import Dict, List, Optional
 
 from config import CONFIG, ENV
+from functions.range_download import (
+    obtenir_parametres_plages,
+    detecter_support_range,
+    telecharger_par_plages,
+    telecharger_segment,
+    validateur_plages,
+    FichierHttpDistant,
+    FichierModifie
+)
+from functions.ledger import (
+    lire_entree_ledger,
+    ecrire_entree_ledger,
+    empreinte_traitement,
+    entetes_conditionnels,
+    validateurs_identiques
+)
+from functions.composite_upload import UploadComposite, obtenir_parametres_composite
+from functions.parquet_conversion import (
+    obtenir_parametres_conversion,
+    detecter_format,
+    detecter_format_contenu,
+    traiter_flux_source,
+    TypesCsvIncompatibles,
+    projeter_parquet
+)
+from functions.decompression import obtenir_parametres_decompression, detecter_compression
+from functions.manifest import construire_manifest, ecrire_manifest, lire_metadonnees_parquet
+from functions.batch_catalog import invalider_catalogue
+from functions.async_engine import executer_sources_async, moteur_async_disponible, obtenir_parametres_moteur
+from functions.auto_tuning import (
+    ReglageAuto,
+    ecrire_reglage_hote,
+    lire_reglage_hote,
+    obtenir_parametres_reglage,
+    taille_morceau_flux
+)
+from functions.download_cache import cle_cache, obtenir_cache, relire_mmap
+from functions.storage_backend import obtenir_stockage
+from functions.gcp_clients import journaliser_statistiques_clients
+from functions.memoire import SuiviRss, obtenir_pool, pic_rss_processus_mb
 
 # Configuration du logging
 logging.basicConfig(level=ENV.get('log_level', 'INFO'))
 logger = logging.getLogger(__name__)
 
 
-def get_gcp_client(client_type='storage'):
-    """Initialise un client GCP - détecte automatiquement l'environnement"""
+class StatutSource(Enum):
+    """Résultat du traitement d'une source (évalué à False uniquement en cas d'échec)"""
+    SUCCES = "succes"
+    INCHANGE = "inchange"
+    ECHEC = "echec"
     
-    # Construire le chemin vers le fichier local
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(current_dir)
-    creds_path = os.path.join(parent_dir, 'config', 'gcp-credentials.json')
-        # TESTER si le fichier existe
-    if os.path.exists(creds_path):
-        try:
-            # ENVIRONNEMENT LOCAL
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
-            
-            if client_type == 'storage':
-                return storage.Client(project=ENV['project_id'])
-            else:
-                return bigquery.Client(project=ENV['project_id'])
-        except:
-            logger.info("DEBUG: Mode LOCAL")
-            return None
+    def __bool__(self):
+        return self is not StatutSource.ECHEC
+
+
+class RepriseImpossible(Exception):
+    """Le serveur ne permet pas de reprendre le flux à l'offset demandé"""
+    pass
 
-    else:
-            try:
-            # ENVIRONNEMENT STREAMLIT CLOUD (pas de fichier local)
-                from google.oauth2 import service_account
-                creds = service_account.Credentials.from_service_account_info(st.secrets["gcp"])
-                
-                if client_type == 'storage':
-                    return storage.Client(credentials=creds, project=ENV['project_id'])
-                else:
-                    return bigquery.Client(credentials=creds, project=ENV['project_id'])
-            except Exception as e:
-                    logger.info("DEBUG: Mode streamlit")
-                    return None
-    
+
+def sources_modifiees(resultats: Dict[str, StatutSource]) -> bool:
+    """Indique si au moins une source a produit un nouveau fichier dans GCS"""
+    return any(statut is StatutSource.SUCCES for statut in resultats.values())
 
 
 def verifier_et_creer_bucket():
-    """Vérifie que le bucket existe, sinon le crée"""
-    client = get_gcp_client('storage')
-    bucket_name = ENV['bucket']
-    
-    bucket = client.bucket(bucket_name)
-    
-    if not bucket.exists():
-        logger.info(f"Bucket '{bucket_name}' n'existe pas, création en cours...")
-        try:
-            bucket = client.create_bucket(bucket_name, location=ENV['region'])
-            logger.info(f"Bucket créé : gs://{bucket_name}")
-        except Exception as e:
-            logger.error(f"Impossible de créer le bucket : {e}")
-            raise
-    else:
-        logger.info(f"Bucket existant : gs://{bucket_name}")
-    
-    return bucket
+    """Vérifie que le bucket (ou le dossier du backend local) existe, sinon le crée"""
+    return obtenir_stockage().verifier_conteneur()
 
 
 def generer_chemin_gcs(source_name: str, url: str, execution_datetime: datetime) -> str:
     """Génère le chemin GCS selon le pattern défini dans la config"""
-    if 'parquet' in url.lower():
+    if obtenir_parametres_conversion(obtenir_source(source_name))['actif']:
+        # Les sources CSV sont converties en Parquet pendant l'ingestion
+        extension = 'parquet'
+    elif 'parquet' in url.lower():
         extension = 'parquet'
     elif 'csv' in url.lower():
         extension = 'csv'
@@ -100,63 +113,758 @@ def generer_chemin_gcs(source_name: str, url: str, execution_datetime: datetime)
     return chemin
 
 
-def telecharger_et_streamer_vers_gcs(url: str, chemin_gcs: str, source_name: str) -> bool:
-    """Télécharge et stream directement vers GCS sans fichier temporaire"""
+# Octets lus en tête d'une source de format inconnu pour y reconnaître une archive ou un CSV
+TAILLE_ENTETE = 4096
+
+
+def lire_entete(response: Optional[requests.Response], infos_http: Optional[Dict], timeout: int) -> bytes:
+    """
+    Premiers octets de la source (TAILLE_ENTETE, moins en fin de fichier)
+
+    En flux unique, les morceaux lus sont consommés sur response : l'appelant doit
+    les réécrire en tête de la destination. Sans response, une plage dédiée est lue.
+    """
+    if response is None:
+        fin = min(TAILLE_ENTETE, infos_http['taille']) - 1
+        return bytes(telecharger_segment(infos_http['url'], 0, fin, timeout, validateur=validateur_plages(infos_http)))
+    morceaux, lus = [], 0
+    for morceau in response.iter_content(chunk_size=TAILLE_ENTETE):
+        morceaux.append(morceau)
+        lus += len(morceau)
+        if lus >= TAILLE_ENTETE:
+            break
+    return b"".join(morceaux)
+
+
+def obtenir_source(source_name: str) -> Optional[Dict]:
+    """Retourne l'entrée de configuration d'une source"""
+    for source in CONFIG['data_sources']['sources']:
+        if source['name'] == source_name:
+            return source
+    return None
+
+
+def ouvrir_flux_a_partir_de(url: str, depart: int, etag: Optional[str], timeout: int, client_http=None) -> requests.Response:
+    """
+    Ouvre le flux HTTP à partir de l'octet depart (requête Range + If-Range)
+    
+    Le statut 206 indique une reprise effective ; un statut 200 signifie que le serveur
+    renvoie le fichier complet (plages non supportées ou contenu modifié).
+    client_http : objet offrant get() comme requests (ex. ClientHttpAsync), requests par défaut.
+    """
+    headers = {}
+    if depart:
+        headers['Range'] = f"bytes={depart}-"
+        if etag:
+            headers['If-Range'] = etag
+    
+    response = (client_http or requests).get(url, stream=True, timeout=timeout, headers=headers)
+    response.raise_for_status()
+    return response
+
+
+class TransfertSource:
+    """
+    Transfert d'une source vers un writer de stockage
+
+    Regroupe ce qui survit d'une tentative à l'autre : validateurs HTTP, réponse
+    ouverte, plan de lecture (cache local, plages ou flux unique), cache en écriture
+    et réglage automatique. executer() joue une tentative selon le mode retenu :
+    - projection d'un Parquet distant lu par plages (projeter) ;
+    - chaîne d'ingestion, décompression / conversion (traiter) : repart du début ;
+    - copie telle quelle : reprend à l'octet confirmé par le stockage.
+    """
+
+    def __init__(self, url: str, source_name: str, timeout: int, client_http=None):
+        self.url = url
+        self.source_name = source_name
+        self.source = obtenir_source(source_name)
+        self.timeout = timeout
+        self.client_http = client_http
+        self.intervalle_log = int(CONFIG['execution'].get('intervalle_progression_mb', 50)) * 1024 * 1024
+
+        self.plages = obtenir_parametres_plages(self.source)
+        self.conversion = obtenir_parametres_conversion(self.source)
+        self.decompression = obtenir_parametres_decompression(self.source)
+        # Un changement de conversion, projection ou décompression invalide le ledger
+        self.empreinte = empreinte_traitement(self.conversion, self.decompression)
+
+        self.infos_http = None
+        self.infos_range = None
+        self.response = None
+        self.entete_flux = b""
+        self.total_size = 0
+        self.etag = None
+        self.last_modified = None
+        self.url_finale = url
+        self.format_source = 'inconnu'
+        self.projeter = False
+        self.traiter = False
+
+        self.chemin_cache = None
+        self.ecriture_cache = None
+        self.parametres_reglage = obtenir_parametres_reglage()
+        self.hote = None
+        self.memoire_hote = None
+        self.reglage = None
+        self.tampons_plages: List[bytearray] = []
+        self.taille_morceau = None
+
+        self.dernier_log = 0
+        self.debit_flux = None
+        self.stats_traitement = None
+
+    # Préparation
+
+    def ouvrir(self, entree_ledger: Optional[Dict]) -> bool:
+        """
+        Interroge la source (HEAD si utile, sinon GET conditionnel en flux)
+
+        Returns:
+            False si la source est inchangée depuis le dernier téléchargement (ledger)
+        """
+        if entree_ledger and entree_ledger.get('empreinte_traitement') != self.empreinte:
+            logger.info(f"{self.source_name} : paramètres de traitement modifiés depuis le dernier téléchargement")
+
+        # Le support des plages sert au moteur multi-connexions et à la projection d'un Parquet distant
+        if self.plages['actif'] or self.conversion['colonnes'] is not None:
+            self.infos_http = detecter_support_range(self.url, self.timeout)
+
+        infos_http = self.infos_http
+        if infos_http and validateurs_identiques(
+            entree_ledger, self.url, infos_http['etag'], infos_http['last_modified'], infos_http['taille'], self.empreinte
+        ):
+            logger.info(
+                f"{self.source_name} inchangée depuis le {entree_ledger.get('mis_a_jour')} "
+                f"(ETag/Last-Modified), téléchargement ignoré"
+            )
+            return False
+
+        self.projeter = (
+            infos_http is not None
+            and self.conversion['colonnes'] is not None
+            and detecter_format(
+                self.source, infos_http['url'], infos_http['content_type'], infos_http['content_disposition']
+            ) == 'parquet'
+        )
+        if infos_http and self.plages['actif'] and infos_http['taille'] >= self.plages['taille_min']:
+            self.infos_range = infos_http
+
+        if self.infos_range or self.projeter:
+            self._adopter_infos(infos_http)
+            return True
+
+        self.response = (self.client_http or requests).get(
+            self.url,
+            stream=True,
+            timeout=self.timeout,
+            headers=entetes_conditionnels(entree_ledger, self.url, self.empreinte)
+        )
+        if self.response.status_code == 304:
+            logger.info(f"{self.source_name} inchangée (HTTP 304), téléchargement ignoré")
+            return False
+        self.response.raise_for_status()
+        self.total_size = int(self.response.headers.get('content-length', 0))
+        self.etag, self.last_modified = self.response.headers.get('etag'), self.response.headers.get('last-modified')
+        self.url_finale = self.response.url
+        return True
+
+    def _adopter_infos(self, infos_http: Dict):
+        """Taille, validateurs et URL finale annoncés par le HEAD"""
+        self.total_size = infos_http['taille']
+        self.etag, self.last_modified = infos_http['etag'], infos_http['last_modified']
+        self.url_finale = infos_http['url']
+
+    def identifier_format(self):
+        """Format de la source et mode d'écriture (tel quel, traité ou projeté)"""
+        if self.response is not None:
+            content_type = self.response.headers.get('content-type', '')
+            content_disposition = self.response.headers.get('content-disposition', '')
+        else:
+            content_type, content_disposition = self.infos_http['content_type'], self.infos_http['content_disposition']
+
+        self.format_source = detecter_format(self.source, self.url_finale, content_type, content_disposition)
+        compression = detecter_compression(b"", self.url_finale, content_type, content_disposition)
+
+        # Format inconnu (URL sans extension) : les premiers octets disent s'il s'agit
+        # d'une archive ou d'un CSV ; sinon le fichier est transféré tel quel, avec reprise
+        if self.decompression['actif'] and self.format_source == 'inconnu' and not compression:
+            entete = lire_entete(self.response, self.infos_http, self.timeout)
+            if self.response is not None:
+                self.entete_flux = entete
+            compression = detecter_compression(entete)
+            if not compression:
+                self.format_source = detecter_format_contenu(entete)
+
+        # Chaîne d'ingestion (décompression / conversion) si la source l'exige : l'objet
+        # produit ne correspond pas octet pour octet à la source, une reprise repart du début
+        self.traiter = bool(
+            (self.conversion['actif'] and self.format_source == 'csv')
+            or (self.decompression['actif'] and compression)
+        )
+        if not self.traiter and self.format_source == 'inconnu':
+            logger.warning(f"Format de {self.source_name} non reconnu, fichier transféré tel quel")
+        if self.conversion['colonnes'] is not None and self.format_source == 'parquet' and not self.projeter:
+            logger.warning(
+                f"Projection impossible pour {self.source_name} (plages HTTP non supportées), fichier transféré complet"
+            )
+        if self.total_size:
+            logger.info(f"Taille totale : {self.total_size / 1024**2:.2f} MB")
+
+    def preparer_cache(self):
+        """Cache local : un fichier déjà téléchargé (même URL, même validateur) est relu sur disque"""
+        cache = obtenir_cache()
+        cle = cle_cache(self.url_finale, self.etag, self.last_modified, self.total_size) if cache else None
+        self.chemin_cache = cache.chercher(cle) if cle else None
+        if self.chemin_cache:
+            logger.info(f"{self.source_name} présente dans le cache local, relue par mmap sans téléchargement")
+            self.infos_range = None
+            self._fermer_reponse()
+        elif cle and not self.projeter:
+            self.ecriture_cache = cache.nouvelle_ecriture(cle, self.total_size)
+
+    def preparer_reglage(self, bucket):
+        """Réglage automatique : on part des réglages retenus au dernier téléchargement depuis cet hôte"""
+        self.hote = urlparse(self.url_finale).netloc
+        if not self.parametres_reglage['actif']:
+            return
+        self.memoire_hote = lire_reglage_hote(bucket, self.hote)
+        if not self.infos_range:
+            return
+        self.reglage = ReglageAuto(
+            (self.memoire_hote or {}).get('connexions', self.plages['connexions']),
+            (self.memoire_hote or {}).get('taille_segment', self.plages['taille_segment']),
+            self.parametres_reglage
+        )
+        if self.memoire_hote:
+            logger.info(
+                f"Réglages mémorisés pour {self.hote} : {self.reglage.connexions} connexion(s), "
+                f"segments de {self.reglage.taille_segment / 1024**2:.0f} MB"
+            )
+
+    def tampons_lecture_souhaites(self) -> int:
+        """Tampons du pool utiles à la lecture de la source"""
+        if self.reglage is not None:
+            # Marge pour laisser le réglage ajouter des connexions, plus un tampon de relance
+            return 2 * min(self.parametres_reglage['connexions_max'], self.reglage.connexions + 2) + 1
+        if self.infos_range:
+            return 2 * self.plages['connexions']
+        return 0 if self.projeter else 1
+
+    # Lecture de la source
+
+    def journaliser_progression(self, octets: int):
+        if octets - self.dernier_log < self.intervalle_log:
+            return
+        if self.total_size > 0:
+            logger.info(
+                f"Progression : {octets / self.total_size * 100:.1f}% "
+                f"({octets / 1024**2:.0f} MB / {self.total_size / 1024**2:.0f} MB)"
+            )
+        else:
+            logger.info(f"Téléchargé : {octets / 1024**2:.0f} MB")
+        self.dernier_log = octets
+
+    def transferer(self, destination, depart: int) -> int:
+        """Pousse les octets de la source à partir de depart dans destination"""
+        if self.chemin_cache:
+            return relire_mmap(self.chemin_cache, destination, depart, self.taille_morceau, self.journaliser_progression)
+        if self.ecriture_cache is not None:
+            # Copie brute de la source vers le cache, recalée sur l'octet de reprise
+            self.ecriture_cache.positionner(depart)
+            destination = self.ecriture_cache.dupliquer(destination)
+        if self.infos_range:
+            return telecharger_par_plages(
+                url=self.infos_range['url'],
+                taille_totale=self.total_size,
+                writer=destination,
+                connexions=self.plages['connexions'],
+                taille_segment=self.plages['taille_segment'],
+                timeout=self.timeout,
+                progression=self.journaliser_progression,
+                depart=depart,
+                tampons=self.tampons_plages,
+                reglage=self.reglage,
+                validateur=validateur_plages(self.infos_range)
+            )
+        return self._lire_flux(destination, depart)
+
+    def _lire_flux(self, destination, depart: int) -> int:
+        """Flux unique : réponse déjà ouverte, sinon nouvelle requête à partir de depart"""
+        if self.response is None:
+            self.response = ouvrir_flux_a_partir_de(self.url, depart, self.etag, self.timeout, self.client_http)
+            if depart and self.response.status_code != 206:
+                self._fermer_reponse()
+                raise RepriseImpossible("Reprise par plage impossible")
+        flux, self.response = self.response, None
+        # Octets déjà lus sur ce flux pour reconnaître le format
+        prefixe, self.entete_flux = self.entete_flux, b""
+
+        debut_flux = time.perf_counter()
+        recus = depart
+        try:
+            if prefixe:
+                destination.write(prefixe)
+                recus += len(prefixe)
+            for chunk in flux.iter_content(chunk_size=self.taille_morceau):
+                if chunk:
+                    destination.write(chunk)
+                    recus += len(chunk)
+                    self.journaliser_progression(recus)
+        finally:
+            flux.close()
+            duree_flux = time.perf_counter() - debut_flux
+            if recus > depart and duree_flux > 0:
+                self.debit_flux = (recus - depart) / duree_flux
+        if self.total_size and recus < self.total_size:
+            raise IOError(f"Flux interrompu : {recus}/{self.total_size} octets reçus")
+        return recus
+
+    # Tentatives
+
+    def executer(self, session, tentative: int):
+        """Joue une tentative complète vers session (sans la finaliser)"""
+        if self.projeter:
+            self._projeter(session, tentative)
+        elif self.traiter:
+            self._traiter(session, tentative)
+        else:
+            self._copier(session)
+
+    def _projeter(self, session, tentative: int):
+        if tentative > 1:
+            session.recommencer()
+        if self.chemin_cache:
+            with pa.memory_map(self.chemin_cache) as fichier:
+                self.stats_traitement = projeter_parquet(fichier, session, self.conversion)
+            return
+        fichier = FichierHttpDistant(
+            self.url_finale, self.total_size, self.timeout, validateur=validateur_plages(self.infos_http)
+        )
+        self.stats_traitement = projeter_parquet(fichier, session, self.conversion)
+        logger.info(
+            f"Octets lus à la source : {fichier.octets_telecharges / 1024**2:.2f} MB / "
+            f"{self.total_size / 1024**2:.2f} MB"
+        )
+
+    def _traiter(self, session, tentative: int):
+        if tentative > 1:
+            session.recommencer()
+        try:
+            self.stats_traitement = self._chaine_ingestion(session)
+        except TypesCsvIncompatibles as e:
+            # Les types du registre ne tiennent pas sur ce fichier : tout en texte
+            # (le chargement de l'étape 2 convertit par CAST et signale les écarts)
+            logger.warning(f"{e} : conversion relancée avec toutes les colonnes en texte")
+            self.conversion = dict(self.conversion, tout_texte=True)
+            session.recommencer()
+            self.stats_traitement = self._chaine_ingestion(session)
+
+    def _chaine_ingestion(self, session) -> Dict:
+        return traiter_flux_source(
+            lambda tube: self.transferer(tube, 0), session, self.conversion, self.decompression, self.format_source
+        )
+
+    def _copier(self, session):
+        try:
+            self.transferer(session, session.offset)
+        except RepriseImpossible:
+            logger.warning("Reprise par plage impossible, le transfert recommence depuis le début")
+            session.recommencer()
+            self.transferer(session, 0)
+
+    def apres_interruption(self, session) -> int:
+        """Prépare la tentative suivante après une coupure ; retourne l'octet de reprise"""
+        self._fermer_reponse()
+        depart = session.reprendre()
+        if not (self.projeter or self.traiter):
+            logger.info(f"Reprise à partir de l'octet {depart} ({depart / 1024**2:.1f} MB confirmés par GCS)")
+        return depart
+
+    def apres_modification(self, session) -> bool:
+        """
+        Le fichier a été republié pendant le transfert : nouveau HEAD, reprise depuis le début
+
+        Returns:
+            False si le nouveau HEAD ne permet plus de lire la source par plages
+        """
+        nouvelles = detecter_support_range(self.url, self.timeout)
+        if nouvelles is None:
+            return False
+        self.infos_http = nouvelles
+        if self.infos_range:
+            self.infos_range = nouvelles
+        self._adopter_infos(nouvelles)
+        if self.ecriture_cache is not None:
+            # Le cache était indexé sur l'ancienne version
+            self.ecriture_cache.abandonner()
+            self.ecriture_cache = None
+        if not (self.projeter or self.traiter):
+            session.recommencer()
+        return True
+
+    # Fin du transfert
+
+    def valider_cache(self):
+        if self.ecriture_cache is None:
+            return
+        try:
+            self.ecriture_cache.valider()
+        except OSError as e:
+            logger.warning(f"Fichier non ajouté au cache local : {e}")
+        self.ecriture_cache = None
+
+    def memoriser_reglage(self, bucket):
+        if self.reglage is not None:
+            retenu = self.reglage.resultat()
+            logger.info(
+                f"Réglage retenu : {retenu['connexions']} connexion(s), segments de {retenu['taille_segment'] / 1024**2:.0f} MB, "
+                f"{retenu['relances']} relance(s) dont {retenu['relances_gagnantes']} gagnante(s)"
+            )
+            ecrire_reglage_hote(bucket, self.hote, retenu)
+        elif self.parametres_reglage['actif'] and self.debit_flux is not None:
+            ecrire_reglage_hote(bucket, self.hote, {'debit_flux': self.debit_flux})
+
+    def _fermer_reponse(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+
+    def fermer(self):
+        """Libère la réponse ouverte et le cache en écriture non validé"""
+        self._fermer_reponse()
+        if self.ecriture_cache is not None:
+            self.ecriture_cache.abandonner()
+            self.ecriture_cache = None
+
+
+def reserver_memoire(transfert: TransfertSource, composite: Dict, mode_composite: bool):
+    """
+    Budget mémoire : le transfert réserve ses tampons (et attend si le budget est épuisé) ;
+    les connexions sont réduites en proportion de la part accordée
+
+    Les tampons de lecture par plages sont remis à transfert.
+
+    Returns:
+        (réservation, connexions de l'upload composite)
+    """
+    pool = obtenir_pool()
+    tampons_composant = pool.tampons_pour(composite['taille_composant'])
+    tampons_traitement = (
+        pool.tampons_pour(2 * transfert.conversion['taille_bloc']) if (transfert.traiter or transfert.projeter) else 0
+    )
+    if mode_composite:
+        souhaite_upload, minimum_upload = (composite['connexions'] + 2) * tampons_composant, 3 * tampons_composant
+    else:
+        souhaite_upload, minimum_upload = 1, 1
+    souhaite_lecture = transfert.tampons_lecture_souhaites()
+    reservation = pool.reserver(
+        souhaite_upload + souhaite_lecture + tampons_traitement,
+        minimum_upload + min(souhaite_lecture, 1) + tampons_traitement
+    )
+    if reservation.facteur < 1:
+        logger.info(f"Budget mémoire partiel : {reservation.nombre}/{reservation.souhaite} tampon(s), connexions réduites")
+
+    connexions_composite = max(1, min(composite['connexions'], int(composite['connexions'] * reservation.facteur)))
+    if transfert.infos_range:
+        disponibles = reservation.nombre - tampons_traitement - (
+            (connexions_composite + 2) * tampons_composant if mode_composite else 1
+        )
+        transfert.tampons_plages = reservation.prendre(max(1, min(souhaite_lecture, disponibles)))
+    transfert.taille_morceau = taille_morceau_flux(transfert.memoire_hote, pool.taille_tampon)
+    return reservation, connexions_composite
+
+
+def ouvrir_session_upload(stockage, blob, source_name: str, composite: Optional[Dict], connexions_composite: int,
+                          reservation, timeout: int):
+    """Writer de destination : upload composite (composite fourni) ou session du backend"""
+    if composite is not None:
+        logger.info(
+            f"Upload composite : composants de {composite['taille_composant'] / 1024**2:.0f} MB "
+            f"sur {connexions_composite} connexion(s)"
+        )
+        return UploadComposite(blob, composite['taille_composant'], connexions_composite, timeout)
+
+    # Budget plus petit que le minimum d'un transfert (réservation plafonnée à la capacité
+    # et déjà prise par les plages) : le writer alloue alors son propre tampon
+    pool = obtenir_pool()
+    tampons_upload = reservation.prendre()
+    if not tampons_upload:
+        logger.warning(
+            f"Budget mémoire trop petit pour {source_name} ({pool.capacite} tampon(s)) : "
+            f"tampon d'upload alloué hors budget"
+        )
+    return stockage.creer_ecriture(
+        blob, pool.taille_tampon, timeout, tampon=tampons_upload[0] if tampons_upload else None
+    )
+
+
+def transferer_avec_reprises(transfert: TransfertSource, session, tentatives: int):
+    """
+    Joue les tentatives du transfert jusqu'à la finalisation de session
+
+    - coupure réseau ou d'écriture : reprise à l'octet confirmé (copie telle quelle),
+      sinon depuis le début ;
+    - fichier republié pendant le transfert (FichierModifie) : nouveau HEAD et
+      transfert recommencé depuis le début.
+    La session est annulée si la dernière tentative échoue.
+    """
+    for tentative in range(1, tentatives + 1):
+        try:
+            transfert.executer(session, tentative)
+            session.close()
+            return
+
+        except FichierModifie as e:
+            if tentative == tentatives or not transfert.apres_modification(session):
+                session.annuler()
+                raise
+            logger.warning(f"{e} (tentative {tentative}/{tentatives}) : le transfert recommence depuis le début")
+
+        except (requests.exceptions.RequestException, IOError) as e:
+            if tentative == tentatives:
+                session.annuler()
+                raise
+            logger.warning(f"Transfert interrompu (tentative {tentative}/{tentatives}) : {e}")
+            transfert.apres_interruption(session)
+
+
+def enregistrer_transfert(
+    transfert: TransfertSource,
+    session,
+    bucket,
+    blob,
+    chemin_gcs: str,
+    entree_ledger: Optional[Dict],
+    conditionnel: bool,
+    infos_fichier: Optional[Dict]
+) -> StatutSource:
+    """
+    Contrôle d'intégrité de l'objet écrit, puis ledger et description pour le manifest
+
+    Un objet identique (SHA-256) au dernier batch est supprimé : la source est inchangée.
+    """
+    bytes_uploaded = session.taille
+    logger.info(f"Upload terminé : {bytes_uploaded / 1024**2:.2f} MB")
+
+    # Empreintes calculées au fil du streaming, comparées à celles annoncées par GCS
+    try:
+        empreintes = session.verifier_integrite()
+    except IOError as e:
+        logger.error(f"Contrôle d'intégrité échoué, objet supprimé : {e}")
+        blob.delete()
+        return StatutSource.ECHEC
+    logger.info(f"Intégrité vérifiée (CRC32C {empreintes['crc32c']}, MD5 {empreintes['md5']})")
+
+    transfert.valider_cache()
+    transfert.memoriser_reglage(bucket)
+
+    stats_traitement = transfert.stats_traitement
+    entree = {
+        'url': transfert.url,
+        'etag': transfert.etag,
+        'last_modified': transfert.last_modified,
+        'taille_source': transfert.total_size or None,
+        'taille': bytes_uploaded,
+        'empreinte_traitement': transfert.empreinte,
+        'sha256': empreintes['sha256'],
+        'md5': empreintes['md5'],
+        'crc32c': empreintes['crc32c'],
+        'chemin_gcs': chemin_gcs,
+        'format': stats_traitement['format'] if stats_traitement else transfert.format_source
+    }
+    if stats_traitement:
+        entree['compression'] = stats_traitement.get('compression')
+        if 'lignes' in stats_traitement:
+            entree['lignes'] = stats_traitement['lignes']
+
+    if entree_ledger and entree_ledger.get('sha256') == entree['sha256']:
+        # Contenu identique au dernier batch : on ne garde pas de doublon dans GCS
+        blob.delete()
+        ecrire_entree_ledger(bucket, transfert.source_name, dict(entree, chemin_gcs=entree_ledger.get('chemin_gcs')))
+        logger.info(f"{transfert.source_name} inchangée (empreinte SHA-256 identique), fichier du batch supprimé")
+        return StatutSource.INCHANGE
+
+    if conditionnel:
+        ecrire_entree_ledger(bucket, transfert.source_name, entree)
+
+    if infos_fichier is not None:
+        infos_fichier.update(
+            chemin_gcs=chemin_gcs,
+            octets=bytes_uploaded,
+            sha256=entree['sha256'],
+            md5=entree['md5'],
+            crc32c=entree['crc32c'],
+            format=entree['format'],
+            lignes=entree.get('lignes')
+        )
+        if entree['format'] == 'parquet':
+            infos_fichier.update(lire_metadonnees_parquet(blob))
+
+    return StatutSource.SUCCES
+
+
+def telecharger_et_streamer_vers_gcs(
+    url: str,
+    chemin_gcs: str,
+    source_name: str,
+    infos_fichier: Optional[Dict] = None,
+    client_http=None
+) -> StatutSource:
+    """
+    Télécharge et stream directement vers GCS sans fichier temporaire
+    
+    Si le serveur annonce Accept-Ranges et Content-Length, le fichier est récupéré
+    par plages sur plusieurs connexions ; sinon, flux unique.
+    Les archives zip/gzip sont décompressées et les sources CSV converties en Parquet
+    à la volée si ces étapes sont actives ; la projection de colonnes (columns.keep)
+    s'applique à la conversion CSV et aux Parquet distants lisibles par plages.
+    Une source inchangée depuis le dernier téléchargement (ledger) n'est pas ré-uploadée.
+    
+    infos_fichier, s'il est fourni, est complété avec la description de l'objet
+    écrit (taille, empreinte, lignes, schéma) pour le manifest du batch.
+    client_http remplace requests pour les lectures en flux (moteur asynchrone).
+    La destination est le backend de stockage configuré (bucket GCS ou dossier local).
+    """
+    transfert = None
+    reservation = None
     try:
         logger.info(f"Téléchargement et streaming de {source_name}...")
         logger.info(f"URL: {url[:80]}...")
         
-        client = get_gcp_client('storage')
-        bucket = client.bucket(ENV['bucket'])
+        stockage = obtenir_stockage()
+        bucket = stockage.conteneur()
         blob = bucket.blob(chemin_gcs)
-        
         timeout = CONFIG['execution']['timeout_seconds']
         
-        response = requests.get(url, stream=True, timeout=timeout)
-        response.raise_for_status()
+        conditionnel = CONFIG['execution'].get('telechargement_conditionnel', True)
+        entree_ledger = lire_entree_ledger(bucket, source_name) if conditionnel else None
         
-        total_size = int(response.headers.get('content-length', 0))
-        if total_size:
-            logger.info(f"Taille totale : {total_size / 1024**2:.2f} MB")
+        transfert = TransfertSource(url, source_name, timeout, client_http)
+        if not transfert.ouvrir(entree_ledger):
+            return StatutSource.INCHANGE
+        transfert.identifier_format()
+        transfert.preparer_cache()
+        transfert.preparer_reglage(bucket)
         
-        logger.info(f"Streaming vers gs://{ENV['bucket']}/{chemin_gcs}...")
+        composite = obtenir_parametres_composite(transfert.source)
+        mode_composite = composite['actif'] and transfert.total_size >= composite['taille_min']
+        reservation, connexions_composite = reserver_memoire(transfert, composite, mode_composite)
         
-        bytes_uploaded = 0
-        last_log = 0
-        chunk_size = 32 * 1024 * 1024
-        log_interval = 50 * 1024 * 1024
+        logger.info(f"Streaming vers {stockage.uri(chemin_gcs)}...")
+        session = ouvrir_session_upload(
+            stockage, blob, source_name, composite if mode_composite else None, connexions_composite, reservation, timeout
+        )
+        tentatives = max(1, int(CONFIG['execution'].get('retry_attempts', 1)))
+        transferer_avec_reprises(transfert, session, tentatives)
         
-        with blob.open("wb", chunk_size=chunk_size) as f:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:
-                    f.write(chunk)
-                    bytes_uploaded += len(chunk)
-                    
-                    if bytes_uploaded - last_log >= log_interval:
-                        if total_size > 0:
-                            progress = (bytes_uploaded / total_size) * 100
-                            logger.info(f"Progression : {progress:.1f}% ({bytes_uploaded / 1024**2:.0f} MB / {total_size / 1024**2:.0f} MB)")
-                        else:
-                            logger.info(f"Téléchargé : {bytes_uploaded / 1024**2:.0f} MB")
-                        last_log = bytes_uploaded
-        
-        logger.info(f"Upload terminé : {bytes_uploaded / 1024**2:.2f} MB")
-        logger.info(f"Destination : gs://{ENV['bucket']}/{chemin_gcs}")
-        
-        return True
+        statut = enregistrer_transfert(
+            transfert, session, bucket, blob, chemin_gcs, entree_ledger, conditionnel, infos_fichier
+        )
+        if statut is StatutSource.SUCCES:
+            logger.info(f"Destination : {stockage.uri(chemin_gcs)}")
+        return statut
     
-    except requests.exceptions.RequestException as e:
+    except (requests.exceptions.RequestException, FichierModifie) as e:
         logger.error(f"Erreur lors du téléchargement : {e}")
-        return False
+        return StatutSource.ECHEC
     
     except Exception as e:
         logger.error(f"Erreur lors du streaming vers GCS : {e}")
-        return False
+        return StatutSource.ECHEC
+    
+    finally:
+        if transfert is not None:
+            transfert.fermer()
+        if reservation is not None:
+            reservation.liberer()
 
 
-def download_data(source_name: Optional[str] = None) -> Dict[str, bool]:
-    """Télécharge les données depuis les URLs et les stream vers GCS"""
+def obtenir_parametres_parallelisme() -> Dict:
+    """Retourne les paramètres de téléchargement concurrent (section execution.parallelisme)"""
+    parametres = CONFIG['execution'].get('parallelisme', {})
+    return {
+        'actif': parametres.get('actif', False),
+        'max_workers': max(1, int(parametres.get('max_workers', 1))),
+        'max_workers_par_source': max(1, int(parametres.get('max_workers_par_source', 1)))
+    }
+
+
+def creer_semaphores_par_hote(sources: List[Dict], defaut: int) -> Dict[str, threading.BoundedSemaphore]:
+    """Crée un sémaphore par hôte pour borner les connexions simultanées vers un même serveur"""
+    limites = {}
+    for source in sources:
+        hote = urlparse(source['url']).netloc
+        limite = max(1, int(source.get('max_workers', defaut)))
+        # Plusieurs sources sur le même hôte : on garde la limite la plus stricte
+        limites[hote] = min(limite, limites.get(hote, limite))
+    semaphores = {hote: threading.BoundedSemaphore(limite) for hote, limite in limites.items()}
+    return semaphores
+
+
+def traiter_source(
+    source: Dict,
+    execution_datetime: datetime,
+    semaphore: Optional[threading.BoundedSemaphore] = None,
+    client_http=None
+) -> Dict:
+    """Télécharge une source vers GCS et retourne son statut, sa durée et la description du fichier écrit"""
+    debut = time.perf_counter()
+    statut = StatutSource.ECHEC
+    fichier = {}
+    
+    logger.info(f"Source : {source['name']} - {source['description']}")
+    
+    try:
+        chemin_gcs = generer_chemin_gcs(source['name'], source['url'], execution_datetime)
+        
+        if semaphore is not None:
+            semaphore.acquire()
+        try:
+            statut = telecharger_et_streamer_vers_gcs(
+                url=source['url'],
+                chemin_gcs=chemin_gcs,
+                source_name=source['name'],
+                infos_fichier=fichier,
+                client_http=client_http
+            )
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+    
+    except Exception as e:
+        logger.error(f"Erreur lors du traitement de {source['name']} : {e}")
+        statut = StatutSource.ECHEC
+    
+    duree = time.perf_counter() - debut
+    
+    if statut is StatutSource.SUCCES:
+        logger.info(f"SUCCESS : {source['name']} traité avec succès en {duree:.2f}s\n")
+    elif statut is StatutSource.INCHANGE:
+        logger.info(f"UNCHANGED : {source['name']} inchangée ({duree:.2f}s)\n")
+    else:
+        logger.error(f"ÉCHEC : {source['name']} après {duree:.2f}s\n")
+    
+    return {'statut': statut, 'duree': duree, 'fichier': fichier}
+
+
+def download_data(source_name: Optional[str] = None, max_workers: Optional[int] = None) -> Dict[str, StatutSource]:
+    """
+    Télécharge les données depuis les URLs et les stream vers GCS
+    
+    Chaque valeur du résultat est un StatutSource : SUCCES, INCHANGE (source non modifiée,
+    rien à recharger) ou ECHEC. Seul ECHEC est évalué à False.
+    
+    Le moteur (execution.moteur.type) est synchrone (threads) ou asynchrone
+    (boucle asyncio + aiohttp) ; la signature et le résultat sont identiques.
+    
+    Args:
+        source_name: Nom d'une source à traiter seule (None = toutes les sources actives)
+        max_workers: Nombre de sources traitées simultanément (None = valeur de la config,
+            1 = mode séquentiel)
+    """
     execution_datetime = datetime.now()
+    debut_batch = time.perf_counter()
     
     logger.info("=" * 80)
     logger.info("ÉTAPE 1 : TÉLÉCHARGEMENT DES DONNÉES (STREAMING DIRECT)")
@@ -170,7 +878,6 @@ def download_data(source_name: Optional[str] = None) -> Dict[str, bool]:
         return {}
     
     sources = CONFIG['data_sources']['sources']
-    resultats = {}
     
     if source_name:
         sources = [s for s in sources if s['name'] == source_name]
@@ -178,35 +885,86 @@ def download_data(source_name: Optional[str] = None) -> Dict[str, bool]:
             logger.error(f"Source '{source_name}' introuvable dans la configuration")
             return {}
     
+    sources_actives = []
     for source in sources:
         if not source.get('active', True):
             logger.info(f"Source désactivée : {source['name']}")
             continue
+        sources_actives.append(source)
+    
+    parallelisme = obtenir_parametres_parallelisme()
+    if max_workers is None:
+        max_workers = parallelisme['max_workers'] if parallelisme['actif'] else 1
+    max_workers = max(1, min(max_workers, len(sources_actives) or 1))
+    
+    details = {}
+    
+    # Pic de mémoire résidente du run (échantillonné pendant les transferts)
+    with SuiviRss() as suivi_rss:
+        moteur = obtenir_parametres_moteur()
+        if moteur['type'] == 'async' and not moteur_async_disponible():
+            logger.warning("aiohttp non installé, moteur synchrone utilisé")
+            moteur['type'] = 'sync'
         
-        logger.info(f"\n{'-' * 80}")
-        logger.info(f"Source : {source['name']}")
-        logger.info(f"Description : {source['description']}")
-        logger.info(f"{'-' * 80}")
+        if moteur['type'] == 'async' and sources_actives:
+            semaphores = creer_semaphores_par_hote(sources_actives, parallelisme['max_workers_par_source'])
         
-        try:
-            chemin_gcs = generer_chemin_gcs(source['name'], source['url'], execution_datetime)
-            
-            succes = telecharger_et_streamer_vers_gcs(
-                url=source['url'],
-                chemin_gcs=chemin_gcs,
-                source_name=source['name']
-            )
-            
-            resultats[source['name']] = succes
-            
-            if succes:
-                logger.info(f"SUCCESS : {source['name']} traité avec succès\n")
-            else:
-                logger.error(f"ÉCHEC : {source['name']}\n")
+            def traiter_async(source: Dict, client_http) -> Dict:
+                semaphore = semaphores[urlparse(source['url']).netloc]
+                return traiter_source(source, execution_datetime, semaphore, client_http)
+        
+            for nom, resultat in executer_sources_async(sources_actives, traiter_async, max_workers, moteur).items():
+                if isinstance(resultat, BaseException):
+                    logger.error(f"Erreur lors du traitement de {nom} : {resultat}")
+                    resultat = {'statut': StatutSource.ECHEC, 'duree': 0.0, 'fichier': {}}
+                details[nom] = resultat
+        elif max_workers == 1:
+            for source in sources_actives:
+                logger.info(f"\n{'-' * 80}")
+                details[source['name']] = traiter_source(source, execution_datetime)
+        else:
+            logger.info(f"Mode concurrent : {max_workers} source(s) en parallèle")
+            semaphores = creer_semaphores_par_hote(sources_actives, parallelisme['max_workers_par_source'])
         
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="step1") as executor:
+                futures = {
+                    executor.submit(
+                        traiter_source,
+                        source,
+                        execution_datetime,
+                        semaphores[urlparse(source['url']).netloc]
+                    ): source['name']
+                    for source in sources_actives
+                }
+                for future in as_completed(futures):
+                    nom = futures[future]
+                    try:
+                        details[nom] = future.result()
+                    except Exception as e:
+                        logger.error(f"Erreur lors du traitement de {nom} : {e}")
+                        details[nom] = {'statut': StatutSource.ECHEC, 'duree': 0.0, 'fichier': {}}
+    
+    # Résultats dans l'ordre de la configuration
+    resultats = {
+        source['name']: details[source['name']]['statut']
+        for source in sources_actives
+        if source['name'] in details
+    }
+    
+    if any(statut is StatutSource.SUCCES for statut in resultats.values()):
+        try:
+            manifest = construire_manifest(execution_datetime, {
+                nom: dict(details[nom]['fichier'], statut=statut.value)
+                for nom, statut in resultats.items()
+            })
+            ecrire_manifest(obtenir_stockage().conteneur(), manifest)
         except Exception as e:
-            logger.error(f"Erreur lors du traitement de {source['name']} : {e}")
-            resultats[source['name']] = False
+            # L'index n'est pas réécrit : le batch reste visible par le listing du catalogue
+            logger.error(f"Erreur lors de l'écriture du manifest du batch (python -m functions.manifest reconstruire) : {e}")
+        invalider_catalogue()
+    
+    duree_totale = time.perf_counter() - debut_batch
+    duree_cumulee = sum(d['duree'] for d in details.values())
     
     logger.info("\n" + "=" * 80)
     logger.info("RÉSUMÉ DE L'ÉTAPE 1")
@@ -215,11 +973,24 @@ def download_data(source_name: Optional[str] = None) -> Dict[str, bool]:
     succes_count = sum(1 for v in resultats.values() if v)
     total_count = len(resultats)
     
-    for source_name, succes in resultats.items():
-        status = "SUCCESS" if succes else "FAILED"
-        logger.info(f"  {source_name}: {status}")
+    inchangees_count = sum(1 for v in resultats.values() if v is StatutSource.INCHANGE)
     
-    logger.info(f"\nTotal : {succes_count}/{total_count} sources traitées avec succès")
+    for nom, statut in resultats.items():
+        status = {StatutSource.SUCCES: "SUCCESS", StatutSource.INCHANGE: "UNCHANGED"}.get(statut, "FAILED")
+        logger.info(f"  {nom}: {status} ({details[nom]['duree']:.2f}s)")
+    
+    logger.info(f"\nTotal : {succes_count}/{total_count} sources traitées avec succès (dont {inchangees_count} inchangée(s))")
+    logger.info(f"Durée totale : {duree_totale:.2f}s (cumul des sources : {duree_cumulee:.2f}s)")
+    if max_workers > 1 and duree_totale > 0:
+        logger.info(f"Gain du mode concurrent : x{duree_cumulee / duree_totale:.2f}")
+    memoire = obtenir_pool().statistiques()
+    logger.info(
+        f"Mémoire des transferts : pic réservé {memoire['pic_mb']:.0f}/{memoire['budget_mb']:.0f} MB, "
+        f"tampons alloués {memoire['alloue_mb']:.0f} MB, attente du budget {memoire['attente_s']:.1f}s"
+    )
+    if suivi_rss.pic is not None:
+        logger.info(f"Pic de mémoire résidente (RSS) : {suivi_rss.pic:.0f} MB pendant le run, {pic_rss_processus_mb():.0f} MB pour le processus")
+    journaliser_statistiques_clients()
     logger.info(f"Timestamp commun : {execution_datetime.strftime('%Y-%m-%d %H:%M:%S')}")
     logger.info("=" * 80)
     
@@ -230,6 +1001,5 @@ if __name__ == "__main__":
     resultats = download_data()
     
     print("\nTest de step1_download.py")
-    for source, succes in resultats.items():
-        status = "SUCCESS" if succes else "FAILED"
-        print(f"  {source}: {status}")
\ No newline at end of file
+    for source, statut in resultats.items():
+        print(f"  {source}: {statut.name}")
\ No newline at end of file
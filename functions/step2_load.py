@@ -1,64 +1,60 @@
 """
 Étape 2 : Chargement des données depuis GCS vers BigQuery
 Vérifie le dossier et le timestamp pour charger les bons fichiers
-Ajoute les colonnes extraction_date et extraction_timestamp
+Ajoute les colonnes extraction_date et extraction_timestamp pendant le chargement
+(table de chargement puis INSERT ... SELECT, sans UPDATE de la table raw)
 Chaque source va dans sa propre table avec historique
 """
 
-from google.cloud import storage, bigquery
+from google.api_core.exceptions import NotFound
+from google.cloud import bigquery
 from datetime import datetime
 import logging
 from typing import List, Dict, Optional
-import os
-import re
-import streamlit as st
+import uuid
 
 from config import CONFIG, ENV
+from functions.manifest import fichiers_du_manifest, lire_manifest
+from functions.batch_catalog import infos_depuis_manifest, obtenir_catalogue
+from functions.storage_backend import obtenir_stockage
+from functions.gcp_clients import get_gcp_client, journaliser_statistiques_clients
+from functions.external_tables import definir_table_externe, mode_chargement
+from functions.bq_metadata import journaliser_statistiques_metadonnees, obtenir_cache_metadonnees
+from functions.schema_registry import (
+    a_des_ecarts,
+    champs_bigquery,
+    comparer_schemas,
+    decrire_ecarts,
+    enregistrer_ecarts,
+    expressions_normalisation,
+    normaliser_type,
+    obtenir_parametres_schemas,
+    types_attendus,
+    types_schema_bigquery,
+    version_schema
+)
+from functions.load_ledger import (
+    creer_ledger_si_necessaire,
+    deja_charge,
+    lire_chargements,
+    parametres_remplacement,
+    requete_remplacement
+)
 
 logging.basicConfig(level=ENV.get('log_level', 'INFO'))
 logger = logging.getLogger(__name__)
 
+# Tables temporaires d'un fichier en cours de chargement (supprimées après l'ajout à la table raw)
+PREFIXE_TABLE_CHARGEMENT = '_chargement_'
+
 # ---------------------------------------------------------------------------
 # Fonctions utilitaires
 # ---------------------------------------------------------------------------
-def get_gcp_client(client_type='storage'):
-    """Initialise un client GCP - détecte automatiquement l'environnement"""
-    
-    # Construire le chemin vers le fichier local
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(current_dir)
-    creds_path = os.path.join(parent_dir, 'config', 'gcp-credentials.json')
-        # TESTER si le fichier existe
-    if os.path.exists(creds_path):
-        try:
-            # ENVIRONNEMENT LOCAL
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
-            
-            if client_type == 'storage':
-                return storage.Client(project=ENV['project_id'])
-            else:
-                return bigquery.Client(project=ENV['project_id'])
-        except:
-            logger.info("DEBUG: Mode LOCAL")
-            return None
-
-    else:
-            try:
-            # ENVIRONNEMENT STREAMLIT CLOUD (pas de fichier local)
-                from google.oauth2 import service_account
-                creds = service_account.Credentials.from_service_account_info(st.secrets["gcp"])
-                
-                if client_type == 'storage':
-                    return storage.Client(credentials=creds, project=ENV['project_id'])
-                else:
-                    return bigquery.Client(credentials=creds, project=ENV['project_id'])
-            except Exception as e:
-                    logger.info("DEBUG: Mode streamlit")
-                    return None
-
-
 def creer_dataset_si_necessaire():
-    """Crée le dataset BigQuery si nécessaire"""
+    """Crée le dataset BigQuery si nécessaire (vérifié une fois par processus)"""
+    cache = obtenir_cache_metadonnees()
+    if cache.dataset_connu(f"{ENV['project_id']}.{ENV['dataset']}"):
+        return
     client = get_gcp_client('bigquery')
     dataset_ref = bigquery.Dataset(f"{ENV['project_id']}.{ENV['dataset']}")
     try:
@@ -69,6 +65,7 @@ def creer_dataset_si_necessaire():
         dataset.location = ENV['region']
         client.create_dataset(dataset)
         logger.info(f"Dataset créé : {ENV['dataset']}")
+    cache.memoriser_dataset(f"{ENV['project_id']}.{ENV['dataset']}")
 
 
 def obtenir_nom_table(source_name: str, table_type: str = 'raw') -> str:
@@ -83,153 +80,416 @@ def obtenir_nom_table(source_name: str, table_type: str = 'raw') -> str:
     return pattern.format(source=source_name)
 
 
-def extraire_infos_fichier(blob_name: str) -> Optional[Dict]:
-    """Extrait les informations d'un nom de fichier GCS"""
-    pattern = r'.*?/(\d{4})-(\d{2})/(.+?)__(\d{4}-\d{2}-\d{2})_(\d{2}-\d{2}-\d{2})\.(parquet|csv)$'
-    match = re.match(pattern, blob_name)
-    if not match:
-        return None
-    year, month, source, date, time, ext = match.groups()
-    dt = datetime.strptime(f"{date} {time.replace('-', ':')}", "%Y-%m-%d %H:%M:%S")
+def lister_fichiers_par_timestamp(year_month: str = None, timestamp: str = None) -> Dict[str, List[Dict]]:
+    """
+    Liste les fichiers GCS groupés par timestamp
+
+    Servi par le catalogue des batchs (index des manifests, sinon listing
+    de raw_data/ mois par mois), mis en cache entre deux appels.
+    """
+    return obtenir_catalogue().lister(year_month, timestamp)
+
+
+def colonnes_extraction() -> List[bigquery.SchemaField]:
+    """Colonnes d'historique renseignées à chaque chargement"""
+    return [
+        bigquery.SchemaField(CONFIG['historique']['colonne_timestamp'], 'TIMESTAMP'),
+        bigquery.SchemaField(CONFIG['historique']['colonne_date'], 'DATE')
+    ]
+
+
+def obtenir_source_config(source_name: str) -> Optional[Dict]:
+    """Retourne la configuration d'une source (None si inconnue)"""
+    for source in CONFIG['data_sources']['sources']:
+        if source['name'] == source_name:
+            return source
+    return None
+
+
+def parametres_table_raw(source_name: str) -> Dict:
+    """
+    Partitionnement et clustering de la table raw d'une source
+
+    Returns:
+        {'partition': colonne de partitionnement journalier (None si désactivé),
+         'clustering': colonnes de clustering (4 au plus)}
+    """
+    raw_tables = CONFIG['bigquery']['raw_tables']
+    source = obtenir_source_config(source_name) or {}
+    clustering = source.get('clustering', raw_tables.get('clustering', [CONFIG['columns']['id']]))
     return {
-        'source': source,
-        'year': year,
-        'month': month,
-        'date': date,
-        'time': time,
-        'timestamp': f"{date}_{time}",
-        'datetime': dt,
-        'blob_name': blob_name
+        'partition': CONFIG['historique']['colonne_date'] if raw_tables.get('partitionnement', True) else None,
+        'clustering': list(clustering or [])[:4]
     }
 
 
-def lister_fichiers_par_timestamp(year_month: str = None, timestamp: str = None) -> Dict[str, List[Dict]]:
-    """Liste les fichiers GCS groupés par timestamp"""
-    client = get_gcp_client('storage')
-    bucket = client.bucket(ENV['bucket'])
-    prefix = f"{CONFIG['storage']['raw_folder']}/" if not year_month else f"{CONFIG['storage']['raw_folder']}/{year_month}/"
-    blobs = bucket.list_blobs(prefix=prefix)
-    fichiers_par_timestamp = {}
-    for blob in blobs:
-        if blob.name.endswith('/'):
-            continue
-        infos = extraire_infos_fichier(blob.name)
-        if not infos:
-            logger.warning(f"Fichier ignoré : {blob.name}")
-            continue
-        if timestamp and infos['timestamp'] != timestamp:
-            continue
-        ts = infos['timestamp']
-        fichiers_par_timestamp.setdefault(ts, []).append(infos)
-    return fichiers_par_timestamp
+def appliquer_partitionnement(table: bigquery.Table, source_name: str, colonnes: List[str]) -> bigquery.Table:
+    """Renseigne partitionnement et clustering d'une table à créer (colonnes de clustering absentes ignorées)"""
+    parametres = parametres_table_raw(source_name)
+    if parametres['partition']:
+        table.time_partitioning = bigquery.TimePartitioning(
+            type_=bigquery.TimePartitioningType.DAY, field=parametres['partition']
+        )
+    absentes = [c for c in parametres['clustering'] if c not in colonnes]
+    if absentes:
+        logger.warning(f"Colonnes de clustering absentes de {table.table_id} : {', '.join(absentes)}")
+    clustering = [c for c in parametres['clustering'] if c in colonnes]
+    if clustering:
+        table.clustering_fields = clustering
+    return table
+
+
+def creer_table_si_necessaire(table_name: str, schema: List[bigquery.SchemaField], source_name: Optional[str] = None) -> List[str]:
+    """
+    Crée la table raw avec le schéma donné (registre, sinon fichier chargé) et les
+    colonnes temporelles, partitionnée par date d'extraction et clusterisée
+    (parametres_table_raw), ou ajoute à la table existante les colonnes qui lui manquent
 
+    Les ajouts de colonnes ne modifient que les métadonnées de la table (aucune donnée lue).
+    La table est lue dans le cache des métadonnées : une table déjà conforme ne coûte
+    aucun appel à BigQuery. Un type différent de celui de la table existante est une erreur : la table doit
+    être migrée (python -m functions.step2_load migrer).
 
-def creer_table_si_necessaire(table_name: str):
-    """Crée la table BigQuery si elle n'existe pas et ajoute les colonnes temporelles"""
+    Returns:
+        Noms des colonnes du schéma (hors colonnes temporelles), dans l'ordre du schéma
+    """
     client = get_gcp_client('bigquery')
     table_ref = f"{ENV['project_id']}.{ENV['dataset']}.{table_name}"
-    try:
-        table = client.get_table(table_ref)
-        logger.info(f"Table existante : {table_ref}")
-        schema_fields = [f.name for f in table.schema]
-        colonnes_a_ajouter = []
-        if CONFIG['historique']['colonne_timestamp'] not in schema_fields:
-            colonnes_a_ajouter.append(f"ADD COLUMN {CONFIG['historique']['colonne_timestamp']} TIMESTAMP")
-        if CONFIG['historique']['colonne_date'] not in schema_fields:
-            colonnes_a_ajouter.append(f"ADD COLUMN {CONFIG['historique']['colonne_date']} DATE")
-        for col in colonnes_a_ajouter:
-            client.query(f"ALTER TABLE `{table_ref}` {col}").result()
-            logger.info(f"Colonne ajoutée : {col}")
-    except Exception:
-        logger.info(f"Table {table_name} sera créée au premier chargement")
+    noms_extraction = {f.name for f in colonnes_extraction()}
+    champs = [f for f in schema if f.name not in noms_extraction]
+    cache = obtenir_cache_metadonnees()
+    table = cache.table(table_ref)
+    if table is None:
+        table = bigquery.Table(table_ref, schema=champs + colonnes_extraction())
+        if source_name:
+            appliquer_partitionnement(table, source_name, [f.name for f in table.schema])
+        table = client.create_table(table)
+        cache.memoriser_table(table)
+        logger.info(
+            f"Table créée : {table_ref} (partition : {table.time_partitioning.field if table.time_partitioning else 'aucune'}, "
+            f"clustering : {', '.join(table.clustering_fields or []) or 'aucun'})"
+        )
+        return [f.name for f in champs]
+
+    existants = types_schema_bigquery(table.schema)
+    conflits = [
+        f"{f.name} ({existants[f.name]} dans la table, {normaliser_type(f.field_type)} attendu)"
+        for f in champs
+        if f.name in existants and existants[f.name] != normaliser_type(f.field_type)
+    ]
+    if conflits:
+        raise ValueError(f"Types incompatibles avec {table_name} : {', '.join(conflits)} (python -m functions.step2_load migrer)")
+    manquants = [
+        # Une colonne ajoutée à une table existante ne peut pas être obligatoire
+        bigquery.SchemaField(f.name, f.field_type, mode='NULLABLE' if f.mode == 'REQUIRED' else f.mode, fields=f.fields)
+        for f in champs + colonnes_extraction()
+        if f.name not in existants
+    ]
+    if manquants:
+        table.schema = list(table.schema) + manquants
+        cache.memoriser_table(client.update_table(table, ['schema']))
+        logger.info(f"Colonnes ajoutées à {table_name} : {', '.join(f.name for f in manquants)}")
+    return [f.name for f in champs]
 
 
 # ---------------------------------------------------------------------------
 # Chargement
 # ---------------------------------------------------------------------------
 
+def verifier_empreinte_fichier(source_info: Dict) -> bool:
+    """
+    Compare le CRC32C enregistré par l'étape 1 avec celui de l'objet GCS
+
+    Seules les métadonnées de l'objet sont lues. Sans empreinte enregistrée
+    (batch antérieur aux manifests), le fichier est accepté.
+    """
+    if not source_info.get('crc32c'):
+        return True
+    bucket = obtenir_stockage().conteneur()
+    blob = bucket.get_blob(source_info['blob_name'])
+    if blob is None:
+        logger.error(f"Fichier introuvable dans le stockage : {source_info['blob_name']}")
+        return False
+    if blob.crc32c != source_info['crc32c']:
+        logger.error(
+            f"Empreinte CRC32C différente pour {source_info['blob_name']} : "
+            f"GCS {blob.crc32c}, manifest {source_info['crc32c']}"
+        )
+        return False
+    return True
+
+
 def charger_fichier_vers_bigquery(source_info: Dict, extraction_datetime: datetime) -> bool:
     """Charge un fichier GCS vers BigQuery"""
+    if not verifier_empreinte_fichier(source_info):
+        logger.error(f"Chargement de {source_info['source']} annulé (fichier modifié depuis l'extraction)")
+        return False
     client = get_gcp_client('bigquery')
     table_name = obtenir_nom_table(source_info['source'], 'raw')
-    creer_table_si_necessaire(table_name)
     table_ref = f"{ENV['project_id']}.{ENV['dataset']}.{table_name}"
-    uri = f"gs://{ENV['bucket']}/{source_info['blob_name']}"
+    table_chargement = f"{ENV['project_id']}.{ENV['dataset']}.{PREFIXE_TABLE_CHARGEMENT}{table_name}_{uuid.uuid4().hex[:8]}"
+    stockage = obtenir_stockage()
+    cache = obtenir_cache_metadonnees()
     try:
+        # 1. Fichier chargé seul dans une table de chargement (le Parquet porte son schéma)
         job_config = bigquery.LoadJobConfig(
             source_format=bigquery.SourceFormat.PARQUET,
-            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
-            autodetect=True
+            write_disposition=bigquery.WriteDisposition.WRITE_TRUNCATE
         )
-        load_job = client.load_table_from_uri(uri, table_ref, job_config=job_config)
+        if stockage.nom == 'gcs':
+            load_job = client.load_table_from_uri(stockage.uri(source_info['blob_name']), table_chargement, job_config=job_config)
+        else:
+            # Backend local : le fichier est envoyé avec le job de chargement
+            with stockage.conteneur().blob(source_info['blob_name']).open('rb') as fichier:
+                load_job = client.load_table_from_file(fichier, table_chargement, job_config=job_config)
         load_job.result()
-        logger.info(f"{source_info['source']} chargé : {load_job.output_rows} lignes")
-
-        # Ajouter colonnes temporelles
-        timestamp_col = CONFIG['historique']['colonne_timestamp']
-        date_col = CONFIG['historique']['colonne_date']
-        update_query = f"""
-        UPDATE `{table_ref}`
-        SET 
-            {timestamp_col} = TIMESTAMP('{extraction_datetime.strftime('%Y-%m-%d %H:%M:%S')}'),
-            {date_col} = DATE('{extraction_datetime.strftime('%Y-%m-%d')}')
-        WHERE {timestamp_col} IS NULL
-        """
-        client.query(update_query).result()
-        logger.info(f"Colonnes temporelles mises à jour : {timestamp_col}, {date_col}")
+        if source_info.get('lignes') is not None and load_job.output_rows != source_info['lignes']:
+            logger.warning(
+                f"{source_info['source']} : {load_job.output_rows} lignes chargées, "
+                f"{source_info['lignes']} annoncées par le manifest"
+            )
+
+        # 2. Schéma du registre (types normalisés à l'ajout), sinon schéma du fichier
+        #    (schéma du fichier relu seulement si son empreinte a changé depuis le dernier chargement)
+        schema_fichier = cache.schema_fichier(source_info['source'], source_info.get('empreinte_schema'))
+        if schema_fichier is None:
+            schema_fichier = client.get_table(table_chargement).schema
+            cache.memoriser_schema_fichier(source_info['source'], source_info.get('empreinte_schema'), schema_fichier)
+        version = version_schema(source_info['source']) if obtenir_parametres_schemas()['actif'] else None
+        expressions = None
+        if version is None:
+            schema = schema_fichier
+        else:
+            attendu = types_attendus(version)
+            observe = types_schema_bigquery(schema_fichier)
+            ecarts = comparer_schemas(attendu, observe)
+            if a_des_ecarts(ecarts):
+                logger.warning(f"{source_info['source']} : écarts avec le schéma v{version['version']} : {decrire_ecarts(ecarts)}")
+                enregistrer_ecarts(stockage.conteneur(), source_info['source'], source_info['timestamp'], version['version'], ecarts)
+                if obtenir_parametres_schemas()['evolution'] == 'bloquer' and a_des_ecarts(ecarts, colonnes_seulement=True):
+                    logger.error(
+                        f"Chargement de {source_info['source']} annulé : colonnes différentes du registre "
+                        f"(ajouter une version à config/schemas/{source_info['source']}.yaml)"
+                    )
+                    return False
+            schema = champs_bigquery(version)
+            expressions = expressions_normalisation(attendu, observe)
+
+        # 3. Ajout à la table raw avec les colonnes temporelles, dans une transaction qui
+        #    remplace une tentative précédente du batch et enregistre le chargement au ledger.
+        #    Seules la table de chargement et la partition du jour sont lues.
+        colonnes = creer_table_si_necessaire(table_name, schema, source_info['source'])
+        transaction = client.query(
+            requete_remplacement(table_ref, table_chargement, colonnes, extraction_datetime, expressions),
+            job_config=bigquery.QueryJobConfig(query_parameters=parametres_remplacement(
+                source_info, table_name, version['version'] if version else None
+            ))
+        )
+        transaction.result()
+        logger.info(
+            f"{source_info['source']} chargé : {load_job.output_rows} lignes "
+            f"({(transaction.total_bytes_processed or 0) / 1024**2:.1f} MB lus, job {transaction.job_id})"
+        )
         return True
     except Exception as e:
         logger.error(f"Erreur chargement {source_info['source']} : {e}")
+        # La table a pu changer hors du pipeline : relue au prochain chargement
+        cache.invalider(table_ref)
         return False
+    finally:
+        if client is not None:
+            try:
+                client.delete_table(table_chargement, not_found_ok=True)
+            except Exception as e:
+                logger.warning(f"Table de chargement {table_chargement} non supprimée : {e}")
 
 
-def charger_batch_vers_bigquery(timestamp: str = None, date: str = None) -> bool:
-    """Charge tous les fichiers d'un batch vers BigQuery"""
+def charger_batch_vers_bigquery(timestamp: str = None, date: str = None, forcer: bool = False) -> bool:
+    """
+    Charge tous les fichiers d'un batch vers BigQuery
+
+    Les fichiers déjà enregistrés dans le ledger des chargements (même chemin,
+    même CRC32C) sont ignorés, sauf avec forcer=True : ils sont alors remplacés.
+    Les sources en mode externe ne sont pas chargées : leur table externe est
+    redéfinie sur les derniers batchs.
+    """
     logger.info("=" * 80)
     logger.info("ÉTAPE 2 : CHARGEMENT VERS BIGQUERY")
     logger.info("=" * 80)
 
     creer_dataset_si_necessaire()
+    creer_ledger_si_necessaire()
 
     # Sélection du batch
+    catalogue = obtenir_catalogue()
     if not timestamp and not date:
-        fichiers = lister_fichiers_par_timestamp()
-        if not fichiers:
+        timestamp = catalogue.dernier()
+        if not timestamp:
             logger.error("Aucun fichier trouvé dans GCS")
             return False
-        timestamp = sorted(fichiers.keys(), reverse=True)[0]
         logger.info(f"Batch le plus récent : {timestamp}")
     elif date and not timestamp:
-        year_month = date[:7]
-        fichiers = lister_fichiers_par_timestamp(year_month)
-        batches_date = [ts for ts in fichiers.keys() if ts.startswith(date)]
-        if not batches_date:
+        timestamp = catalogue.dernier(date)
+        if not timestamp:
             logger.error(f"Aucun batch trouvé pour la date {date}")
             return False
-        timestamp = sorted(batches_date, reverse=True)[0]
         logger.info(f"Batch le plus récent du {date} : {timestamp}")
 
-    # Récupérer les fichiers du batch
-    year_month = timestamp[:7]
-    fichiers = lister_fichiers_par_timestamp(year_month, timestamp)
-    sources = fichiers.get(timestamp, [])
+    # Récupérer les fichiers du batch (manifest, sinon catalogue)
+    manifest = lire_manifest(obtenir_stockage().conteneur(), timestamp)
+    if manifest:
+        sources = [infos_depuis_manifest(f, timestamp) for f in fichiers_du_manifest(manifest)]
+    else:
+        sources = catalogue.lister(timestamp=timestamp).get(timestamp, [])
     if not sources:
         logger.error(f"Batch {timestamp} introuvable")
         return False
 
     extraction_datetime = sources[0]['datetime']
-    resultats = [charger_fichier_vers_bigquery(s, extraction_datetime) for s in sources]
+    chargements = {} if forcer else lire_chargements(timestamp)
+    resultats = []
+    deja_charges = 0
+    for source_info in sources:
+        if mode_chargement(source_info['source']) == 'externe':
+            # Ni chargement ni ledger : la vue raw lit les fichiers des derniers batchs
+            resultats.append(definir_table_externe(source_info['source'], obtenir_nom_table(source_info['source'], 'raw')))
+            continue
+        entree = chargements.get(source_info['source'])
+        if deja_charge(entree, source_info):
+            logger.info(
+                f"{source_info['source']} déjà chargé pour ce batch ({entree['lignes']} lignes, "
+                f"job {entree['job_id']}), ignoré"
+            )
+            deja_charges += 1
+            resultats.append(True)
+            continue
+        resultats.append(charger_fichier_vers_bigquery(source_info, extraction_datetime))
 
     # Résumé
     succes_count = sum(resultats)
     total_count = len(resultats)
     logger.info("\n" + "=" * 80)
-    logger.info(f"Total : {succes_count}/{total_count} fichiers chargés")
+    logger.info(f"Total : {succes_count}/{total_count} fichiers chargés (dont {deja_charges} déjà chargé(s))")
     logger.info(f"Timestamp batch : {timestamp}")
+    journaliser_statistiques_clients()
+    journaliser_statistiques_metadonnees()
     logger.info("=" * 80)
     return all(resultats)
 
 
+# ---------------------------------------------------------------------------
+# Migration des tables raw existantes
+# ---------------------------------------------------------------------------
+
+def migrer_table_raw(source_name: str, garder_sauvegarde: bool = False) -> bool:
+    """
+    Partitionne et clusterise une table raw créée avant le partitionnement, et
+    convertit ses colonnes aux types du registre des schémas
+
+    La partition et les types d'une table ne peuvent pas être modifiés : la table
+    est renommée ({table}__avant_migration) puis recréée par CREATE TABLE ... AS
+    SELECT. La sauvegarde est supprimée si les nombres de lignes concordent. Une
+    table déjà partitionnée et aux bons types ne reçoit que le nouveau clustering
+    (appliqué aux données chargées ensuite).
+    """
+    client = get_gcp_client('bigquery')
+    table_name = obtenir_nom_table(source_name, 'raw')
+    table_ref = f"{ENV['project_id']}.{ENV['dataset']}.{table_name}"
+    parametres = parametres_table_raw(source_name)
+    obtenir_cache_metadonnees().invalider(table_ref)
+
+    try:
+        table = client.get_table(table_ref)
+    except NotFound:
+        logger.info(f"{table_name} : table absente, elle sera créée partitionnée au premier chargement")
+        return True
+
+    colonnes = [f.name for f in table.schema]
+    clustering = [c for c in parametres['clustering'] if c in colonnes]
+    partition_actuelle = table.time_partitioning.field if table.time_partitioning else None
+
+    conversions = []
+    version = version_schema(source_name) if obtenir_parametres_schemas()['actif'] else None
+    if version is not None:
+        actuels = types_schema_bigquery(table.schema)
+        conversions = [
+            f"CAST(`{nom}` AS {type_bq}) AS `{nom}`"
+            for nom, type_bq in types_attendus(version).items()
+            if nom in actuels and actuels[nom] != type_bq
+        ]
+
+    if partition_actuelle == parametres['partition'] and not conversions:
+        if (table.clustering_fields or []) == clustering:
+            logger.info(f"{table_name} : déjà partitionnée et clusterisée")
+            return True
+        table.clustering_fields = clustering or None
+        client.update_table(table, ['clustering_fields'])
+        logger.info(f"{table_name} : clustering mis à jour ({', '.join(clustering) or 'aucun'})")
+        return True
+
+    if parametres['partition'] and parametres['partition'] not in colonnes:
+        logger.error(f"{table_name} : colonne {parametres['partition']} absente, migration impossible")
+        return False
+
+    sauvegarde = f"{table_name}__avant_migration"
+    sauvegarde_ref = f"{ENV['project_id']}.{ENV['dataset']}.{sauvegarde}"
+    try:
+        client.get_table(sauvegarde_ref)
+        logger.error(f"{table_name} : {sauvegarde} existe déjà (migration précédente interrompue ?)")
+        return False
+    except NotFound:
+        pass
+
+    clauses = []
+    if parametres['partition']:
+        clauses.append(f"PARTITION BY {parametres['partition']}")
+    if clustering:
+        clauses.append(f"CLUSTER BY {', '.join(clustering)}")
+    selection = f"* REPLACE ({', '.join(conversions)})" if conversions else '*'
+
+    logger.info(
+        f"{table_name} : migration ({table.num_rows} lignes, {' '.join(clauses) or 'sans partition'}"
+        f"{f', {len(conversions)} colonne(s) convertie(s)' if conversions else ''})"
+    )
+    client.query(f"ALTER TABLE `{table_ref}` RENAME TO `{sauvegarde}`").result()
+    try:
+        client.query(f"""
+        CREATE TABLE `{table_ref}`
+        {' '.join(clauses)}
+        AS SELECT {selection} FROM `{sauvegarde_ref}`
+        """).result()
+    except Exception as e:
+        logger.error(f"{table_name} : échec de la recréation, table d'origine restaurée : {e}")
+        client.query(f"ALTER TABLE `{sauvegarde_ref}` RENAME TO `{table_name}`").result()
+        return False
+
+    lignes_avant = client.get_table(sauvegarde_ref).num_rows
+    lignes_apres = client.get_table(table_ref).num_rows
+    if lignes_avant != lignes_apres:
+        logger.error(f"{table_name} : {lignes_apres} lignes après migration pour {lignes_avant} avant, {sauvegarde} conservée")
+        return False
+    if garder_sauvegarde:
+        logger.info(f"{table_name} : migrée ({lignes_apres} lignes), sauvegarde conservée dans {sauvegarde}")
+    else:
+        client.delete_table(sauvegarde_ref)
+        logger.info(f"{table_name} : migrée ({lignes_apres} lignes)")
+    return True
+
+
+def migrer_tables_raw(garder_sauvegarde: bool = False) -> Dict[str, bool]:
+    """Migre les tables raw de toutes les sources actives"""
+    resultats = {}
+    for source in CONFIG['data_sources']['sources']:
+        if not source.get('active', True) or mode_chargement(source['name']) == 'externe':
+            continue
+        try:
+            resultats[source['name']] = migrer_table_raw(source['name'], garder_sauvegarde)
+        except Exception as e:
+            logger.error(f"Migration de {source['name']} : {e}")
+            resultats[source['name']] = False
+    return resultats
+
+
 # ---------------------------------------------------------------------------
 # Point d'entrée
 # ---------------------------------------------------------------------------
@@ -248,8 +508,20 @@ if __name__ == "__main__":
                 print(f"  {ts}: {len(batch)} fichier(s)")
         
         elif cmd == "load":
-            ts = sys.argv[2] if len(sys.argv) > 2 else None
-            charger_batch_vers_bigquery(timestamp=ts)
+            arguments = [a for a in sys.argv[2:] if a != '--forcer']
+            ts = arguments[0] if arguments else None
+            charger_batch_vers_bigquery(timestamp=ts, forcer='--forcer' in sys.argv)
+        
+        elif cmd == "backfill" and len(sys.argv) > 3:
+            from functions.backfill import reprendre_historique
+            succes = reprendre_historique(sys.argv[2], sys.argv[3], forcer='--forcer' in sys.argv)
+            sys.exit(0 if succes else 1)
+        
+        elif cmd == "migrer":
+            resultats = migrer_tables_raw(garder_sauvegarde='--garder' in sys.argv)
+            print(f"\nTables migrées : {sum(resultats.values())}/{len(resultats)}")
+            for nom, ok in resultats.items():
+                print(f"  {nom}: {'OK' if ok else 'ÉCHEC'}")
         
         else:
             print(f"Commande inconnue : {cmd}")
@@ -258,6 +530,9 @@ if __name__ == "__main__":
             print("  python -m functions.step2_load list               # Liste tous les batchs")
             print("  python -m functions.step2_load list 2024-12       # Liste les batchs de déc 2024")
             print("  python -m functions.step2_load load <TIMESTAMP>   # Charge un batch spécifique")
+            print("  python -m functions.step2_load load <TIMESTAMP> --forcer  # Recharge même si déjà au ledger")
+            print("  python -m functions.step2_load backfill <DEBUT> <FIN> [--forcer]  # Charge les batchs d'une période (AAAA-MM-JJ), un job par source")
+            print("  python -m functions.step2_load migrer [--garder]  # Partitionne / clusterise les tables raw existantes")
     else:
         # Sans argument : charge le batch le plus récent
         charger_batch_vers_bigquery()
\ No newline at end of file
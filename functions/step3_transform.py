@@ -1,75 +1,63 @@
 """
 Étape 3 : Transformation des données dans BigQuery
 Crée les vues de nettoyage et d'enrichissement avec filtrage par timestamp
+
+Les sources inchangées ne sont pas rechargées (étape 1) : un batch peut ne contenir
+qu'une partie des tables raw. Chaque vue est donc filtrée sur le dernier timestamp
+de sa propre table raw (au plus tard le timestamp sélectionné).
 """
 
-from google.cloud import bigquery, storage
 import logging
 from typing import Dict, List, Optional
-import os
 from pathlib import Path
 from datetime import datetime
-import streamlit as st
 import logging
 
 from config import CONFIG, ENV
+from functions.gcp_clients import get_gcp_client
 
 logging.basicConfig(level=ENV.get('log_level', 'INFO'))
 logger = logging.getLogger(__name__)
 
-def get_gcp_client(client_type='storage'):
-    """Initialise un client GCP - détecte automatiquement l'environnement"""
-    
-    # Construire le chemin vers le fichier local
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(current_dir)
-    creds_path = os.path.join(parent_dir, 'config', 'gcp-credentials.json')
-        # TESTER si le fichier existe
-    if os.path.exists(creds_path):
-        try:
-            # ENVIRONNEMENT LOCAL
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
-            
-            if client_type == 'storage':
-                return storage.Client(project=ENV['project_id'])
-            else:
-                return bigquery.Client(project=ENV['project_id'])
-        except:
-            logger.info("DEBUG: Mode LOCAL")
-            return None
+# Table raw lue par chaque vue filtrée par timestamp
+TABLES_RAW_VUES = {
+    '01_ratios_cleaned.sql': 'ratios_inpi_raw',
+    '02_stock_cleaned.sql': 'stock_entreprises_raw'
+}
 
-    else:
-            try:
-            # ENVIRONNEMENT STREAMLIT CLOUD (pas de fichier local)
-                from google.oauth2 import service_account
-                creds = service_account.Credentials.from_service_account_info(st.secrets["gcp"])
-                
-                if client_type == 'storage':
-                    return storage.Client(credentials=creds, project=ENV['project_id'])
-                else:
-                    return bigquery.Client(credentials=creds, project=ENV['project_id'])
-            except Exception as e:
-                    logger.info("DEBUG: Mode streamlit")
-                    return None
 
-def obtenir_timestamps_disponibles() -> List[datetime]:
-    """Récupère la liste des timestamps disponibles dans les tables raw"""
-    client = get_gcp_client('bigquery')
-    
-    query = f"""
-    SELECT DISTINCT extraction_timestamp
-    FROM `{ENV['project_id']}.{ENV['dataset']}.ratios_inpi_raw`
-    WHERE extraction_timestamp IS NOT NULL
-    ORDER BY extraction_timestamp DESC
+def obtenir_timestamps_disponibles(table_raw: Optional[str] = None) -> List[datetime]:
+    """
+    Récupère la liste des timestamps disponibles (du plus récent au plus ancien)
+
+    Dans une table raw, ou dans l'ensemble des tables raw des vues sans table_raw.
     """
+    client = get_gcp_client('bigquery')
+    tables = [table_raw] if table_raw else sorted(set(TABLES_RAW_VUES.values()))
+    
+    timestamps = set()
+    for table in tables:
+        query = f"""
+        SELECT DISTINCT extraction_timestamp
+        FROM `{ENV['project_id']}.{ENV['dataset']}.{table}`
+        WHERE extraction_timestamp IS NOT NULL
+        """
+        try:
+            results = client.query(query).result()
+            timestamps.update(row.extraction_timestamp for row in results)
+        except Exception as e:
+            logger.error(f"Erreur lors de la récupération des timestamps de {table} : {e}")
     
-    try:
-        results = client.query(query).result()
-        timestamps = [row.extraction_timestamp for row in results]
-        return timestamps
-    except Exception as e:
-        logger.error(f"Erreur lors de la récupération des timestamps : {e}")
-        return []
+    return sorted(timestamps, reverse=True)
+
+
+def timestamp_de_la_table(table_raw: str, timestamp: datetime) -> datetime:
+    """Dernier timestamp de la table raw au plus tard à timestamp (source inchangée depuis)"""
+    for timestamp_table in obtenir_timestamps_disponibles(table_raw):
+        if timestamp_table <= timestamp:
+            return timestamp_table
+    logger.warning(f"{table_raw} : aucun batch au plus tard le {timestamp}")
+    return timestamp
 
 
 def selectionner_timestamp(timestamp: Optional[str] = None) -> Optional[datetime]:
@@ -116,10 +104,7 @@ def lire_fichier_sql(nom_fichier: str) -> str:
 
 
 def formater_sql(sql_template: str, timestamp: Optional[datetime] = None) -> str:
-    """Remplace les placeholders dans le SQL par les valeurs de config"""
-    if timestamp is None:
-        timestamp = selectionner_timestamp()
-    
+    """Remplace les placeholders dans le SQL par les valeurs de config (sans timestamp : aucun filtre)"""
     if timestamp:
         timestamp_filter = f"AND extraction_timestamp = TIMESTAMP('{timestamp.isoformat()}')"
     else:
@@ -198,7 +183,10 @@ def transform_data(timestamp: Optional[str] = None) -> Dict[str, bool]:
         logger.info(f"Description : {vue['description']}")
         logger.info(f"{'-' * 80}")
         
-        succes = creer_vue(vue['nom'], vue['fichier'], timestamp_dt)
+        # Chaque vue suit le dernier batch de sa table raw, pas celui d'une autre source
+        table_raw = TABLES_RAW_VUES.get(vue['fichier'])
+        timestamp_vue = timestamp_de_la_table(table_raw, timestamp_dt) if (table_raw and timestamp_dt) else None
+        succes = creer_vue(vue['nom'], vue['fichier'], timestamp_vue)
         resultats[vue['nom']] = succes
     
     logger.info("\n" + "=" * 80)
@@ -0,0 +1,391 @@
+"""
+Backends de stockage des fichiers bruts (étapes 1 et 2, interface)
+Le pipeline manipule un conteneur au sens de google.cloud.storage (bucket / blob) :
+- "gcs"   : bucket GCS (comportement historique)
+- "local" : arborescence sur disque exposant le même sous-ensemble d'API, pour
+            exécuter ou mesurer l'ingestion hors ligne (storage.backend, ou STORAGE_BACKEND)
+"""
+
+import base64
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import google_crc32c
+from google.api_core.exceptions import PreconditionFailed
+
+from config import CONFIG, ENV
+from functions.gcp_clients import get_gcp_client
+from functions.resumable_upload import EmpreintesUpload, SessionUploadReprenable
+
+logging.basicConfig(level=ENV.get('log_level', 'INFO'))
+logger = logging.getLogger(__name__)
+
+_stockage = None
+_verrou_stockage = threading.Lock()
+
+# Écritures en cours du backend local (exclues des listings)
+DOSSIER_ECRITURES = '.ecritures'
+
+
+def obtenir_parametres_stockage() -> Dict:
+    """Retourne le backend choisi (STORAGE_BACKEND, sinon storage.backend) et ses paramètres"""
+    return {
+        'backend': (ENV.get('storage_backend') or CONFIG['storage'].get('backend', 'gcs')).lower(),
+        'dossier_local': CONFIG['storage'].get('dossier_local', '.stockage_local')
+    }
+
+
+class BackendStockage:
+    """
+    Interface commune des backends
+
+    conteneur() retourne un objet compatible avec google.cloud.storage.Bucket
+    (blob, get_blob, list_blobs, exists) : ledger, manifests et réglages
+    mémorisés l'utilisent sans distinction de backend.
+    """
+
+    nom = None
+
+    def conteneur(self):
+        raise NotImplementedError
+
+    def verifier_conteneur(self):
+        """Crée le conteneur s'il n'existe pas et le retourne"""
+        raise NotImplementedError
+
+    def uri(self, chemin: str) -> str:
+        """URI lisible d'un objet (journaux, chargement BigQuery)"""
+        raise NotImplementedError
+
+    def creer_ecriture(self, blob, taille_morceau: int, timeout: int,
+                       content_type: Optional[str] = None, tampon: Optional[bytearray] = None) -> EmpreintesUpload:
+        """Writer en flux vers un objet (interface de SessionUploadReprenable)"""
+        raise NotImplementedError
+
+    def lister(self, prefixe: str) -> Iterator:
+        return self.conteneur().list_blobs(prefix=prefixe)
+
+
+class BackendGCS(BackendStockage):
+    """Bucket GCS du pipeline (ENV['bucket'])"""
+
+    nom = 'gcs'
+
+    def __init__(self, client):
+        self.client = client
+
+    def conteneur(self):
+        return self.client.bucket(ENV['bucket'])
+
+    def verifier_conteneur(self):
+        bucket_name = ENV['bucket']
+        bucket = self.client.bucket(bucket_name)
+
+        if not bucket.exists():
+            logger.info(f"Bucket '{bucket_name}' n'existe pas, création en cours...")
+            try:
+                bucket = self.client.create_bucket(bucket_name, location=ENV['region'])
+                logger.info(f"Bucket créé : gs://{bucket_name}")
+            except Exception as e:
+                logger.error(f"Impossible de créer le bucket : {e}")
+                raise
+        else:
+            logger.info(f"Bucket existant : gs://{bucket_name}")
+
+        return bucket
+
+    def uri(self, chemin: str) -> str:
+        return f"gs://{ENV['bucket']}/{chemin}"
+
+    def creer_ecriture(self, blob, taille_morceau: int, timeout: int,
+                       content_type: Optional[str] = None, tampon: Optional[bytearray] = None) -> EmpreintesUpload:
+        return SessionUploadReprenable(blob, chunk_size=taille_morceau, timeout=timeout, content_type=content_type, tampon=tampon)
+
+
+class BlobLocal:
+    """Fichier du backend local, avec le sous-ensemble de l'API Blob utilisé par le pipeline"""
+
+    def __init__(self, bucket: 'BucketLocal', name: str):
+        self.bucket = bucket
+        self.name = name
+        self.chemin = bucket.racine / name
+        self.content_type = None
+        self._empreintes = None
+
+    def exists(self, timeout: Optional[int] = None) -> bool:
+        return self.chemin.is_file()
+
+    @property
+    def size(self) -> Optional[int]:
+        return self.chemin.stat().st_size if self.exists() else None
+
+    @property
+    def updated(self) -> Optional[datetime]:
+        if not self.exists():
+            return None
+        return datetime.fromtimestamp(self.chemin.stat().st_mtime, tz=timezone.utc)
+
+    @property
+    def generation(self) -> Optional[int]:
+        """Équivalent local de la génération GCS : date de modification en nanosecondes"""
+        return self.chemin.stat().st_mtime_ns if self.exists() else None
+
+    def reload(self, timeout: Optional[int] = None):
+        """Recalcule les empreintes (MD5, CRC32C au format GCS) à partir du fichier"""
+        md5, crc32c = hashlib.md5(), google_crc32c.Checksum()
+        with open(self.chemin, 'rb') as fichier:
+            while True:
+                morceau = fichier.read(8 * 1024 * 1024)
+                if not morceau:
+                    break
+                md5.update(morceau)
+                crc32c.update(morceau)
+        self._empreintes = (
+            base64.b64encode(md5.digest()).decode(),
+            base64.b64encode(crc32c.digest()).decode()
+        )
+
+    @property
+    def md5_hash(self) -> Optional[str]:
+        if self._empreintes is None and self.exists():
+            self.reload()
+        return self._empreintes[0] if self._empreintes else None
+
+    @property
+    def crc32c(self) -> Optional[str]:
+        if self._empreintes is None and self.exists():
+            self.reload()
+        return self._empreintes[1] if self._empreintes else None
+
+    def open(self, mode: str = 'rb', **kwargs):
+        if 'r' not in mode:
+            raise ValueError("Backend local : blob.open() n'est disponible qu'en lecture")
+        return open(self.chemin, mode, **({'encoding': 'utf-8'} if 'b' not in mode else {}))
+
+    def download_as_bytes(self, timeout: Optional[int] = None) -> bytes:
+        return self.chemin.read_bytes()
+
+    def download_as_text(self, timeout: Optional[int] = None) -> str:
+        return self.chemin.read_text(encoding='utf-8')
+
+    def upload_from_string(self, donnees, content_type: Optional[str] = None, timeout: Optional[int] = None,
+                           if_generation_match: Optional[int] = None, **kwargs):
+        """
+        Écrit l'objet atomiquement (fichier temporaire puis renommage)
+
+        if_generation_match se comporte comme sur GCS (0 : l'objet ne doit pas
+        exister), au sein du processus.
+        """
+        if isinstance(donnees, str):
+            donnees = donnees.encode('utf-8')
+        temporaire = self.bucket.chemin_temporaire()
+        temporaire.write_bytes(donnees)
+        with self.bucket.verrou:
+            if if_generation_match is not None and (self.generation or 0) != if_generation_match:
+                temporaire.unlink()
+                raise PreconditionFailed(f"{self.name} : génération {self.generation}, {if_generation_match} attendue")
+            self.bucket.publier(temporaire, self.name)
+        self._empreintes = None
+
+    def compose(self, sources: List['BlobLocal'], timeout: Optional[int] = None):
+        """Concatène les objets sources dans cet objet (équivalent de compose)"""
+        temporaire = self.bucket.chemin_temporaire()
+        with open(temporaire, 'wb') as sortie:
+            for source in sources:
+                with open(source.chemin, 'rb') as entree:
+                    shutil.copyfileobj(entree, sortie, 8 * 1024 * 1024)
+        self.bucket.publier(temporaire, self.name)
+        self._empreintes = None
+
+    def delete(self, timeout: Optional[int] = None):
+        """Supprime l'objet et les dossiers devenus vides (GCS n'a pas de dossiers)"""
+        self.chemin.unlink()
+        self._empreintes = None
+        self.bucket.elaguer(self.chemin.parent)
+
+
+class ListeLocale:
+    """Résultat de BucketLocal.list_blobs : itérable de blobs, avec les sous-dossiers dans prefixes"""
+
+    def __init__(self, blobs: List[BlobLocal], prefixes: set):
+        self.blobs = blobs
+        self.prefixes = prefixes
+
+    def __iter__(self) -> Iterator[BlobLocal]:
+        return iter(self.blobs)
+
+
+class BucketLocal:
+    """Dossier jouant le rôle de bucket : les noms d'objets sont des chemins relatifs"""
+
+    def __init__(self, racine: Path):
+        self.racine = Path(racine)
+        self.name = self.racine.name
+        # Réentrant : publier() est aussi appelé sous verrou par upload_from_string
+        self.verrou = threading.RLock()
+
+    def exists(self, timeout: Optional[int] = None) -> bool:
+        return self.racine.is_dir()
+
+    def blob(self, name: str) -> BlobLocal:
+        return BlobLocal(self, name)
+
+    def get_blob(self, name: str, timeout: Optional[int] = None) -> Optional[BlobLocal]:
+        blob = self.blob(name)
+        return blob if blob.exists() else None
+
+    def list_blobs(self, prefix: str = '', delimiter: Optional[str] = None, timeout: Optional[int] = None) -> 'ListeLocale':
+        """
+        Objets dont le nom commence par prefix, dans l'ordre lexicographique (comme GCS)
+
+        Avec delimiter='/', seuls les objets directement sous prefix sont retournés ;
+        les sous-dossiers sont dans .prefixes (comme l'itérateur GCS).
+        """
+        dossier = self.racine / prefix.rsplit('/', 1)[0] if '/' in prefix else self.racine
+        if not dossier.is_dir():
+            return ListeLocale([], set())
+        noms = sorted(
+            chemin.relative_to(self.racine).as_posix()
+            for chemin in dossier.rglob('*')
+            if chemin.is_file()
+        )
+        noms = [nom for nom in noms if nom.startswith(prefix) and not nom.startswith(f"{DOSSIER_ECRITURES}/")]
+        prefixes = set()
+        if delimiter:
+            directs = []
+            for nom in noms:
+                reste = nom[len(prefix):]
+                if delimiter in reste:
+                    prefixes.add(prefix + reste.split(delimiter, 1)[0] + delimiter)
+                else:
+                    directs.append(nom)
+            noms = directs
+        return ListeLocale([self.blob(nom) for nom in noms], prefixes)
+
+    def chemin_temporaire(self) -> Path:
+        dossier = self.racine / DOSSIER_ECRITURES
+        dossier.mkdir(parents=True, exist_ok=True)
+        return dossier / f"{uuid.uuid4().hex}.part"
+
+    def elaguer(self, dossier: Path):
+        """Supprime dossier et ses parents tant qu'ils sont vides, sans remonter au-delà de la racine"""
+        with self.verrou:
+            while dossier != self.racine and self.racine in dossier.parents:
+                try:
+                    dossier.rmdir()
+                except OSError:
+                    # Non vide
+                    return
+                dossier = dossier.parent
+
+    def publier(self, temporaire: Path, name: str):
+        destination = self.racine / name
+        with self.verrou:
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(temporaire, destination)
+
+
+class EcritureLocale(EmpreintesUpload):
+    """
+    Writer vers un fichier du backend local, même interface que SessionUploadReprenable
+
+    Chaque write est persisté immédiatement : l'offset confirmé est le nombre d'octets
+    écrits et une reprise repart de là. L'objet n'est visible qu'après close().
+    """
+
+    def __init__(self, blob: BlobLocal, timeout: int):
+        self.blob = blob
+        self.timeout = timeout
+        self.temporaire = blob.bucket.chemin_temporaire()
+        self.fichier = open(self.temporaire, 'wb')
+        self._reinitialiser()
+
+    def _reinitialiser(self):
+        self.offset = 0
+        self.termine = False
+        self.objet = None
+        self._reinitialiser_empreintes()
+
+    @property
+    def taille(self) -> int:
+        return self.offset
+
+    def write(self, donnees) -> int:
+        self.fichier.write(donnees)
+        self._hacher(donnees)
+        self.offset += len(donnees)
+        return len(donnees)
+
+    def close(self):
+        self.fichier.close()
+        self.blob.bucket.publier(self.temporaire, self.blob.name)
+        self.blob._empreintes = None
+        self.termine = True
+
+    def reprendre(self) -> int:
+        return self.offset
+
+    def recommencer(self):
+        self.fichier.seek(0)
+        self.fichier.truncate()
+        self._reinitialiser()
+
+    def annuler(self):
+        if self.termine:
+            return
+        self.fichier.close()
+        self.temporaire.unlink(missing_ok=True)
+
+
+class BackendLocal(BackendStockage):
+    """Arborescence locale : {dossier_local}/{bucket}/{nom d'objet}"""
+
+    nom = 'local'
+
+    def __init__(self, dossier: str):
+        self.racine = Path(dossier) / (ENV.get('bucket') or 'pipeline')
+        self.bucket = BucketLocal(self.racine)
+
+    def conteneur(self) -> BucketLocal:
+        return self.bucket
+
+    def verifier_conteneur(self) -> BucketLocal:
+        if not self.bucket.exists():
+            self.racine.mkdir(parents=True, exist_ok=True)
+            logger.info(f"Stockage local créé : {self.racine}")
+        else:
+            logger.info(f"Stockage local existant : {self.racine}")
+        return self.bucket
+
+    def uri(self, chemin: str) -> str:
+        return (self.racine / chemin).resolve().as_uri()
+
+    def creer_ecriture(self, blob, taille_morceau: int, timeout: int,
+                       content_type: Optional[str] = None, tampon: Optional[bytearray] = None) -> EcritureLocale:
+        return EcritureLocale(blob, timeout)
+
+
+def obtenir_stockage() -> BackendStockage:
+    """Backend de stockage du processus (créé à la première utilisation)"""
+    global _stockage
+    with _verrou_stockage:
+        if _stockage is None:
+            parametres = obtenir_parametres_stockage()
+            if parametres['backend'] == 'local':
+                _stockage = BackendLocal(parametres['dossier_local'])
+                logger.info(f"Backend de stockage local : {_stockage.racine}")
+            elif parametres['backend'] == 'gcs':
+                client = get_gcp_client('storage')
+                if client is None:
+                    raise RuntimeError("Client GCS indisponible (identifiants introuvables)")
+                _stockage = BackendGCS(client)
+            else:
+                raise ValueError(f"Backend de stockage inconnu : {parametres['backend']} (gcs ou local)")
+        return _stockage
@@ -18,13 +18,14 @@ import queue
 # Configuration
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from functions.step1_download import download_data
+from functions.step1_download import download_data, StatutSource
 from functions.step2_load import charger_batch_vers_bigquery
-from functions.step3_transform import transform_data
+from functions.step3_transform import transform_data, obtenir_timestamps_disponibles
 from functions.orchestrator import run_pipeline
+from functions.batch_catalog import obtenir_catalogue
+from functions.gcp_clients import get_gcp_client
 
 import yaml
-from google.cloud import bigquery, storage
 
 # Chargement config
 config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'config.yaml')
@@ -265,95 +266,26 @@ st.markdown("""
 # FONCTIONS UTILITAIRES
 # ============================================================================
 
-def get_gcp_client(client_type='storage'):
-    """Initialise un client GCP - détecte automatiquement l'environnement"""
-    
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    parent_dir = os.path.dirname(current_dir)
-    creds_path = os.path.join(parent_dir, 'config', 'gcp-credentials.json')
-    
-    if os.path.exists(creds_path):
-        try:
-            os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = creds_path
-            
-            if client_type == 'storage':
-                return storage.Client(project=ENV['project_id'])
-            else:
-                return bigquery.Client(project=ENV['project_id'])
-        except:
-            return None
-    else:
-        try:
-            from google.oauth2 import service_account
-            creds = service_account.Credentials.from_service_account_info(st.secrets["gcp"])
-            
-            if client_type == 'storage':
-                return storage.Client(credentials=creds, project=ENV['project_id'])
-            else:
-                return bigquery.Client(credentials=creds, project=ENV['project_id'])
-        except:
-            return None
-
-
 def lister_batchs_disponibles() -> List[Dict]:
     try:
-        client = get_gcp_client('storage')
-        bucket = client.bucket(ENV['bucket'])
-        batchs = []
-        timestamps_vus = set()
-        
-        blobs = bucket.list_blobs(prefix=CONFIG['storage']['raw_folder'])
-        
-        for blob in blobs:
-            parts = blob.name.split('__')
-            if len(parts) >= 2:
-                timestamp_part = parts[1].split('.')[0]
-                if timestamp_part not in timestamps_vus:
-                    timestamps_vus.add(timestamp_part)
-                    try:
-                        date_part, time_part = timestamp_part.split('_')
-                        batchs.append({
-                            'timestamp': timestamp_part,
-                            'date': date_part,
-                            'time': time_part.replace('-', ':')
-                        })
-                    except:
-                        continue
-        
-        batchs.sort(key=lambda x: x['timestamp'], reverse=True)
-        return batchs
-    except:
-        return []
-
-
-def obtenir_timestamps_disponibles() -> List[datetime]:
-    try:
-        client = get_gcp_client('bigquery')
-        query = f"""
-        SELECT DISTINCT extraction_timestamp
-        FROM `{ENV['project_id']}.{ENV['dataset']}.ratios_inpi_raw`
-        WHERE extraction_timestamp IS NOT NULL
-        ORDER BY extraction_timestamp DESC
-        """
-        results = client.query(query).result()
-        return [row.extraction_timestamp for row in results]
+        # Catalogue des batchs : index des manifests mis en cache entre deux reruns
+        return [
+            {
+                'timestamp': ts,
+                'date': ts.split('_')[0],
+                'time': ts.split('_')[1].replace('-', ':')
+            }
+            for ts in obtenir_catalogue().timestamps()
+        ]
     except:
         return []
 
 
 def compter_batchs_gcs() -> Dict[str, int]:
     try:
-        client = get_gcp_client('storage')
-        bucket = client.bucket(ENV['bucket'])
-        ratios_count = stock_count = 0
-        
-        blobs = bucket.list_blobs(prefix=CONFIG['storage']['raw_folder'])
-        for blob in blobs:
-            if 'ratios_inpi' in blob.name:
-                ratios_count += 1
-            elif 'stock_entreprises' in blob.name:
-                stock_count += 1
-        
+        batchs = obtenir_catalogue().lister()
+        ratios_count = sum(1 for fichiers in batchs.values() if any(f['source'] == 'ratios_inpi' for f in fichiers))
+        stock_count = sum(1 for fichiers in batchs.values() if any(f['source'] == 'stock_entreprises' for f in fichiers))
         return {
             'ratios_inpi': ratios_count,
             'stock_entreprises': stock_count,
@@ -745,8 +677,9 @@ def page_extraction():
             else:
                 st.warning(f"⚠ Extraction partielle : {succes}/{total} sources réussies")
             
+            libelles = {StatutSource.SUCCES: '✓ Succès', StatutSource.INCHANGE: '= Inchangée'}
             df = pd.DataFrame([
-                {'Source': s, 'Statut': '✓ Succès' if r else '✗ Échec'}
+                {'Source': s, 'Statut': libelles.get(r, '✗ Échec')}
                 for s, r in resultats.items()
             ])
             st.dataframe(df, use_container_width=True, hide_index=True)
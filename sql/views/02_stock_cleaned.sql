@@ -30,7 +30,7 @@ second_element AS (
       t.*,
       COALESCE(
         cj.categorieJuridique,
-        CAST(t.categorieJuridiqueUniteLegale AS STRING)
+        t.categorieJuridiqueUniteLegale
       ) AS categorieJuridique
     FROM first_element AS t
     LEFT JOIN UNNEST([
@@ -45,7 +45,7 @@ second_element AS (
         STRUCT("8","Organisme privé spécialisé"),
         STRUCT("9","Groupement de droit privé")
     ]) AS cj
-    ON SUBSTR(CAST(t.categorieJuridiqueUniteLegale AS STRING), 1, 1) = cj.code_niveau_I
+    ON SUBSTR(t.categorieJuridiqueUniteLegale, 1, 1) = cj.code_niveau_I
 ),
 
 third_element AS (
@@ -0,0 +1,124 @@
+"""
+Upload composite (functions/composite_upload.py) contre le backend local,
+qui reproduit compose, les empreintes CRC32C et la suppression d'objets de GCS
+"""
+
+import os
+
+import pytest
+
+from functions.composite_upload import MAX_SOURCES_COMPOSE, UploadComposite
+from functions.storage_backend import BlobLocal, BucketLocal
+
+TAILLE_COMPOSANT = 1024
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return BucketLocal(tmp_path / "bucket")
+
+
+def objets(bucket):
+    """Noms des objets visibles du bucket"""
+    return [blob.name for blob in bucket.list_blobs()]
+
+
+def ecrire(upload, donnees, taille_ecriture=700):
+    for debut in range(0, len(donnees), taille_ecriture):
+        upload.write(donnees[debut:debut + taille_ecriture])
+
+
+def test_compose_et_controle_crc32c(bucket):
+    donnees = os.urandom(10 * TAILLE_COMPOSANT + 123)
+    blob = bucket.blob("raw_data/2026-01/source__2026-01-01_00-00-00.parquet")
+    upload = UploadComposite(blob, TAILLE_COMPOSANT, connexions=3, timeout=10)
+
+    ecrire(upload, donnees)
+    upload.close()
+
+    assert blob.download_as_bytes() == donnees
+    assert upload.taille == len(donnees)
+    empreintes = upload.verifier_integrite()
+    assert empreintes['crc32c'] == blob.crc32c
+    assert upload.objet['md5Hash'] is None
+
+
+def test_composants_supprimes_apres_compose(bucket):
+    blob = bucket.blob("raw_data/2026-01/source.parquet")
+    upload = UploadComposite(blob, TAILLE_COMPOSANT, connexions=2, timeout=10)
+
+    ecrire(upload, os.urandom(5 * TAILLE_COMPOSANT))
+    upload.close()
+
+    assert objets(bucket) == [blob.name]
+    assert not (bucket.racine / f"{blob.name}.composants").exists()
+
+
+def test_compose_par_niveaux_au_dela_de_32_sources(bucket):
+    donnees = os.urandom((2 * MAX_SOURCES_COMPOSE + 5) * TAILLE_COMPOSANT)
+    blob = bucket.blob("source.bin")
+    upload = UploadComposite(blob, TAILLE_COMPOSANT, connexions=4, timeout=10)
+
+    ecrire(upload, donnees, taille_ecriture=4096)
+    upload.close()
+
+    assert blob.download_as_bytes() == donnees
+    upload.verifier_integrite()
+    assert objets(bucket) == ["source.bin"]
+
+
+def test_crc32c_different_detecte(bucket, monkeypatch):
+    compose = BlobLocal.compose
+
+    def compose_desordonne(self, sources, timeout=None):
+        compose(self, list(reversed(sources)), timeout=timeout)
+
+    monkeypatch.setattr(BlobLocal, "compose", compose_desordonne)
+    blob = bucket.blob("source.bin")
+    upload = UploadComposite(blob, TAILLE_COMPOSANT, connexions=2, timeout=10)
+
+    ecrire(upload, os.urandom(3 * TAILLE_COMPOSANT))
+    upload.close()
+
+    with pytest.raises(IOError, match="crc32c"):
+        upload.verifier_integrite()
+
+
+def test_reprise_apres_echec_d_un_composant(bucket, monkeypatch):
+    donnees = os.urandom(8 * TAILLE_COMPOSANT)
+    envoi = BlobLocal.upload_from_string
+    echecs = {"source.bin.composants/00003": 1}
+
+    def envoi_instable(self, contenu, **kwargs):
+        if echecs.get(self.name):
+            echecs[self.name] -= 1
+            raise ConnectionError("connexion perdue")
+        envoi(self, contenu, **kwargs)
+
+    monkeypatch.setattr(BlobLocal, "upload_from_string", envoi_instable)
+    blob = bucket.blob("source.bin")
+    upload = UploadComposite(blob, TAILLE_COMPOSANT, connexions=1, timeout=10)
+
+    with pytest.raises(IOError):
+        ecrire(upload, donnees)
+        upload.close()
+
+    depart = upload.reprendre()
+    assert depart == 3 * TAILLE_COMPOSANT
+    ecrire(upload, donnees[depart:])
+    upload.close()
+
+    assert blob.download_as_bytes() == donnees
+    upload.verifier_integrite()
+    assert objets(bucket) == ["source.bin"]
+
+
+def test_annuler_supprime_les_composants(bucket):
+    blob = bucket.blob("raw_data/2026-01/source.parquet")
+    upload = UploadComposite(blob, TAILLE_COMPOSANT, connexions=2, timeout=10)
+
+    ecrire(upload, os.urandom(4 * TAILLE_COMPOSANT))
+    upload.annuler()
+
+    assert objets(bucket) == []
+    assert not (bucket.racine / "raw_data").exists()